@@ -2,8 +2,8 @@ import logging
 import os # Import os for generating default secret key
 import secrets # Import secrets for secure random generation
 from pydantic_settings import BaseSettings, SettingsConfigDict
-from typing import Optional
-from pydantic import Field
+from typing import Optional, List, Dict
+from pydantic import BaseModel, Field
 
 # --- Generate a default secret key if not provided --- M
 # This helps if someone runs the app without setting it in .env, but prints a warning.
@@ -14,6 +14,18 @@ def get_default_secret_key():
     return key
 # --- End Default Key ---
 
+# --- LLM Endpoint Pool Config --- M
+class AnthropicEndpointConfig(BaseModel):
+    """One API key (and optionally its own base URL and quotas) in the LLM endpoint pool."""
+    name: str
+    api_key: Optional[str] = None # Defaults to anthropic_api_key
+    base_url: Optional[str] = None # Defaults to anthropic_base_url
+    requests_per_minute: Optional[int] = None # Quotas default to the llm_*_per_minute settings
+    input_tokens_per_minute: Optional[int] = None
+    output_tokens_per_minute: Optional[int] = None
+    max_concurrency: Optional[int] = None # Defaults to llm_max_concurrency
+# --- End LLM Endpoint Pool Config ---
+
 class Settings(BaseSettings):
     # Load environment variables from a .env file
     model_config = SettingsConfigDict(env_file=".env", extra="ignore")
@@ -24,6 +36,187 @@ class Settings(BaseSettings):
     # External API keys
     anthropic_api_key: str
 
+    # --- Anthropic HTTP Client Settings --- M
+    # The async client shares one pooled httpx connection pool across all requests.
+    anthropic_base_url: Optional[str] = None # Override the API endpoint (e.g., a local stub)
+    anthropic_timeout_seconds: float = 120.0
+    anthropic_connect_timeout_seconds: float = 10.0
+    anthropic_max_connections: int = 100
+    anthropic_max_keepalive_connections: int = 20
+    anthropic_keepalive_expiry_seconds: float = 30.0
+    anthropic_prompt_caching_enabled: bool = True # Mark per-prompt system prompts as cacheable
+    # --- End Anthropic HTTP Client Settings ---
+
+    # --- LLM Endpoint Pool Settings --- M
+    # Each endpoint has its own rate limits; requests go to the endpoint with the most headroom.
+    # JSON list, e.g. ANTHROPIC_ENDPOINTS='[{"name": "team-a", "api_key": "..."}, {"name": "team-b", "api_key": "..."}]'
+    # Empty: a single endpoint named "default" built from anthropic_api_key / anthropic_base_url.
+    anthropic_endpoints: List[AnthropicEndpointConfig] = []
+    llm_endpoint_failure_threshold: int = 3 # Consecutive upstream failures before an endpoint is drained
+    llm_endpoint_drain_seconds: float = 60.0 # Time a drained endpoint receives no traffic before a probe
+    # --- End LLM Endpoint Pool Settings ---
+
+    # --- LLM Provider Settings --- M
+    llm_provider: str = "anthropic" # "anthropic", or "simulated" for offline load testing
+    # Simulated provider (no network): lognormal latency plus injected failures, deterministic per seed
+    simulated_llm_seed: int = 0
+    simulated_llm_latency_median_seconds: float = 1.5
+    simulated_llm_latency_sigma: float = 0.5 # Lognormal shape; larger means a heavier tail
+    simulated_llm_first_token_fraction: float = 0.3 # Share of the latency before the first streamed token
+    simulated_llm_error_rate: float = 0.0 # Share of calls failing with 500, 529 or a timeout
+    simulated_llm_rate_limit_rate: float = 0.0 # Share of calls answered with a random 429
+    simulated_llm_requests_per_minute: int = 0 # Simulated quota; calls beyond it get 429 (0 disables)
+    simulated_llm_retry_after_seconds: float = 1.0 # retry-after sent with random 429s
+    simulated_llm_batch_seconds: float = 5.0 # Time until a simulated message batch ends
+    # --- End LLM Provider Settings ---
+
+    # --- LLM Rate Controller Settings --- M
+    # Deployment-wide quotas shared by evaluation and judge traffic (0 disables a quota). Every process
+    # that calls the LLM (each worker, plus the API process if it runs embedded workers) enforces an equal
+    # share: the quota divided by llm_quota_processes. Endpoint quotas in ANTHROPIC_ENDPOINTS are split the same way.
+    llm_requests_per_minute: int = 50
+    llm_input_tokens_per_minute: int = 40000
+    llm_output_tokens_per_minute: int = 8000
+    llm_quota_processes: int = 1 # Processes sharing the quotas; set to the worker replica count
+    # AIMD concurrency control
+    llm_initial_concurrency: int = 8
+    llm_min_concurrency: int = 1
+    llm_max_concurrency: int = 64
+    llm_latency_target_seconds: float = 30.0 # Smoothed latency above this shrinks the limit
+    llm_aimd_increase_step: float = 1.0 # Added to the limit per window of successful calls
+    llm_aimd_decrease_factor: float = 0.5 # Multiplier applied on throttling (429/529)
+    llm_aimd_latency_decrease_factor: float = 0.9 # Multiplier applied when latency exceeds the target
+    llm_aimd_cooldown_seconds: float = 5.0 # Minimum time between two decreases
+    # --- End LLM Rate Controller Settings ---
+
+    # --- LLM Retry & Circuit Breaker Settings --- M
+    llm_retry_max_retries_rate_limit: int = 5 # Retries for 429 responses
+    llm_retry_max_retries_server: int = 3 # Retries for 5xx/529 responses
+    llm_retry_max_retries_timeout: int = 2 # Retries for timeouts and connection errors
+    llm_retry_base_delay_seconds: float = 1.0
+    llm_retry_max_delay_seconds: float = 30.0
+    llm_circuit_failure_threshold: int = 5 # Consecutive upstream failures that open a model's circuit
+    llm_circuit_reset_seconds: float = 30.0 # Time an open circuit waits before sending a probe
+    # --- End LLM Retry & Circuit Breaker Settings ---
+
+    # --- LLM Response Cache Settings --- M
+    llm_cache_enabled: bool = True
+    llm_cache_ttl_seconds: int = 14 * 24 * 3600 # Entries not read for this long expire (sliding TTL)
+    llm_cache_max_entries: int = 200000 # Least recently used entries beyond this are evicted
+    llm_cache_max_entry_bytes: int = 64 * 1024 # Larger responses are not cached
+    llm_cache_trim_interval_writes: int = 500 # Check the size cap every N writes
+    llm_single_flight_enabled: bool = True # Merge concurrent identical requests into one upstream call
+    # --- End LLM Response Cache Settings ---
+
+    # --- Evaluation Concurrency Settings --- M
+    # Items of one prompt are processed by a window of concurrent workers.
+    evaluation_default_item_concurrency: int = 8 # Window used when the request does not specify one
+    evaluation_max_item_concurrency: int = 32 # Per-prompt cap on the requested window
+    evaluation_global_item_concurrency: int = 64 # Process-wide cap across all running evaluations
+    evaluation_streaming_enabled: bool = True # Stream translations and stop generation at </translated_text>
+    # Pipelined judging (judge_pipelined=true): rows are judged as they are generated, with limits of their own
+    evaluation_judge_concurrency: int = 4 # Judge calls in flight per work unit
+    evaluation_global_judge_concurrency: int = 32 # Process-wide cap on pipelined judge calls
+    # --- End Evaluation Concurrency Settings ---
+
+    # --- Message Batch Settings --- M
+    # Used by evaluations created with execution_mode="batch".
+    anthropic_batch_max_requests: int = 10000 # Requests per submitted batch (API limit: 100,000)
+    anthropic_batch_poll_interval_seconds: float = 30.0 # Time between batch status checks
+    anthropic_batch_max_wait_seconds: float = 24 * 60 * 60 # Give up (and record errors) after this long
+    # --- End Message Batch Settings ---
+
+    # --- Output Budget Settings --- M
+    # Translation max_tokens is sized from the source length and a per-language expansion ratio.
+    llm_adaptive_max_tokens_enabled: bool = True # False restores the fixed 1024-token budget
+    llm_output_default_expansion_ratio: float = 2.0 # Output/source token ratio for languages without history
+    llm_output_budget_margin: float = 1.5 # Headroom over the learned p95 ratio
+    llm_output_overhead_tokens: int = 32 # <translated_text> tags and whitespace
+    llm_output_min_tokens: int = 64
+    llm_output_max_tokens: int = 4096 # Ceiling for budgets and truncation retries
+    llm_output_ratio_samples: int = 2000 # Recent results kept per language
+    llm_judge_max_tokens: int = 512 # Judge replies are short JSON; truncations are retried up to the ceiling
+    # --- End Output Budget Settings ---
+
+    # --- Request Hedging Settings --- M
+    # A call still running past the model's rolling latency percentile gets a duplicate; the first answer wins.
+    llm_hedging_enabled: bool = False # Default for evaluation and judge calls
+    llm_hedge_percentile: float = 0.95 # Hedge delay = this percentile of recent latencies for the model
+    llm_hedge_min_delay_seconds: float = 1.0 # Never hedge earlier than this
+    llm_hedge_budget_fraction: float = 0.05 # Max share of calls that may send a hedge
+    llm_hedge_min_samples: int = 20 # Latencies needed before a model is hedged
+    llm_hedge_latency_samples: int = 500 # Recent latencies kept per model
+    # --- End Request Hedging Settings ---
+
+    # --- Job Queue Settings --- M
+    # Evaluations and judging run as leased jobs in MongoDB, executed by `python worker.py` processes.
+    job_queue_items_per_job: int = 50 # Test items per (evaluation, prompt) work unit
+    job_lease_seconds: float = 120.0 # Visibility timeout: a job whose lease is not renewed is requeued
+    job_heartbeat_interval_seconds: float = 30.0 # How often a running job renews its lease
+    job_max_attempts: int = 3 # Failed or lost runs before a job is marked failed
+    job_retry_delay_seconds: float = 30.0 # Delay before a failed job is retried
+    job_retention_seconds: int = 7 * 24 * 60 * 60 # Finished jobs are removed after this (TTL index)
+    job_worker_concurrency: int = 4 # Jobs one worker process runs at once
+    job_worker_poll_interval_seconds: float = 1.0 # Idle wait between claim attempts
+    job_embedded_workers: int = 0 # Job runners started inside the API process (for single-process development)
+    job_cancel_poll_interval_seconds: float = 1.0 # How often a worker checks its running jobs for cancel/pause requests
+    # --- End Job Queue Settings ---
+
+    # --- Process Stats Settings --- M
+    # Rate controllers, breakers and LLM counters are per process; each process publishes them to
+    # process_stats so /api/v1/admin shows every worker, not only the API process answering.
+    process_stats_interval_seconds: float = 10.0 # 0 disables publishing
+    # --- End Process Stats Settings ---
+
+    # --- Scheduler Settings --- M
+    # Claim order of the job queue: priority class, then weighted fair share per user/language workspace.
+    scheduler_interactive_max_rows: int = 200 # Evaluations up to this many prompt x item rows are interactive
+    scheduler_row_overhead_tokens: int = 400 # Per-row token estimate on top of source and output (system prompt, context)
+    scheduler_workspace_weights: Dict[str, float] = {} # Fair-share weight per "user_id:language" workspace or per language (default 1)
+    scheduler_metrics_window_seconds: int = 3600 # Queue-wait and latency percentiles cover this window
+    # --- End Scheduler Settings ---
+
+    # --- Admission Control Settings --- M
+    # New evaluations and judge runs get a 429 while the backlog ahead of them would take too long to drain.
+    admission_max_drain_seconds: Dict[str, float] = {"interactive": 600.0, "bulk": 6 * 3600.0} # Per priority class (0 = always admit)
+    admission_throughput_window_seconds: int = 600 # Throughput is measured from the jobs finished in this window
+    admission_min_finished_jobs: int = 5 # Below this many, the endpoint token quotas are used as throughput
+    admission_cache_seconds: float = 5.0 # Backlog/throughput measurements are reused for this long
+    # --- End Admission Control Settings ---
+
+    # --- Cost Estimate Settings --- M
+    # Used by the evaluation dry-run planner (POST /evaluations/plan). Defaults are the list prices of the default model.
+    llm_input_price_per_mtok: float = 0.25 # USD per million input tokens
+    llm_output_price_per_mtok: float = 1.25 # USD per million output tokens
+    llm_cache_write_price_factor: float = 1.25 # Prompt-cache writes cost this multiple of the input price
+    llm_cache_read_price_factor: float = 0.1 # Prompt-cache reads cost this multiple of the input price
+    llm_prompt_cache_min_tokens: int = 2048 # Shorter system prompts are not cached by the API
+    llm_batch_price_factor: float = 0.5 # Message batches are billed at this share of the list price
+    # --- End Cost Estimate Settings ---
+
+    # --- Evaluation Sweeper Settings --- M
+    # Settles evaluations left in pending/running that no remaining work unit will complete.
+    evaluation_sweep_interval_seconds: float = 60.0 # How often the API and each worker sweep (0 disables)
+    evaluation_sweep_grace_seconds: float = 300.0 # Only evaluations started at least this long ago are checked
+    # --- End Evaluation Sweeper Settings ---
+
+    # --- Write-Behind Buffer Settings --- M
+    # Result rows and judge updates are batched into bulk_write calls.
+    write_buffer_max_ops: int = 200 # Flush once this many writes are pending
+    write_buffer_max_delay_seconds: float = 0.5 # ...or once the oldest pending write is this old
+    write_buffer_max_attempts: int = 5 # A write rejected this many times (transient write errors) is dropped
+    # --- End Write-Behind Buffer Settings ---
+
+    # --- Progress Event Settings --- M
+    # Workers append progress events to a capped collection; each API process tails it and pushes them to SSE clients.
+    progress_events_capped_bytes: int = 64 * 1024 * 1024 # Size of the capped evaluation_events collection
+    progress_summary_interval_seconds: float = 1.0 # Minimum time between two progress summaries on a stream
+    progress_heartbeat_seconds: float = 15.0 # Keep-alive comment on idle streams
+    progress_throughput_window_seconds: float = 60.0 # Rows/s and ETA are measured over this window
+    progress_subscriber_queue_size: int = 1000 # Events buffered per stream before it resyncs from MongoDB
+    progress_tail_retry_seconds: float = 1.0 # Wait before reopening the tailable cursor
+    # --- End Progress Event Settings ---
+
     # Logging configuration
     log_level: str = "INFO"
 
@@ -33,6 +226,9 @@ class Settings(BaseSettings):
     access_token_expire_minutes: int = 30
     # --- End JWT Settings ---
 
+    # Usernames allowed to call the /api/v1/admin endpoints (JSON list in the environment)
+    admin_usernames: List[str] = []
+
     @property
     def logging_level(self) -> int:
         """Converts log level string to logging level integer."""
@@ -1,4 +1,5 @@
 import logging
+from typing import List, Sequence
 
 try:
     import tiktoken
@@ -29,4 +30,20 @@ def estimate_token_count(text: str) -> int:
             return len(text) // 4 # Rough estimate
     else:
         # Fallback to character count approximation
-        return len(text) // 4 # Rough estimate 
\ No newline at end of file
+        return len(text) // 4 # Rough estimate 
+
+def estimate_token_counts(texts: Sequence[str]) -> List[int]:
+    """Token counts of many texts in one call; tiktoken encodes the batch on its thread pool.
+
+    Gives the same counts as estimate_token_count for each text.
+    """
+    if not texts:
+        return []
+    if TIKTOKEN_AVAILABLE and tokenizer:
+        try:
+            return [len(tokens) for tokens in tokenizer.encode_batch(list(texts))]
+        except Exception as e:
+            # One text the tokenizer rejects (e.g. a special token) fails the whole batch
+            logging.warning(f"Tiktoken batch encoding failed: {e}. Counting texts one by one.")
+            return [estimate_token_count(text) for text in texts]
+    return [len(text) // 4 if text else 0 for text in texts]
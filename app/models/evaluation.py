@@ -1,7 +1,8 @@
 from pydantic import BaseModel, Field, ConfigDict
-from typing import Optional, List
+from typing import Optional, List, Literal, Dict
 from datetime import datetime
 from bson import ObjectId
+import uuid
 
 from .common import PyObjectId
 
@@ -13,6 +14,7 @@ class EvaluationResultBase(BaseModel):
     """Base attributes for a single row in an evaluation result."""
     evaluation_id: PyObjectId = Field(..., description="The ID of the parent Evaluation session.")
     prompt_id: PyObjectId = Field(..., description="The ID of the specific Prompt version used for this result.")
+    row_index: Optional[int] = Field(None, description="Zero-based position of the source item in the test set.")
     source_text: str = Field(..., description="The original source text provided.")
     model_output: Optional[str] = Field(None, description="The output generated by the AI model.")
     reference_text: Optional[str] = Field(None, description="The reference translation (if provided).")
@@ -24,10 +26,30 @@ class EvaluationResultBase(BaseModel):
     llm_judge_rationale: Optional[str] = Field(None, description="Rationale provided by the LLM judge.")
     llm_judge_model_id: Optional[str] = Field(None, description="Model ID used for LLM judging.")
     # --- Sent Prompt Fields ---
-    sent_system_prompt: Optional[str] = Field(None, description="The exact system prompt sent to the LLM.")
-    sent_user_prompt: Optional[str] = Field(None, description="The exact user prompt sent to the LLM.")
+    # Stored once in prompt_texts and referenced by hash; results include the texts only when requested
+    sent_system_prompt: Optional[str] = Field(None, description="The exact system prompt sent to the LLM (returned with include_sent_prompts=true).")
+    sent_user_prompt: Optional[str] = Field(None, description="The exact user prompt sent to the LLM (returned with include_sent_prompts=true).")
+    sent_system_prompt_hash: Optional[str] = Field(None, description="SHA-256 key of the sent system prompt in the prompt text store.")
+    sent_user_prompt_hash: Optional[str] = Field(None, description="SHA-256 key of the sent user prompt in the prompt text store.")
     prompt_token_count: Optional[int] = Field(None, description="Approximate token count of the sent prompt.")
     # --- End Sent Prompt Fields ---
+    retry_count: Optional[int] = Field(None, description="Number of LLM call retries needed for this row.")
+    cache_hit: Optional[bool] = Field(None, description="True if the model output was served from the LLM response cache.")
+    cache_creation_input_tokens: Optional[int] = Field(None, description="Prompt-cache write tokens reported for this row's LLM call.")
+    cache_read_input_tokens: Optional[int] = Field(None, description="Prompt-cache read tokens reported for this row's LLM call.")
+    time_to_first_token_ms: Optional[float] = Field(None, description="Milliseconds until the first output token was streamed for this row.")
+    time_to_close_tag_ms: Optional[float] = Field(None, description="Milliseconds until </translated_text> ended generation for this row.")
+    # --- Output Budget Fields ---
+    target_language: Optional[str] = Field(None, description="Language the prompt translates into.")
+    source_token_count: Optional[int] = Field(None, description="Approximate token count of the source text.")
+    output_token_count: Optional[int] = Field(None, description="Output tokens reported for this row's LLM call.")
+    max_tokens: Optional[int] = Field(None, description="Output budget (max_tokens) of the call that produced model_output.")
+    stop_reason: Optional[str] = Field(None, description="Why generation stopped (e.g., stop_sequence, max_tokens).")
+    truncation_retries: Optional[int] = Field(None, description="Times the call was repeated with a larger budget after hitting max_tokens.")
+    # --- End Output Budget Fields ---
+    hedged: Optional[bool] = Field(None, description="True if a duplicate request was sent because this row's LLM call was slow.")
+    hedge_won: Optional[bool] = Field(None, description="True if the duplicate request answered first.")
+    hedge_saved_ms: Optional[float] = Field(None, description="Estimated milliseconds saved by hedging this row's LLM call.")
     # --- End LLM Judge Fields ---
 
 class EvaluationResultCreate(EvaluationResultBase):
@@ -94,8 +116,14 @@ class EvaluationRequestData(BaseModel):
 class EvaluationCreateRequest(BaseModel):
     """Request body for initiating a new evaluation session."""
     prompt_ids: List[PyObjectId] = Field(..., min_length=1, description="List of Prompt version IDs to evaluate.")
-    test_set_data: List[EvaluationRequestData] = Field(..., min_length=1, description="List of source texts and optional references.")
+    test_set_data: Optional[List[EvaluationRequestData]] = Field(None, min_length=1, description="List of source texts and optional references. Omit when test_set_id is given.")
+    test_set_id: Optional[uuid.UUID] = Field(None, description="ID of an uploaded test set to evaluate instead of sending test_set_data; its entries are read in file order.")
     test_set_name: Optional[str] = Field(None, max_length=100, description="Optional name for this test run/set.")
+    item_concurrency: Optional[int] = Field(None, ge=1, description="Number of test items processed concurrently per prompt (capped by server settings).")
+    use_cache: bool = Field(True, description="Reuse cached LLM responses for identical requests. Set to False to resample.")
+    execution_mode: Literal["interactive", "batch"] = Field("interactive", description="'interactive' calls the model per item; 'batch' submits all items as Anthropic message batches (cheaper, higher throughput, results can take hours).")
+    priority_class: Optional[Literal["interactive", "bulk"]] = Field(None, description="Scheduling class. Defaults to 'interactive' for small runs and 'bulk' otherwise; only small runs can be interactive.")
+    judge_pipelined: bool = Field(False, description="Judge each row with the LLM judge as soon as it is generated, concurrently with generation (interactive execution mode only).")
 
 class EvaluationBase(BaseModel):
     """Base attributes for an Evaluation session."""
@@ -103,10 +131,20 @@ class EvaluationBase(BaseModel):
     test_set_name: Optional[str] = Field(None, description="Name of the test set used, if provided.")
     status: str = Field(default="pending", description="Status of the evaluation (e.g., pending, running, completed, failed).")
     user_id: Optional[PyObjectId] = Field(None, description="ID of the user who initiated the evaluation.")
+    item_concurrency: Optional[int] = Field(None, description="Effective per-prompt item concurrency used for this evaluation.")
+    use_cache: Optional[bool] = Field(None, description="Whether cached LLM responses were allowed for this evaluation.")
+    execution_mode: Optional[str] = Field(None, description="How outputs were generated: 'interactive' or 'batch'.")
+    message_batch_ids: Optional[List[str]] = Field(None, description="Anthropic message batch IDs submitted for a batch-mode evaluation.")
+    message_batch_endpoints: Optional[Dict[str, str]] = Field(None, description="LLM endpoint (API key) each message batch was submitted through, by batch ID.")
+    test_set_id: Optional[uuid.UUID] = Field(None, description="Uploaded test set the items are read from (instead of embedded test_set_data).")
+    item_count: Optional[int] = Field(None, description="Number of test items evaluated per prompt.")
+    priority_class: Optional[str] = Field(None, description="Scheduling class of the evaluation's jobs: 'interactive' or 'bulk'.")
+    status_detail: Optional[str] = Field(None, description="Why the evaluation ended in its status when that is not obvious (e.g., its queued work was lost).")
 
     # --- LLM Judge Status Fields ---
     judge_status: Optional[str] = Field(None, description="Status of the LLM judging process (e.g., not_started, pending, completed, failed).")
     judged_at: Optional[datetime] = Field(None, description="Timestamp when LLM judging completed.")
+    judge_pipelined: Optional[bool] = Field(None, description="True if rows are judged as they are generated instead of by a separate judging run.")
     # --- End LLM Judge Status Fields ---
 
 class EvaluationInDB(EvaluationBase):
@@ -116,10 +154,11 @@ class EvaluationInDB(EvaluationBase):
         validation_alias="_id"
     )
     created_at: datetime = Field(default_factory=datetime.utcnow)
+    started_at: Optional[datetime] = Field(None, description="When the evaluation last moved to running (creation or resume).")
     completed_at: Optional[datetime] = None
-    test_set_data: List[EvaluationRequestData]
-    total_prompt_tasks: Optional[int] = Field(None, description="Total number of prompt evaluation tasks expected.")
-    completed_prompt_tasks: Optional[int] = Field(default=0, description="Number of prompt evaluation tasks completed.")
+    test_set_data: List[EvaluationRequestData] = Field(default_factory=list, description="Embedded test items (empty when test_set_id is set).")
+    total_prompt_tasks: Optional[int] = Field(None, description="Total number of work units (prompt x item chunk) expected.")
+    completed_prompt_tasks: Optional[int] = Field(default=0, description="Number of work units finished.")
     model_config = ConfigDict(
         arbitrary_types_allowed=True,
         json_encoders={ObjectId: str, PyObjectId: str},
@@ -142,4 +181,44 @@ class Evaluation(EvaluationInDB):
         fields={'test_set_data': {'exclude': True}}
     )
 
+class EvaluationHedgingStats(BaseModel):
+    """Request hedging summary for an evaluation's generated rows."""
+    evaluation_id: PyObjectId = Field(..., description="The evaluation the statistics cover.")
+    llm_calls: int = Field(0, description="Rows generated by an upstream LLM call (cache hits and errors excluded).")
+    hedged_calls: int = Field(0, description="Rows whose call was hedged with a duplicate request.")
+    hedge_wins: int = Field(0, description="Hedged rows where the duplicate answered first.")
+    hedge_rate: float = Field(0.0, description="hedged_calls / llm_calls.")
+    estimated_time_saved_ms: float = Field(0.0, description="Sum of the estimated time saved by winning hedges.")
+
+class EvaluationPlanPrompt(BaseModel):
+    """Token and cost projection for one prompt of a planned evaluation."""
+    prompt_id: PyObjectId = Field(..., description="The prompt version the projection covers.")
+    system_prompt_tokens: int = Field(0, description="Tokens of the assembled system prompt (sent with every item).")
+    system_prompt_cached: bool = Field(False, description="True if the system prompt is long enough to be served from the prompt cache after the first call.")
+    input_tokens: int = Field(0, description="System plus user prompt tokens over all items.")
+    projected_output_tokens: int = Field(0, description="Expected output tokens at the language's learned expansion ratio.")
+    max_output_tokens: int = Field(0, description="Sum of the max_tokens budgets (worst case output).")
+    estimated_cost_usd: float = Field(0.0, description="Projected cost of this prompt's calls.")
+
+class EvaluationPlan(BaseModel):
+    """Dry-run projection of an evaluation request: tokens, cost and wall-clock time. Nothing is enqueued."""
+    prompt_count: int = Field(..., description="Prompts in the request.")
+    item_count: int = Field(..., description="Test items per prompt.")
+    execution_mode: str = Field(..., description="'interactive' or 'batch', as requested.")
+    priority_class: str = Field(..., description="Scheduling class the evaluation would get.")
+    target_language: Optional[str] = Field(None, description="Language of the prompts.")
+    input_tokens: int = Field(0, description="Prompt tokens over all prompt x item calls.")
+    projected_output_tokens: int = Field(0, description="Expected output tokens over all calls.")
+    max_output_tokens: int = Field(0, description="Sum of the max_tokens budgets over all calls.")
+    estimated_cost_usd: float = Field(0.0, description="Projected cost at the configured prices (response-cache hits not deducted).")
+    prompts: List[EvaluationPlanPrompt] = Field(default_factory=list, description="Projection per prompt.")
+    throughput_tokens_per_second: Optional[float] = Field(None, description="Current job throughput used for the time estimate (None if unknown).")
+    queue_wait_seconds: Optional[float] = Field(None, description="Time for the work already queued ahead of this evaluation to drain.")
+    run_seconds: Optional[float] = Field(None, description="Time to process this evaluation's tokens at the current throughput.")
+    predicted_start_at: Optional[datetime] = Field(None, description="When the evaluation's first work unit is expected to start.")
+    predicted_completion_at: Optional[datetime] = Field(None, description="When the evaluation is expected to complete.")
+    would_be_admitted: bool = Field(True, description="False if submitting now would be rejected with 429.")
+    notes: List[str] = Field(default_factory=list, description="Caveats about the estimate.")
+    planning_ms: float = Field(0.0, description="Time the server spent building and counting the prompts.")
+
 # --- REMOVED: Status Response Model --- M 
\ No newline at end of file
@@ -0,0 +1,25 @@
+from pydantic import BaseModel, Field
+from typing import Optional
+
+# --- LLM Service Models --- M
+
+class LLMResponse(BaseModel):
+    """Generated text plus per-call metadata returned by the LLM service layer."""
+    text: str = Field("", description="The first text block of the model response.")
+    model_id: str = Field(..., description="The model that produced the response.")
+    stop_reason: Optional[str] = Field(None, description="Why generation stopped (e.g., end_turn, max_tokens).")
+    input_tokens: Optional[int] = Field(None, description="Input tokens reported by the API.")
+    output_tokens: Optional[int] = Field(None, description="Output tokens reported by the API.")
+    cache_creation_input_tokens: Optional[int] = Field(None, description="Input tokens written to the prompt cache.")
+    cache_read_input_tokens: Optional[int] = Field(None, description="Input tokens read from the prompt cache.")
+    max_tokens: Optional[int] = Field(None, description="Output budget of the request that produced this response.")
+    truncation_retries: int = Field(0, description="Times the request was repeated with a larger budget after stopping at max_tokens.")
+    retry_count: int = Field(0, description="Number of retries needed before this response was obtained.")
+    latency_ms: Optional[float] = Field(None, description="Wall-clock time of the successful attempt.")
+    time_to_first_token_ms: Optional[float] = Field(None, description="Time until the first streamed text arrived (streaming calls only).")
+    time_to_stop_sequence_ms: Optional[float] = Field(None, description="Time until generation ended on a stop sequence, if it did.")
+    cached: bool = Field(False, description="True if served from the persistent response cache.")
+    coalesced: bool = Field(False, description="True if shared from an identical request that was already in flight.")
+    hedged: bool = Field(False, description="True if a duplicate (hedge) request was sent because the call was slow.")
+    hedge_won: Optional[bool] = Field(None, description="True if the hedge answered first, False if the original did (hedged calls only).")
+    hedge_saved_ms: Optional[float] = Field(None, description="Estimated wall-clock time the hedge saved (hedged calls only).")
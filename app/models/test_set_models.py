@@ -32,6 +32,7 @@ class UserTestSetInDB(UserTestSetCreate):
 class TestSetEntryBase(BaseModel):
     test_set_id: uuid.UUID
     row_number_in_file: Optional[int] = None # Optional, for reference
+    item_index: Optional[int] = None # Dense 0-based position among the stored entries (evaluation row index)
     source_text: str
     reference_text: Optional[str] = None
     text_id_value: Optional[str] = None
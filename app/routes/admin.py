@@ -0,0 +1,184 @@
+import logging
+from fastapi import APIRouter, Depends
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from typing import Dict, Any
+
+from app.routes.auth import get_current_admin_user
+from app.models.user import User as UserModel
+from app.services.job_queue import job_queue
+from app.services.process_stats import process_stats
+from app.services.scheduler import scheduler
+from app.services.admission import admission_controller
+from app.services.progress_events import progress_hub
+from app.db.client import get_database
+
+router = APIRouter()
+
+logger = logging.getLogger(__name__)
+
+@router.get(
+    "/llm/limits",
+    summary="Get live LLM rate limits",
+    description="Returns the current concurrency limit, per-minute quota usage and throttling state of each LLM endpoint's controller; one entry per live API and worker process.",
+)
+async def get_llm_limits(
+    db: AsyncIOMotorDatabase = Depends(get_database),
+    current_user: UserModel = Depends(get_current_admin_user)
+) -> Dict[str, Any]:
+    """Snapshot of the adaptive rate controllers, keyed by endpoint name."""
+    return await process_stats.per_process(db, "limits")
+
+@router.get(
+    "/llm/circuits",
+    summary="Get LLM circuit breaker states",
+    description="Returns the per-model circuit breaker state (closed, open, half_open) and failure counters; one entry per live API and worker process.",
+)
+async def get_llm_circuits(
+    db: AsyncIOMotorDatabase = Depends(get_database),
+    current_user: UserModel = Depends(get_current_admin_user)
+) -> Dict[str, Any]:
+    """Snapshot of the per-model circuit breakers."""
+    return await process_stats.per_process(db, "circuits")
+
+@router.get(
+    "/llm/cache",
+    summary="Get LLM response cache statistics",
+    description="Returns hit/miss counters and the API calls, seconds and output tokens saved by the response cache since startup; one entry per live API and worker process.",
+)
+async def get_llm_cache_stats(
+    db: AsyncIOMotorDatabase = Depends(get_database),
+    current_user: UserModel = Depends(get_current_admin_user)
+) -> Dict[str, Any]:
+    """Counters of the persistent LLM response cache."""
+    return await process_stats.per_process(db, "cache")
+
+@router.get(
+    "/llm/coalescing",
+    summary="Get in-flight request coalescing statistics",
+    description="Returns how many LLM calls were merged into an identical request that was already in flight; one entry per live API and worker process.",
+)
+async def get_llm_coalescing_stats(
+    db: AsyncIOMotorDatabase = Depends(get_database),
+    current_user: UserModel = Depends(get_current_admin_user)
+) -> Dict[str, Any]:
+    """Counters of the single-flight layer in claude_service."""
+    return await process_stats.per_process(db, "coalescing")
+
+@router.get(
+    "/llm/provider",
+    summary="Get the active LLM provider",
+    description="Returns the provider selected by LLM_PROVIDER and its counters (the simulated provider reports injected failures); one entry per live API and worker process.",
+)
+async def get_llm_provider_stats(
+    db: AsyncIOMotorDatabase = Depends(get_database),
+    current_user: UserModel = Depends(get_current_admin_user)
+) -> Dict[str, Any]:
+    """Snapshot of the active LLM provider on each endpoint."""
+    return await process_stats.per_process(db, "provider")
+
+@router.get(
+    "/llm/endpoints",
+    summary="Get LLM endpoint pool health and throughput",
+    description="Returns each API key / endpoint's health (drained or not), lifetime successes and failures, and requests and output tokens in the last minute; one entry per live API and worker process.",
+)
+async def get_llm_endpoints(
+    db: AsyncIOMotorDatabase = Depends(get_database),
+    current_user: UserModel = Depends(get_current_admin_user)
+) -> Dict[str, Any]:
+    """Snapshot of the LLM endpoint pool, keyed by endpoint name."""
+    return await process_stats.per_process(db, "endpoints")
+
+@router.get(
+    "/llm/output-budget",
+    summary="Get adaptive max_tokens statistics",
+    description="Returns the learned per-language output/source token ratios and the truncation counters; one entry per live API and worker process.",
+)
+async def get_llm_output_budget(
+    db: AsyncIOMotorDatabase = Depends(get_database),
+    current_user: UserModel = Depends(get_current_admin_user)
+) -> Dict[str, Any]:
+    """Snapshot of the output budget estimator."""
+    return await process_stats.per_process(db, "output_budget")
+
+@router.get(
+    "/llm/hedging",
+    summary="Get request hedging statistics",
+    description="Returns each model's current hedge delay (rolling latency percentile), hedge rate, hedge wins and estimated time saved; one entry per live API and worker process.",
+)
+async def get_llm_hedging_stats(
+    db: AsyncIOMotorDatabase = Depends(get_database),
+    current_user: UserModel = Depends(get_current_admin_user)
+) -> Dict[str, Any]:
+    """Snapshot of the request hedger."""
+    return await process_stats.per_process(db, "hedging")
+
+@router.get(
+    "/jobs",
+    summary="Get job queue statistics",
+    description="Returns evaluation and judging job counts by kind and status, expired leases waiting to be reclaimed, and the workers currently holding leases.",
+)
+async def get_job_queue_stats(
+    db: AsyncIOMotorDatabase = Depends(get_database),
+    current_user: UserModel = Depends(get_current_admin_user)
+) -> Dict[str, Any]:
+    """Snapshot of the durable job queue."""
+    return await job_queue.snapshot(db)
+
+@router.get(
+    "/scheduler",
+    summary="Get fair-share scheduler statistics",
+    description="Returns queued jobs per priority class and workspace, the scheduler's virtual time, and per-class queue-wait, job run-time and evaluation latency percentiles over the metrics window.",
+)
+async def get_scheduler_stats(
+    db: AsyncIOMotorDatabase = Depends(get_database),
+    current_user: UserModel = Depends(get_current_admin_user)
+) -> Dict[str, Any]:
+    """Snapshot of the job scheduler."""
+    return await scheduler.snapshot(db)
+
+@router.get(
+    "/admission",
+    summary="Get admission control state",
+    description="Returns the measured throughput and, per priority class, the backlog ahead of new work, its predicted drain time against the limit, and admitted/rejected submission counts.",
+)
+async def get_admission_stats(
+    db: AsyncIOMotorDatabase = Depends(get_database),
+    current_user: UserModel = Depends(get_current_admin_user)
+) -> Dict[str, Any]:
+    """Snapshot of the admission controller."""
+    return await admission_controller.snapshot(db)
+
+@router.get(
+    "/writes",
+    summary="Get write-behind buffer statistics",
+    description="Returns pending writes, flush counts, batch sizes and bulk write latency for each write-behind buffer; one entry per live API and worker process.",
+)
+async def get_write_buffer_stats(
+    db: AsyncIOMotorDatabase = Depends(get_database),
+    current_user: UserModel = Depends(get_current_admin_user)
+) -> Dict[str, Any]:
+    """Snapshot of the write-behind buffers, keyed by collection."""
+    return await process_stats.per_process(db, "writes")
+
+@router.get(
+    "/prompt-texts",
+    summary="Get prompt text store statistics",
+    description="Returns how many sent prompts were stored by hash and how many of them were already known (deduplicated); one entry per live API and worker process.",
+)
+async def get_prompt_text_stats(
+    db: AsyncIOMotorDatabase = Depends(get_database),
+    current_user: UserModel = Depends(get_current_admin_user)
+) -> Dict[str, Any]:
+    """Snapshot of the content-addressed prompt text store."""
+    return await process_stats.per_process(db, "prompt_texts")
+
+@router.get(
+    "/progress",
+    summary="Get progress stream statistics",
+    description="Returns the open evaluation event streams in this API process and how many progress events its tailing cursor has read and delivered.",
+)
+async def get_progress_stream_stats(
+    current_user: UserModel = Depends(get_current_admin_user)
+) -> Dict[str, Any]:
+    """Snapshot of the progress event hub."""
+    return progress_hub.snapshot()
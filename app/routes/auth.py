@@ -78,6 +78,19 @@ async def get_current_active_user(
     return current_user
 # --- End Active User --- M
 
+# --- Get Current Admin User --- M
+async def get_current_admin_user(
+    current_user: Annotated[UserInDB, Depends(get_current_active_user)]
+) -> UserInDB:
+    """Dependency to restrict an endpoint to users listed in settings.admin_usernames."""
+    if current_user.username not in settings.admin_usernames:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin privileges required",
+        )
+    return current_user
+# --- End Admin User --- M
+
 # --- NEW: Get Current User Endpoint --- M
 @router.get("/users/me", response_model=User)
 async def read_users_me(
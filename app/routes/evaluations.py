@@ -1,27 +1,52 @@
+import json
 import logging
 from app.core.prompt_templates import FIXED_OUTPUT_REQUIREMENT_TEMPLATE, TASK_INFO_TEMPLATE
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.responses import StreamingResponse
 from motor.motor_asyncio import AsyncIOMotorDatabase, AsyncIOMotorCollection
-from typing import List, Dict, Any
+from typing import Awaitable, List, Dict, Any, Optional, Set, Tuple
 from bson import ObjectId
-from datetime import datetime
+from datetime import datetime, timedelta
 import anthropic # For specific APIError handling
 import asyncio # For checking background task completion
-from pymongo import ReturnDocument
+import math
+import time
+from pymongo import ASCENDING, ReturnDocument, UpdateOne
 
+from app.core.config import settings
 from app.db.client import get_database
 from app.models.common import PyObjectId # Correct import path
 from app.models.prompt import Prompt # Only need Prompt model
 from app.models.evaluation import (
     Evaluation, EvaluationCreateRequest, EvaluationRequestData,
     EvaluationResult, EvaluationResultCreate, EvaluationResultUpdate,
-    EvaluationInDB # Need this for the full data including test_set_data
+    EvaluationInDB, # Need this for the full data including test_set_data
+    EvaluationHedgingStats, EvaluationPlan, EvaluationPlanPrompt
+)
+from app.models.llm import LLMResponse
+from app.services.claude_service import (
+    BATCH_ENDED_STATUS, build_message_params, generate_with_claude,
+    cancel_message_batch, get_message_batch_status, iter_message_batch_results, message_batches_supported,
+    submit_message_batch
+)
+from app.services.llm_cache import make_cache_key, response_cache
+from app.services.output_budget import output_budget
+from app.services.job_queue import EVALUATION_BATCH_JOB, EVALUATION_ITEMS_JOB, LLM_JUDGING_JOB, job_queue
+from app.services.job_worker import JobHandler
+from app.services.write_buffer import judge_writes, result_writes
+from app.services.prompt_store import prompt_texts
+from app.services.test_set_service import (
+    TEST_SET_ENTRIES_COLLECTION, USER_TEST_SETS_COLLECTION, EvaluationItems, count_test_set_entries, ensure_item_indexes
+)
+from app.services.scheduler import scheduler, workspace_key
+from app.services.admission import admission_controller
+from app.services.progress_events import (
+    JUDGE_EVENT, JUDGED_ROW_EVENT, ROW_EVENT, STATUS_EVENT, EvaluationProgress, progress_hub, publish
 )
-from app.services.claude_service import generate_text_with_claude
 from app.routes.auth import get_current_active_user
 from app.models.user import User as UserModel
 from app.services import judge_service
-from app.core.token_utils import estimate_token_count
+from app.core.token_utils import TIKTOKEN_AVAILABLE, estimate_token_count, estimate_token_counts
 
 router = APIRouter()
 EVAL_COLLECTION = "evaluations"
@@ -32,18 +57,312 @@ logger = logging.getLogger(__name__)
 
 # --- Background Task (Modified) --- M
 
+# Process-wide cap on test items in flight across every running evaluation.
+_global_item_semaphore = asyncio.Semaphore(settings.evaluation_global_item_concurrency)
+
+
+def resolve_item_concurrency(requested: Optional[int]) -> int:
+    """Returns the per-prompt item window for an evaluation, clamped to the server cap."""
+    window = requested or settings.evaluation_default_item_concurrency
+    return max(1, min(window, settings.evaluation_max_item_concurrency))
+
+
+# --- Prompt Assembly Helpers --- M
+# Shared by the interactive and batch execution paths so both send identical prompts.
+TRANSLATED_TEXT_START_TAG = "<translated_text>"
+TRANSLATED_TEXT_END_TAG = "</translated_text>"
+# Generation is stopped at the closing tag; anything the model would write after it is discarded anyway
+TRANSLATION_STOP_SEQUENCES = [TRANSLATED_TEXT_END_TAG]
+
+def build_system_prompt(prompt_model: Prompt) -> str:
+    """Assembles the system prompt: the prompt's sections followed by the fixed output requirements."""
+    prompt_sections = prompt_model.sections if prompt_model.sections else []
+    rules_text = "\n\n".join([f"### {sec.name}\n{sec.content}" for sec in prompt_sections])
+    return f"{rules_text}\n\n{FIXED_OUTPUT_REQUIREMENT_TEMPLATE}"
+
+
+def build_user_prompt(test_set_data: List[Dict[str, Any]], index: int, target_language: Optional[str]) -> str:
+    """Assembles the TASK_INFO user prompt for one test item, including neighbouring context."""
+    item = EvaluationRequestData(**test_set_data[index]) # Parse dict to model
+
+    # --- Get Contextual Data --- M
+    previous_context = test_set_data[index - 1].get("source_text", "N/A") if index > 0 else "N/A"
+    following_context = test_set_data[index + 1].get("source_text", "N/A") if index < len(test_set_data) - 1 else "N/A"
+    additional_instructions = item.additional_instructions if item.additional_instructions else "N/A"
+    # --- End Contextual Data ---
+
+    user_prompt = TASK_INFO_TEMPLATE
+    user_prompt = user_prompt.replace("{SOURCE_TEXT}", item.source_text)
+    user_prompt = user_prompt.replace("{PREVIOUS_CONTEXT}", previous_context)
+    user_prompt = user_prompt.replace("{FOLLOWING_CONTEXT}", following_context)
+    user_prompt = user_prompt.replace("{TARGET_LANGUAGE}", target_language or "Unknown")
+    user_prompt = user_prompt.replace("{TERMINOLOGY}", "[]") # TODO
+    user_prompt = user_prompt.replace("{SIMILAR_TRANSLATIONS}", "[]") # TODO
+    user_prompt = user_prompt.replace("{ADDITIONAL_INSTRUCTIONS}", additional_instructions)
+    return user_prompt
+
+
+def extract_translated_text(model_output_raw: str) -> Optional[str]:
+    """Returns the text inside <translated_text> tags, or None if the tags are missing."""
+    start_tag = TRANSLATED_TEXT_START_TAG
+    end_tag = TRANSLATED_TEXT_END_TAG
+    start_index = model_output_raw.find(start_tag)
+    end_index = model_output_raw.find(end_tag)
+    if start_index != -1 and end_index != -1:
+        return model_output_raw[start_index + len(start_tag):end_index].strip()
+    return None
+
+
+def _base_result(
+    evaluation_id: PyObjectId,
+    prompt_id: PyObjectId,
+    test_set_data: List[Dict[str, Any]],
+    index: int,
+    system_prompt: Optional[str] = None,
+    user_prompt: Optional[str] = None,
+    total_token_count: Optional[int] = None,
+    target_language: Optional[str] = None,
+) -> EvaluationResultCreate:
+    """Result row for one item before the model output is known."""
+    item_dict = test_set_data[index]
+    source_text = str(item_dict.get("source_text", ""))
+    source_token_count = estimate_token_count(source_text)
+    return EvaluationResultCreate(
+        evaluation_id=evaluation_id,
+        prompt_id=prompt_id, # Store which prompt generated this
+        row_index=index,
+        source_text=source_text,
+        reference_text=item_dict.get("reference_text"),
+        # --- Store Sent Prompts and Tokens --- M
+        sent_system_prompt=system_prompt,
+        sent_user_prompt=user_prompt,
+        prompt_token_count=total_token_count,
+        # --- End Store ---
+        target_language=target_language,
+        source_token_count=source_token_count,
+        max_tokens=output_budget.budget_for(target_language, source_token_count)
+    )
+
+
+def _apply_llm_response(result: EvaluationResultCreate, llm_response: LLMResponse) -> EvaluationResultCreate:
+    """Fills the model output and LLM call metadata into a result row."""
+    model_output = extract_translated_text(llm_response.text)
+    if model_output is None:
+        logger.warning(f"Could not find <translated_text>...</translated_text> in output for eval {result.evaluation_id}, prompt {result.prompt_id}, source '{result.source_text[:20]}...'. Using raw output.")
+        model_output = llm_response.text # Fallback to raw output
+    result.model_output = model_output
+    result.retry_count = llm_response.retry_count
+    result.cache_hit = llm_response.cached
+    result.cache_creation_input_tokens = llm_response.cache_creation_input_tokens
+    result.cache_read_input_tokens = llm_response.cache_read_input_tokens
+    result.time_to_first_token_ms = llm_response.time_to_first_token_ms
+    result.time_to_close_tag_ms = llm_response.time_to_stop_sequence_ms
+    result.output_token_count = llm_response.output_tokens
+    result.max_tokens = llm_response.max_tokens or result.max_tokens
+    result.stop_reason = llm_response.stop_reason
+    result.truncation_retries = llm_response.truncation_retries
+    if llm_response.hedged:
+        result.hedged = True
+        result.hedge_won = llm_response.hedge_won
+        result.hedge_saved_ms = llm_response.hedge_saved_ms
+    if not llm_response.cached and llm_response.stop_reason != "max_tokens":
+        # Complete generations teach the budget estimator this language's expansion ratio
+        output_budget.observe(result.target_language, result.source_token_count, llm_response.output_tokens)
+    return result
+# --- End Prompt Assembly Helpers ---
+
+
+# --- Idempotent Result Writes --- M
+# A result row is identified by (evaluation_id, prompt_id, row_index); regenerating a row replaces it.
+RESULT_KEY_FIELDS = ("evaluation_id", "prompt_id", "row_index")
+ERROR_OUTPUT_PREFIX = "ERROR:"
+# Sent prompts live in the prompt text store; rows keep their hashes (see prompt_store)
+SENT_PROMPT_FIELDS = {"sent_system_prompt": "sent_system_prompt_hash", "sent_user_prompt": "sent_user_prompt_hash"}
+
+
+def is_error_output(model_output: Optional[str]) -> bool:
+    return bool(model_output) and model_output.startswith(ERROR_OUTPUT_PREFIX)
+
+
+def _result_upsert_spec(result: EvaluationResultCreate) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """(filter, update) upserting one generated row. Score and comment are kept; judge fields are reset for the new output."""
+    doc = result.model_dump(exclude={"score", "comment", *SENT_PROMPT_FIELDS})
+    unset = {"llm_judge_error": ""}
+    unset.update({field: "" for field in SENT_PROMPT_FIELDS}) # Inline copies written by older versions
+    return {field: doc[field] for field in RESULT_KEY_FIELDS}, {"$set": doc, "$unset": unset}
+
+
+def _result_upsert(result: EvaluationResultCreate) -> UpdateOne:
+    return UpdateOne(*_result_upsert_spec(result), upsert=True)
+
+
+async def _save_result(result: EvaluationResultCreate):
+    """Queues the row's upsert on the write-behind buffer (flushed in bulk; see result_writes).
+
+    The sent prompts are stored in the prompt text store and the row keeps their hashes.
+    """
+    for text_field, hash_field in SENT_PROMPT_FIELDS.items():
+        setattr(result, hash_field, await prompt_texts.put(getattr(result, text_field)))
+    await result_writes.add(_result_upsert(result))
+    await publish(result.evaluation_id, ROW_EVENT, {
+        "prompt_id": result.prompt_id,
+        "row_index": result.row_index,
+        "error": result.model_output is None or is_error_output(result.model_output),
+    })
+
+
+async def rehydrate_sent_prompts(db: AsyncIOMotorDatabase, results: List[Dict[str, Any]]):
+    """Fills sent_system_prompt / sent_user_prompt of result documents from their hashes (one query)."""
+    texts = await prompt_texts.get_many(db, (res.get(h) for res in results for h in SENT_PROMPT_FIELDS.values()))
+    for res in results:
+        for text_field, hash_field in SENT_PROMPT_FIELDS.items():
+            if res.get(text_field) is None and res.get(hash_field) in texts:
+                res[text_field] = texts[res[hash_field]]
+
+
+async def _existing_row_states(
+    results_collection: AsyncIOMotorCollection,
+    evaluation_id: PyObjectId,
+    prompt_id: PyObjectId,
+    rows: range
+) -> Tuple[Set[int], Set[int]]:
+    """Row indices within `rows` that already have a result: (succeeded, errored)."""
+    done_rows: Set[int] = set()
+    failed_rows: Set[int] = set()
+    cursor = results_collection.find(
+        {"evaluation_id": evaluation_id, "prompt_id": prompt_id, "row_index": {"$gte": rows.start, "$lt": rows.stop}},
+        {"row_index": 1, "model_output": 1}
+    )
+    async for doc in cursor:
+        (failed_rows if is_error_output(doc.get("model_output")) or doc.get("model_output") is None else done_rows).add(doc["row_index"])
+    return done_rows, failed_rows
+
+
+async def ensure_result_indexes(db: AsyncIOMotorDatabase):
+    """Unique index behind the idempotent result upserts (called on startup)."""
+    try:
+        await db[RESULTS_COLLECTION].create_index(
+            [(field, ASCENDING) for field in RESULT_KEY_FIELDS],
+            unique=True,
+            partialFilterExpression={"row_index": {"$exists": True}}, # Rows written before row_index existed
+            name="evaluation_prompt_row",
+        )
+    except Exception as e:
+        logger.warning(f"Could not create unique evaluation result index (duplicate rows from older runs?): {e}")
+# --- End Idempotent Result Writes ---
+
+
+async def _evaluate_single_item(
+    evaluation_id: PyObjectId,
+    prompt_id: PyObjectId,
+    prompt_model: Prompt,
+    system_prompt: str,
+    system_token_count: int,
+    test_set_data: List[Dict[str, Any]],
+    index: int,
+    use_cache: bool = True,
+) -> EvaluationResultCreate:
+    """Generates the output for one test item and returns the result row (errors are recorded in model_output)."""
+    result = _base_result(evaluation_id, prompt_id, test_set_data, index, system_prompt, target_language=prompt_model.language)
+    try:
+        user_prompt = build_user_prompt(test_set_data, index, prompt_model.language)
+        result.sent_user_prompt = user_prompt
+
+        # --- Calculate User/Total Tokens --- M
+        user_token_count = estimate_token_count(user_prompt)
+        result.prompt_token_count = system_token_count + user_token_count
+        # --- End Token Calculation ---
+
+        # --- ADDED: Log full assembled prompts for debugging --- M
+        logger.debug(f"--- System Prompt for Eval {evaluation_id}, Prompt {prompt_id} ({system_token_count} tokens) ---\n{system_prompt}\n--------------------")
+        logger.debug(f"--- User Prompt for Eval {evaluation_id}, Prompt {prompt_id}, Source '{result.source_text[:30]}...' ({user_token_count} tokens) ---\n{user_prompt}\n--------------------")
+        # --- End Log --- M
+
+        # Call Claude service with separate system and user prompts
+        llm_response = await generate_with_claude(
+            prompt_text=system_prompt,
+            source_text=user_prompt,
+            max_tokens=result.max_tokens, # Sized from the source length and target language
+            use_cache=use_cache,
+            cache_system_prompt=True, # Same system prompt for every item of this prompt
+            stop_sequences=TRANSLATION_STOP_SEQUENCES,
+            stream=settings.evaluation_streaming_enabled,
+            max_tokens_ceiling=settings.llm_output_max_tokens
+        )
+        _apply_llm_response(result, llm_response)
+        logger.debug(f"Eval {evaluation_id}, Prompt {prompt_id}: Generated output for source: '{result.source_text[:30]}...'")
+    except Exception as e: # Catch any exception from service or prompt assembly
+        logger.error(f"Eval {evaluation_id}, Prompt {prompt_id}: Claude API or processing error for source '{result.source_text[:30]}...': {e}", exc_info=True)
+        result.model_output = f"ERROR: {e}"
+        result.retry_count = getattr(e, "retry_count", None)
+    return result
+
+
 async def run_single_prompt_evaluation_task(
     evaluation_id: PyObjectId,
     prompt_id: PyObjectId, # Specific prompt to run
     db: AsyncIOMotorDatabase,
-    test_set_data: List[Dict[str, Any]]
+    test_set_data: List[Dict[str, Any]],
+    item_concurrency: Optional[int] = None,
+    use_cache: bool = True,
+    rows: Optional[range] = None,
+    only_failed: bool = False,
+    judge_pipelined: bool = False
 ):
-    """Background task to evaluate ONE prompt against the test set."""
-    logger.info(f"Starting sub-task for Eval ID: {evaluation_id}, Prompt ID: {prompt_id}")
-    eval_collection = db[EVAL_COLLECTION]
+    """Evaluates ONE prompt against the test set (or the `rows` slice of it).
+
+    Items are processed by a bounded window of concurrent workers (per-prompt
+    window plus the process-wide cap). Each result carries its row_index so
+    clients get rows back in test set order regardless of completion order.
+    Progress counters are updated by the job queue when the work unit finishes.
+
+    Results are upserted by (evaluation_id, prompt_id, row_index) and rows that
+    already have a successful output are skipped, so running the same work unit
+    again (lost lease, resume) only generates missing or errored rows. With
+    `only_failed`, only rows that already exist with an error are regenerated.
+
+    With `judge_pipelined`, each saved row is also put on a queue for the judge
+    stage (see _run_judge_stage), together with rows generated by an earlier
+    run that have no verdict yet. That includes the error rows written when the
+    prompt is missing or cannot be assembled.
+    """
+    rows = rows if rows is not None else range(len(test_set_data))
     results_collection = db[RESULTS_COLLECTION]
     prompt_collection = db[PROMPT_COLLECTION]
 
+    # --- Skip Finished Rows --- M
+    done_rows, failed_rows = await _existing_row_states(results_collection, evaluation_id, prompt_id, rows)
+    if only_failed:
+        todo = [index for index in rows if index in failed_rows]
+    else:
+        todo = [index for index in rows if index not in done_rows]
+    rows_to_judge: Optional[asyncio.Queue] = None
+    if judge_pipelined:
+        rows_to_judge = asyncio.Queue()
+        regenerating = set(todo)
+        for row in await _unjudged_rows(results_collection, evaluation_id, prompt_id, rows):
+            if row["row_index"] not in regenerating: # Judged again once the new output is generated
+                rows_to_judge.put_nowait(row)
+    if not todo and not (rows_to_judge and rows_to_judge.qsize()):
+        logger.info(f"Eval {evaluation_id}, Prompt {prompt_id}: rows {rows.start}-{rows.stop - 1} already done.")
+        return
+    # --- End Skip Finished Rows ---
+
+    async def save(result_data: EvaluationResultCreate):
+        await _save_result(result_data)
+        if rows_to_judge is not None:
+            rows_to_judge.put_nowait(result_data.model_dump(include=JUDGE_INPUT_FIELDS))
+
+    async def finish(generation: Awaitable) -> str:
+        """Awaits `generation`, with the judge stage alongside it when pipelined. Returns the judge summary for the log."""
+        if rows_to_judge is None:
+            await generation
+            return ""
+        judged, judge_errors = await _run_judge_stage(rows_to_judge, generation)
+        return f", judged {judged} rows ({judge_errors} judge errors)"
+
+    logger.info(f"Starting sub-task for Eval ID: {evaluation_id}, Prompt ID: {prompt_id}, rows {rows.start}-{rows.stop - 1} ({len(todo)} to generate)")
+
     # 1. Use the passed test_set_data
     # Validate the structure? Assume it's correct for now.
     # We can use Pydantic's parse_obj_as if needed: test_set_items = parse_obj_as(List[EvaluationRequestData], test_set_data)
@@ -53,40 +372,40 @@ async def run_single_prompt_evaluation_task(
     if not prompt_record:
         logger.error(f"Sub-task failed: Prompt {prompt_id} not found for eval {evaluation_id}.")
         # Store error results?
-        for item_dict in test_set_data:
-            try: # Add try-except for parsing item_dict
-                item = EvaluationRequestData(**item_dict) # Parse dict to model
-                error_result = EvaluationResultCreate(
-                    evaluation_id=evaluation_id,
-                    prompt_id=prompt_id,
-                    source_text=item.source_text,
-                    model_output=f"ERROR: Prompt {prompt_id} not found.",
-                    reference_text=item.reference_text
-                )
-                await results_collection.insert_one(error_result.model_dump(exclude={"score", "comment"}))
-            except Exception as item_parse_err:
-                logger.error(f"Failed to parse item_dict when handling prompt not found: {item_parse_err} - Dict: {item_dict}")
+        async def save_missing_prompt_rows():
+            for index in todo:
+                try: # Add try-except for parsing item_dict
+                    item = EvaluationRequestData(**test_set_data[index]) # Parse dict to model
+                    error_result = EvaluationResultCreate(
+                        evaluation_id=evaluation_id,
+                        prompt_id=prompt_id,
+                        row_index=index,
+                        source_text=item.source_text,
+                        model_output=f"ERROR: Prompt {prompt_id} not found.",
+                        reference_text=item.reference_text
+                    )
+                    await save(error_result)
+                except Exception as item_parse_err:
+                    logger.error(f"Failed to parse item_dict when handling prompt not found: {item_parse_err} - Dict: {test_set_data[index]}")
+        judge_msg = await finish(save_missing_prompt_rows()) # Rows queued for judging are still judged
+        logger.info(f"Finished sub-task for Eval ID: {evaluation_id}, Prompt ID: {prompt_id} with status: prompt not found{judge_msg}")
         return # Stop this specific task
 
     # --- Assemble System Prompt --- M
     try:
         prompt_model = Prompt.model_validate(prompt_record)
-        prompt_sections = prompt_model.sections if prompt_model.sections else []
-        rules_text = "\n\n".join([f"### {sec.name}\n{sec.content}" for sec in prompt_sections])
-        system_prompt = f"{rules_text}\n\n{FIXED_OUTPUT_REQUIREMENT_TEMPLATE}"
+        system_prompt = build_system_prompt(prompt_model)
     except Exception as prompt_parse_err:
         logger.error(f"Failed to parse prompt record or assemble system prompt for {prompt_id}: {prompt_parse_err}", exc_info=True)
-        # Mark all results for this prompt as failed
-        await results_collection.update_many(
-            {"evaluation_id": evaluation_id, "prompt_id": prompt_id},
-            {"$set": {"model_output": f"ERROR: Failed to process prompt {prompt_id}."}}
-        )
-        # Increment completed tasks counter here as we are done processing this prompt (even though it failed)
-        await eval_collection.update_one(
-            {"_id": evaluation_id},
-            {"$inc": {"completed_prompt_tasks": 1}}
-        )
-        return # Stop this task
+        # Mark this unit's rows as failed
+        async def save_prompt_error_rows():
+            for index in todo:
+                error_result = _base_result(evaluation_id, prompt_id, test_set_data, index)
+                error_result.model_output = f"ERROR: Failed to process prompt {prompt_id}."
+                await save(error_result)
+        judge_msg = await finish(save_prompt_error_rows())
+        logger.info(f"Finished sub-task for Eval ID: {evaluation_id}, Prompt ID: {prompt_id} with status: invalid prompt{judge_msg}")
+        return # Stop this task (the work unit still counts as finished)
     # --- End System Prompt Assembly ---
 
     # --- Calculate System Prompt Tokens --- M
@@ -94,103 +413,247 @@ async def run_single_prompt_evaluation_task(
     system_token_count = estimate_token_count(system_prompt)
     # --- End System Prompt Assembly ---
 
-    # 3. Iterate test set and call Claude API
-    task_has_errors = False
-    for index, item_dict in enumerate(test_set_data):
-        result_id = None # Initialize result_id for potential error logging
-        model_output = None
-        try:
-            item = EvaluationRequestData(**item_dict) # Parse dict to model
-            result_id = item_dict.get("_id") # Assuming results were pre-created and have IDs
-
-            # --- Get Contextual Data --- M
-            previous_context = test_set_data[index - 1].get("source_text", "N/A") if index > 0 else "N/A"
-            following_context = test_set_data[index + 1].get("source_text", "N/A") if index < len(test_set_data) - 1 else "N/A"
-            additional_instructions = item.additional_instructions if item.additional_instructions else "N/A"
-            # --- End Contextual Data ---
-
-            # --- Assemble User Prompt for this item --- M
-            user_prompt = TASK_INFO_TEMPLATE
-            user_prompt = user_prompt.replace("{SOURCE_TEXT}", item.source_text)
-            user_prompt = user_prompt.replace("{PREVIOUS_CONTEXT}", previous_context)
-            user_prompt = user_prompt.replace("{FOLLOWING_CONTEXT}", following_context)
-            user_prompt = user_prompt.replace("{TARGET_LANGUAGE}", prompt_model.language or "Unknown")
-            user_prompt = user_prompt.replace("{TERMINOLOGY}", "[]") # TODO
-            user_prompt = user_prompt.replace("{SIMILAR_TRANSLATIONS}", "[]") # TODO
-            user_prompt = user_prompt.replace("{ADDITIONAL_INSTRUCTIONS}", additional_instructions)
-            # --- End User Prompt Assembly ---
-
-            # --- Calculate User/Total Tokens --- M
-            user_token_count = estimate_token_count(user_prompt)
-            total_token_count = system_token_count + user_token_count
-            # --- End Token Calculation ---
-
-            # --- ADDED: Log full assembled prompts for debugging --- M
-            logger.debug(f"--- System Prompt for Eval {evaluation_id}, Prompt {prompt_id} ({system_token_count} tokens) ---\n{system_prompt}\n--------------------")
-            logger.debug(f"--- User Prompt for Eval {evaluation_id}, Prompt {prompt_id}, Source '{item.source_text[:30]}...' ({user_token_count} tokens) ---\n{user_prompt}\n--------------------")
-            # --- End Log --- M
-
-            # Call Claude service with separate system and user prompts
-            model_output_raw = await generate_text_with_claude(
-                prompt_text=system_prompt, 
-                source_text=user_prompt
-            )
+    # 3. Fan out test items over a bounded window of workers
+    window = resolve_item_concurrency(item_concurrency)
+    pending_indices = iter(todo) # Shared by all workers; next() never yields to the loop
+    error_count = 0
 
-            # --- Extract text from <translated_text> tags --- M
-            start_tag = "<translated_text>"
-            end_tag = "</translated_text>"
-            start_index = model_output_raw.find(start_tag)
-            end_index = model_output_raw.find(end_tag)
-            if start_index != -1 and end_index != -1:
-                model_output = model_output_raw[start_index + len(start_tag):end_index].strip()
-            else:
-                logger.warning(f"Could not find {start_tag}...{end_tag} in output for eval {evaluation_id}, prompt {prompt_id}, source '{item.source_text[:20]}...'. Using raw output.")
-                model_output = model_output_raw # Fallback to raw output
-            # --- End Extraction ---
-
-            logger.debug(f"Eval {evaluation_id}, Prompt {prompt_id}: Generated output for source: '{item.source_text[:30]}...'")
-        except Exception as e: # Catch any exception from service or prompt assembly
-            # FIX: Safely log error without assuming 'item' exists yet
-            source_preview = item_dict.get("source_text")[:30] if isinstance(item_dict, dict) else "<unknown source>"
-            logger.error(f"Eval {evaluation_id}, Prompt {prompt_id}: Claude API or processing error for source '{source_preview}...': {e}", exc_info=True)
-            task_has_errors = True
-            model_output = f"ERROR: {e}"
-
-        # 4. Store the result with prompt_id
-        # NOTE: This assumes results are created upfront and we UPDATE them.
-        # If results are created here, the logic needs adjustment.
-        # We need the result_id to update the correct document.
-        
-        # TEMPORARY: Assuming results are created here for now. Find existing or create new?
-        # Let's stick to the original logic: Create result here.
-        result_data = EvaluationResultCreate(
-            evaluation_id=evaluation_id,
-            prompt_id=prompt_id, # Store which prompt generated this
-            source_text=item.source_text,
-            model_output=model_output,
-            reference_text=item.reference_text,
-            # --- Store Sent Prompts and Tokens --- M
-            sent_system_prompt=system_prompt,
-            sent_user_prompt=user_prompt,
-            prompt_token_count=total_token_count
-            # --- End Store ---
-        )
-        # Perform insert instead of update
-        await results_collection.insert_one(result_data.model_dump(exclude={"score", "comment"}))
+    async def item_worker():
+        nonlocal error_count
+        for index in pending_indices:
+            async with _global_item_semaphore:
+                result_data = await _evaluate_single_item(
+                    evaluation_id, prompt_id, prompt_model, system_prompt,
+                    system_token_count, test_set_data, index, use_cache
+                )
+            if is_error_output(result_data.model_output):
+                error_count += 1
+            # 4. Store the result, keyed by prompt_id and row_index
+            await save(result_data)
+
+    logger.info(f"Eval {evaluation_id}, Prompt {prompt_id}: processing {len(todo)} items with concurrency {window}")
+    judge_msg = await finish(asyncio.gather(*(item_worker() for _ in range(min(window, len(todo))))))
 
     # --- Status Update (Handled by coordinating task/endpoint) ---
-    # This task only logs completion/errors. The main evaluation status is updated elsewhere.
-    status_msg = "errors" if task_has_errors else "success"
+    # This task only logs completion/errors. completed_prompt_tasks is incremented by the job queue.
+    status_msg = (f"errors ({error_count})" if error_count else "success") + judge_msg
     logger.info(f"Finished sub-task for Eval ID: {evaluation_id}, Prompt ID: {prompt_id} with status: {status_msg}")
-    # We need a way to signal completion back to the parent eval record or a monitoring task.
-    # Simplest for now: update a field in the parent eval record.
-    # This might lead to race conditions if not handled carefully.
-    await eval_collection.update_one(
-        {"_id": evaluation_id},
-        {"$inc": {"completed_prompt_tasks": 1}} # Increment a counter
-    )
+
+# --- Batch Execution Mode --- M
+
+
+async def _wait_for_message_batch(evaluation_id: PyObjectId, batch_id: str, endpoint_name: str) -> bool:
+    """Polls a message batch until it has ended. Returns False if it did not end within the max wait."""
+    deadline = time.monotonic() + settings.anthropic_batch_max_wait_seconds
+    while True:
+        processing_status, request_counts = await get_message_batch_status(batch_id, endpoint_name)
+        if processing_status == BATCH_ENDED_STATUS:
+            logger.info(f"Eval {evaluation_id}: message batch {batch_id} ended: {request_counts}")
+            return True
+        if time.monotonic() >= deadline:
+            logger.error(f"Eval {evaluation_id}: message batch {batch_id} still '{processing_status}' after {settings.anthropic_batch_max_wait_seconds}s; giving up.")
+            return False
+        logger.debug(f"Eval {evaluation_id}: message batch {batch_id} is '{processing_status}': {request_counts}")
+        await asyncio.sleep(settings.anthropic_batch_poll_interval_seconds)
+
+
+async def _retry_truncated_batch_item(
+    result: EvaluationResultCreate,
+    llm_response: LLMResponse,
+    use_cache: bool
+) -> LLMResponse:
+    """Re-requests a batch item cut off at max_tokens as an interactive call with a doubled budget."""
+    budget = llm_response.max_tokens or result.max_tokens or settings.llm_output_max_tokens
+    if budget >= settings.llm_output_max_tokens:
+        output_budget.record_truncation(retried=False)
+        return llm_response
+    output_budget.record_truncation(retried=True)
+    try:
+        retried = await generate_with_claude(
+            prompt_text=result.sent_system_prompt,
+            source_text=result.sent_user_prompt,
+            max_tokens=min(budget * 2, settings.llm_output_max_tokens),
+            use_cache=use_cache,
+            cache_system_prompt=True,
+            stop_sequences=TRANSLATION_STOP_SEQUENCES,
+            max_tokens_ceiling=settings.llm_output_max_tokens
+        )
+    except Exception as e:
+        logger.warning(f"Eval {result.evaluation_id}: retry of truncated batch item {result.prompt_id}-{result.row_index} failed, keeping truncated output: {e}")
+        return llm_response
+    return retried.model_copy(update={"truncation_retries": retried.truncation_retries + 1})
+
+
+async def _cancel_stopped_message_batches(db: AsyncIOMotorDatabase, evaluation_id: PyObjectId, batch_endpoints: Dict[str, str]):
+    """Cancels the upstream batches of an evaluation that was cancelled or paused.
+
+    Not on worker shutdown: the job is released and its next run collects what is still missing.
+    """
+    evaluation = await db[EVAL_COLLECTION].find_one({"_id": evaluation_id}, {"status": 1})
+    if not evaluation or evaluation.get("status") not in STOPPED_STATUSES:
+        return
+    for batch_id, endpoint_name in batch_endpoints.items():
+        try:
+            await cancel_message_batch(batch_id, endpoint_name)
+        except Exception as e:
+            logger.warning(f"Eval {evaluation_id}: could not cancel message batch {batch_id}: {e}")
+
+
+async def run_batch_evaluation_task(
+    evaluation_id: PyObjectId,
+    prompt_ids: List[PyObjectId],
+    db: AsyncIOMotorDatabase,
+    items: EvaluationItems,
+    use_cache: bool = True
+):
+    """Background task to evaluate ALL prompts of an evaluation through Anthropic message batches.
+
+    Every (prompt, item) request is built exactly as in interactive mode; items are
+    read one chunk of rows at a time. Requests with
+    a cached response are answered from the cache; the rest are submitted in batches of
+    up to `anthropic_batch_max_requests`, polled until they end, and their results are
+    written to evaluation_results through the write-behind buffer. Requests that error, expire or are missing
+    from the results get an "ERROR: ..." row, as in interactive mode.
+    """
+    logger.info(f"Starting batch task for Eval ID: {evaluation_id} ({len(prompt_ids)} prompts x {len(items)} items)")
+    eval_collection = db[EVAL_COLLECTION]
+    results_collection = db[RESULTS_COLLECTION]
+    prompt_collection = db[PROMPT_COLLECTION]
+    check_cache = use_cache and settings.llm_cache_enabled
+
+    pending: Dict[str, EvaluationResultCreate] = {} # custom_id -> result row awaiting its output
+    cache_keys: Dict[str, str] = {} # custom_id -> response cache key
+    model_ids: Dict[str, str] = {} # custom_id -> model
+    requests: List[Dict[str, Any]] = []
+    batch_endpoints: Dict[str, str] = {} # batch id -> endpoint it was submitted through, in submission order
+
+    try:
+        # 1. Build every request, answering what we can from the response cache
+        for prompt_id in prompt_ids:
+            prompt_record = await prompt_collection.find_one({"_id": prompt_id})
+            prompt_error = None
+            if not prompt_record:
+                logger.error(f"Batch task: Prompt {prompt_id} not found for eval {evaluation_id}.")
+                prompt_error = f"ERROR: Prompt {prompt_id} not found."
+            else:
+                try:
+                    prompt_model = Prompt.model_validate(prompt_record)
+                    system_prompt = build_system_prompt(prompt_model)
+                except Exception as prompt_parse_err:
+                    logger.error(f"Failed to parse prompt record or assemble system prompt for {prompt_id}: {prompt_parse_err}", exc_info=True)
+                    prompt_error = f"ERROR: Failed to process prompt {prompt_id}."
+            done_rows, _ = await _existing_row_states(results_collection, evaluation_id, prompt_id, range(len(items)))
+            if not prompt_error:
+                system_token_count = estimate_token_count(system_prompt)
+
+            async for rows, test_set_data in items.chunks(settings.job_queue_items_per_job):
+                for index in rows:
+                    if index in done_rows:
+                        continue # Already generated by an earlier run of this job
+                    if prompt_error:
+                        result = _base_result(evaluation_id, prompt_id, test_set_data, index)
+                        result.model_output = prompt_error
+                        await _save_result(result)
+                        continue
+                    user_prompt = build_user_prompt(test_set_data, index, prompt_model.language)
+                    result = _base_result(
+                        evaluation_id, prompt_id, test_set_data, index, system_prompt, user_prompt,
+                        system_token_count + estimate_token_count(user_prompt), prompt_model.language
+                    )
+                    params = build_message_params(
+                        system_prompt, user_prompt, max_tokens=result.max_tokens,
+                        cache_system_prompt=True, stop_sequences=TRANSLATION_STOP_SEQUENCES
+                    )
+                    cache_key = make_cache_key(params["model"], system_prompt, user_prompt, params["max_tokens"], TRANSLATION_STOP_SEQUENCES)
+                    cached_response = await response_cache.get(cache_key) if check_cache else None
+                    if cached_response is not None:
+                        await _save_result(_apply_llm_response(result, cached_response))
+                        continue
+                    custom_id = f"{prompt_id}-{index}"
+                    pending[custom_id] = result
+                    cache_keys[custom_id] = cache_key
+                    model_ids[custom_id] = params["model"]
+                    requests.append({"custom_id": custom_id, "params": params})
+        logger.info(f"Eval {evaluation_id}: {len(requests)} requests to submit as message batches ({len(prompt_ids) * len(items) - len(requests)} answered without a batch).")
+
+        # 2. Submit in chunks and record the batch ids so they can be inspected upstream
+        chunk_size = max(1, settings.anthropic_batch_max_requests)
+        for start in range(0, len(requests), chunk_size):
+            batch_id, endpoint_name = await submit_message_batch(requests[start:start + chunk_size])
+            batch_endpoints[batch_id] = endpoint_name
+        if batch_endpoints:
+            await eval_collection.update_one(
+                {"_id": evaluation_id},
+                {"$set": {"message_batch_ids": list(batch_endpoints), "message_batch_endpoints": batch_endpoints}}
+            )
+        requests.clear()
+
+        # 3. Wait for each batch and stream its results into evaluation_results
+        for batch_id, endpoint_name in batch_endpoints.items():
+            if not await _wait_for_message_batch(evaluation_id, batch_id, endpoint_name):
+                continue # Its rows are recorded as errors below
+            async for custom_id, llm_response, error in iter_message_batch_results(batch_id, endpoint_name, model_ids):
+                result = pending.pop(custom_id, None)
+                if result is None:
+                    continue
+                if llm_response is not None:
+                    if settings.llm_cache_enabled:
+                        await response_cache.put(cache_keys[custom_id], llm_response)
+                    if llm_response.stop_reason == "max_tokens":
+                        llm_response = await _retry_truncated_batch_item(result, llm_response, use_cache)
+                    _apply_llm_response(result, llm_response)
+                else:
+                    logger.warning(f"Eval {evaluation_id}: batch request {custom_id} failed: {error}")
+                    result.model_output = f"ERROR: {error}"
+                await _save_result(result)
+        error_message = "ERROR: No result returned by the message batch."
+    except asyncio.CancelledError:
+        await asyncio.shield(_cancel_stopped_message_batches(db, evaluation_id, batch_endpoints))
+        raise
+    except Exception as e:
+        logger.error(f"Batch task failed for Eval ID: {evaluation_id}: {e}", exc_info=True)
+        error_message = f"ERROR: Message batch processing failed: {e}"
+
+    # 4. Anything still pending gets an error row so every (prompt, item) has a result
+    for result in pending.values():
+        result.model_output = error_message
+        await _save_result(result)
+
+    logger.info(f"Finished batch task for Eval ID: {evaluation_id} ({len(pending)} requests without a result)")
+# --- End Batch Execution Mode ---
 
 # --- LLM Judge Background Task --- M
+async def _judge_row(result_doc: Dict[str, Any]) -> Tuple[Dict[str, Any], bool]:
+    """Runs the LLM judge on one result row. Returns the judge fields to set on the row and whether judging failed."""
+    # Prepare inputs for the judge service
+    source_text = result_doc.get("source_text")
+    model_output = result_doc.get("model_output")
+    reference_text = result_doc.get("reference_text")
+    reference_materials = {"human_reference": reference_text} if reference_text else {}
+
+    if not source_text or model_output is None: # Check if model_output is None or empty string
+        logger.warning(f"[LLM Judge Task] Skipping result {result_doc.get('_id', result_doc.get('row_index'))} due to missing source or output.")
+        return {"llm_judge_error": "Skipped: Missing source or model output."}, True
+
+    # Call the judge service function
+    # TODO: Allow passing judge_model_id and template from API request later
+    judge_result = await judge_service.evaluate_translation(
+        source_text=source_text,
+        model_output=model_output,
+        reference_materials=reference_materials,
+        # judge_model_id=... # Use default for now
+        # criteria_prompt_template=... # Use default for now
+    )
+    failed = judge_result.get("status") == "error"
+    return {
+        "llm_judge_score": judge_result.get("score"),
+        "llm_judge_rationale": judge_result.get("rationale"),
+        "llm_judge_model_id": judge_result.get("judge_model_id", judge_service.DEFAULT_JUDGE_MODEL_ID),
+        # Optionally store error or status per result
+        "llm_judge_error": judge_result.get("error_message") if failed else None
+    }, failed
+
+
 async def run_llm_judging_task(
     evaluation_id: PyObjectId,
     db: AsyncIOMotorDatabase
@@ -209,12 +672,12 @@ async def run_llm_judging_task(
             {"_id": evaluation_id},
             {"$set": {"judge_status": "failed", "judged_at": datetime.utcnow()}}
         )
+        await publish(evaluation_id, STATUS_EVENT, {"judge_status": "failed"})
         return
 
     total_results = len(results_to_judge)
     processed_count = 0
     error_count = 0
-    judge_model_id_used = judge_service.DEFAULT_JUDGE_MODEL_ID # Track default used
 
     logger.info(f"[LLM Judge Task] Found {total_results} results to judge for Evaluation ID: {evaluation_id}")
 
@@ -222,84 +685,318 @@ async def run_llm_judging_task(
         result_id = result_doc["_id"]
         logger.debug(f"[LLM Judge Task] Judging result ID: {result_id}")
         try:
-            # Prepare inputs for the judge service
-            source_text = result_doc.get("source_text")
-            model_output = result_doc.get("model_output")
-            reference_text = result_doc.get("reference_text")
-            reference_materials = {"human_reference": reference_text} if reference_text else {}
-
-            if not source_text or model_output is None: # Check if model_output is None or empty string
-                 logger.warning(f"[LLM Judge Task] Skipping result {result_id} due to missing source or output.")
-                 update_payload = {"$set": {
-                      "llm_judge_error": "Skipped: Missing source or model output."
-                 }}
-                 error_count += 1 # Count as error for status reporting
-            else:
-                 # Call the judge service function
-                 # TODO: Allow passing judge_model_id and template from API request later
-                 judge_result = await judge_service.evaluate_translation(
-                     source_text=source_text,
-                     model_output=model_output,
-                     reference_materials=reference_materials,
-                     # judge_model_id=... # Use default for now
-                     # criteria_prompt_template=... # Use default for now
-                 )
-                 judge_model_id_used = judge_result.get("judge_model_id", judge_model_id_used)
-
-                 # Prepare update payload based on judge result
-                 update_payload = {"$set": {
-                     "llm_judge_score": judge_result.get("score"),
-                     "llm_judge_rationale": judge_result.get("rationale"),
-                     "llm_judge_model_id": judge_model_id_used,
-                     # Optionally store error or status per result
-                     "llm_judge_error": judge_result.get("error_message") if judge_result.get("status") == "error" else None
-                 }}
-
-                 if judge_result.get("status") == "error":
-                     error_count += 1
-
-            # Update the specific EvaluationResult document
-            await results_collection.update_one({"_id": result_id}, update_payload)
+            update_fields, failed = await _judge_row(result_doc)
+            update_payload = {"$set": update_fields}
+            if failed:
+                error_count += 1
+
+            # Update the specific EvaluationResult document (batched by the write-behind buffer)
+            await result_writes.add(UpdateOne({"_id": result_id}, update_payload))
             processed_count += 1
             logger.debug(f"[LLM Judge Task] Updated result {result_id} ({processed_count}/{total_results})")
+            await publish(evaluation_id, JUDGE_EVENT, {"processed": processed_count, "total": total_results, "errors": error_count})
 
         except Exception as e:
             logger.error(f"[LLM Judge Task] Unexpected error processing result {result_id}: {e}", exc_info=True)
             error_count += 1
             # Attempt to mark the result as failed
             try:
-                await results_collection.update_one(
+                await result_writes.add(UpdateOne(
                     {"_id": result_id},
                     {"$set": {"llm_judge_error": f"Unexpected task error: {e}"}}
-                )
+                ))
             except Exception as update_err:
                  logger.error(f"[LLM Judge Task] Failed to update error status for result {result_id}: {update_err}")
 
     # --- Final Evaluation Status Update --- M
+    await result_writes.flush() # Scores must be visible before the status says they are
     final_judge_status = "failed" if error_count > 0 else "completed"
     logger.info(f"[LLM Judge Task] Finished for Eval ID: {evaluation_id}. Status: {final_judge_status}, Errors: {error_count}/{total_results}")
     await eval_collection.update_one(
         {"_id": evaluation_id},
         {"$set": {"judge_status": final_judge_status, "judged_at": datetime.utcnow()}}
     )
+    await publish(evaluation_id, STATUS_EVENT, {"judge_status": final_judge_status})
 # --- End LLM Judge Background Task ---
 
+# --- Pipelined Judging --- M
+# With judge_pipelined, a work unit hands every row it generates to a judge stage that runs alongside
+# generation, so translate + judge takes about as long as the slower of the two. The judge stage has its
+# own per-unit window and process-wide cap, independent of the item limits.
+_global_judge_semaphore = asyncio.Semaphore(settings.evaluation_global_judge_concurrency)
+JUDGE_INPUT_FIELDS = {*RESULT_KEY_FIELDS, "source_text", "model_output", "reference_text"}
+
+
+async def _unjudged_rows(
+    results_collection: AsyncIOMotorCollection,
+    evaluation_id: PyObjectId,
+    prompt_id: PyObjectId,
+    rows: range
+) -> List[Dict[str, Any]]:
+    """Generated rows within `rows` without a verdict (their judge stage was interrupted), with the judge inputs."""
+    cursor = results_collection.find(
+        {
+            "evaluation_id": evaluation_id, "prompt_id": prompt_id, "row_index": {"$gte": rows.start, "$lt": rows.stop},
+            "model_output": {"$ne": None}, "llm_judge_score": None, "llm_judge_error": None,
+        },
+        {field: 1 for field in JUDGE_INPUT_FIELDS}
+    )
+    return await cursor.to_list(length=None)
+
+
+async def _judge_pipelined_row(row: Dict[str, Any]) -> bool:
+    """Judges one generated row and queues its verdict. Returns True if judging failed.
+
+    Rows whose generation failed are judged like any other, as run_llm_judging_task does.
+    """
+    try:
+        async with _global_judge_semaphore:
+            update_fields, failed = await _judge_row(row)
+    except Exception as e:
+        logger.error(f"Eval {row['evaluation_id']}, Prompt {row['prompt_id']}: judging row {row['row_index']} failed: {e}", exc_info=True)
+        update_fields, failed = {"llm_judge_error": f"Unexpected task error: {e}"}, True
+    # Matched on the judged output, so a verdict never lands on a row regenerated in the meantime
+    row_filter = {field: row[field] for field in RESULT_KEY_FIELDS}
+    row_filter["model_output"] = row["model_output"]
+    await judge_writes.add(UpdateOne(row_filter, {"$set": update_fields}))
+    await publish(row["evaluation_id"], JUDGED_ROW_EVENT, {"prompt_id": row["prompt_id"], "row_index": row["row_index"], "error": failed})
+    return failed
+
+
+async def _run_judge_stage(rows_to_judge: asyncio.Queue, generation: Awaitable) -> Tuple[int, int]:
+    """Judges the rows put on `rows_to_judge` until `generation` is done and the queue is drained. Returns (judged, failed)."""
+    judged = failed = 0
+
+    async def judge_worker():
+        nonlocal judged, failed
+        while True:
+            row = await rows_to_judge.get()
+            if row is None:
+                return
+            failed += await _judge_pipelined_row(row)
+            judged += 1
+
+    workers = [asyncio.ensure_future(judge_worker()) for _ in range(max(1, settings.evaluation_judge_concurrency))]
+    try:
+        await generation
+        for _ in workers:
+            rows_to_judge.put_nowait(None) # Queued behind the last rows; each worker stops once it reaches one
+        await asyncio.gather(*workers)
+    finally:
+        for worker in workers:
+            worker.cancel() # Generation failed or the unit was cancelled
+    return judged, failed
+
+
+async def _finish_pipelined_judging(db: AsyncIOMotorDatabase, evaluation: Dict[str, Any]):
+    """Settles judge_status once a pipelined evaluation stops generating: failed if any row lacks a verdict or has a judge error."""
+    if not evaluation.get("judge_pipelined"):
+        return
+    evaluation_id = evaluation["_id"]
+    not_judged = await db[RESULTS_COLLECTION].count_documents({
+        "evaluation_id": evaluation_id,
+        "$or": [{"llm_judge_error": {"$ne": None}}, {"llm_judge_score": None}],
+    })
+    judge_status = "failed" if not_judged else "completed"
+    result = await db[EVAL_COLLECTION].update_one(
+        {"_id": evaluation_id, "judge_status": "running"}, # Not a separate judging run started since
+        {"$set": {"judge_status": judge_status, "judged_at": datetime.utcnow()}}
+    )
+    if result.modified_count:
+        logger.info(f"Evaluation {evaluation_id}: pipelined judging {judge_status} ({not_judged} rows without a verdict).")
+        await publish(evaluation_id, STATUS_EVENT, {"judge_status": judge_status})
+# --- End Pipelined Judging ---
+
+# --- Job Queue Handlers --- M
+# create_evaluation and trigger_llm_judging enqueue jobs; worker processes (worker.py) run them.
+
+def _evaluation_item_jobs(evaluation_id: PyObjectId, prompt_ids: List[PyObjectId], item_count: int) -> List[Dict[str, Any]]:
+    """One work unit per (prompt, chunk of job_queue_items_per_job items)."""
+    chunk = max(1, settings.job_queue_items_per_job)
+    return [
+        {"evaluation_id": evaluation_id, "prompt_id": prompt_id, "row_start": start, "row_end": min(start + chunk, item_count)}
+        for prompt_id in prompt_ids
+        for start in range(0, item_count, chunk)
+    ]
+
+
+# --- Scheduling --- M
+# Jobs are tagged with the evaluation's workspace, priority class and a token estimate before they are
+# enqueued; the scheduler turns that into the claim order (see app/services/scheduler.py).
+ROW_TOKEN_SAMPLE_SIZE = 200 # Items sampled to estimate the tokens of one row
+
+
+async def _estimate_row_tokens(
+    db: AsyncIOMotorDatabase,
+    test_set_data: List[Dict[str, Any]],
+    test_set_id: Optional[Any],
+    language: Optional[str]
+) -> int:
+    """Tokens of one row (source, expected output and prompt overhead), from a sample of the items."""
+    if test_set_id is not None:
+        cursor = db[TEST_SET_ENTRIES_COLLECTION].find({"test_set_id": test_set_id}, {"source_text": 1}).limit(ROW_TOKEN_SAMPLE_SIZE)
+        sources = [entry.get("source_text", "") async for entry in cursor]
+    else:
+        sources = [item.get("source_text", "") for item in test_set_data[:ROW_TOKEN_SAMPLE_SIZE]]
+    source_tokens = sum(estimate_token_count(text) for text in sources) / len(sources) if sources else 0
+    return int(source_tokens * (1 + output_budget.expansion_ratio(language)) + settings.scheduler_row_overhead_tokens)
+
+
+async def _schedule_jobs(db: AsyncIOMotorDatabase, eval_record: Dict[str, Any], kind: str, jobs: List[Dict[str, Any]]):
+    """Enqueues jobs of an evaluation in its workspace and priority class. Item jobs are costed by their rows."""
+    row_tokens = eval_record.get("est_row_tokens") or settings.scheduler_row_overhead_tokens
+    for job in jobs:
+        if "est_tokens" not in job: # Judge and batch jobs carry their own estimate
+            job["est_tokens"] = (job["row_end"] - job["row_start"]) * row_tokens
+    workspace = eval_record.get("workspace") or workspace_key(eval_record.get("user_id"), None)
+    priority_class = eval_record.get("priority_class") or scheduler.classify(sum(job["est_tokens"] for job in jobs) // row_tokens)
+    await scheduler.tag(db, workspace, priority_class, jobs)
+    await job_queue.enqueue(db, kind, jobs)
+# --- End Scheduling ---
+
+
+async def _admit(db: AsyncIOMotorDatabase, priority_class: str, what: str):
+    """Raises 429 (with Retry-After and the predicted start time) if the backlog of `priority_class` is too long."""
+    decision = await admission_controller.check(db, priority_class)
+    if decision.admitted:
+        return
+    predicted_start = decision.predicted_start_at.strftime("%Y-%m-%d %H:%M:%S UTC")
+    raise HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail=(
+            f"The {priority_class} queue is overloaded: its backlog needs about {int(decision.drain_seconds // 60)} min to drain "
+            f"(limit {int(decision.limit_seconds // 60)} min). {what} would start around {predicted_start}; "
+            f"please retry in {decision.retry_after_seconds()} s."
+        ),
+        headers={"Retry-After": str(decision.retry_after_seconds()), "X-Predicted-Start-At": decision.to_dict()["predicted_start_at"]},
+    )
+
+
+async def _load_evaluation_for_job(db: AsyncIOMotorDatabase, job: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    evaluation = await db[EVAL_COLLECTION].find_one(
+        {"_id": job["evaluation_id"]},
+        {"test_set_data": 1, "test_set_id": 1, "item_count": 1, "prompt_ids": 1, "item_concurrency": 1, "use_cache": 1, "judge_pipelined": 1}
+    )
+    if not evaluation:
+        logger.warning(f"Job {job['_id']}: evaluation {job['evaluation_id']} no longer exists; nothing to do.")
+    return evaluation
+
+
+async def run_evaluation_items_job(db: AsyncIOMotorDatabase, job: Dict[str, Any]):
+    evaluation = await _load_evaluation_for_job(db, job)
+    if evaluation:
+        rows = range(job["row_start"], job["row_end"])
+        test_set_data = await EvaluationItems.for_evaluation(db, evaluation).window(rows) # This unit's rows and their neighbours
+        await run_single_prompt_evaluation_task(
+            job["evaluation_id"], job["prompt_id"], db, test_set_data,
+            evaluation.get("item_concurrency"), evaluation.get("use_cache", True),
+            rows=rows,
+            only_failed=job.get("only_failed", False),
+            judge_pipelined=evaluation.get("judge_pipelined", False)
+        )
+    await judge_writes.flush() # Rows (flushed first) and verdicts must be durable before the job is marked done
+
+
+async def run_evaluation_batch_job(db: AsyncIOMotorDatabase, job: Dict[str, Any]):
+    evaluation = await _load_evaluation_for_job(db, job)
+    if evaluation:
+        await run_batch_evaluation_task(
+            job["evaluation_id"], evaluation["prompt_ids"], db,
+            EvaluationItems.for_evaluation(db, evaluation), evaluation.get("use_cache", True)
+        )
+    await result_writes.flush()
+
+
+# True (inside an update pipeline) once every work unit of a pending/running evaluation is counted
+_ALL_UNITS_COUNTED = {"$and": [
+    {"$in": ["$status", ["pending", "running"]]},
+    {"$gt": ["$total_prompt_tasks", 0]},
+    {"$gte": ["$completed_prompt_tasks", "$total_prompt_tasks"]},
+]}
+
+
+async def count_finished_evaluation_job(db: AsyncIOMotorDatabase, job: Dict[str, Any], error: Optional[str]):
+    """A work unit finished (or gave up): count it towards completed_prompt_tasks.
+
+    The unit that brings the counter to total_prompt_tasks also moves the
+    evaluation to completed, in the same findAndModify (an update pipeline), so
+    the status never depends on a client calling check_completion.
+    """
+    if error:
+        logger.error(f"Eval {job['evaluation_id']}: work unit {job['_id']} failed permanently: {error}")
+    units = job.get("task_units", 1)
+    now = datetime.utcnow()
+    before = await db[EVAL_COLLECTION].find_one_and_update(
+        {"_id": job["evaluation_id"]},
+        [
+            {"$set": {"completed_prompt_tasks": {"$add": [{"$ifNull": ["$completed_prompt_tasks", 0]}, units]}}},
+            {"$set": {
+                "status": {"$cond": [_ALL_UNITS_COUNTED, "completed", "$status"]},
+                "completed_at": {"$cond": [_ALL_UNITS_COUNTED, now, "$completed_at"]},
+            }},
+        ],
+        projection={"status": 1, "completed_prompt_tasks": 1, "total_prompt_tasks": 1, "judge_pipelined": 1},
+        return_document=ReturnDocument.BEFORE
+    )
+    if not before:
+        return
+    completed = (before.get("completed_prompt_tasks") or 0) + units
+    total = before.get("total_prompt_tasks") or 0
+    await publish(job["evaluation_id"], STATUS_EVENT, {"completed_prompt_tasks": completed, "total_prompt_tasks": total})
+    if before.get("status") in ("pending", "running") and 0 < total <= completed:
+        logger.info(f"Evaluation {job['evaluation_id']} completed ({completed}/{total} work units).")
+        await publish(job["evaluation_id"], STATUS_EVENT, {"status": "completed"})
+        await _finish_pipelined_judging(db, before)
+
+
+async def run_llm_judging_job(db: AsyncIOMotorDatabase, job: Dict[str, Any]):
+    await run_llm_judging_task(job["evaluation_id"], db)
+
+
+async def fail_llm_judging_job(db: AsyncIOMotorDatabase, job: Dict[str, Any], error: Optional[str]):
+    if error:
+        await db[EVAL_COLLECTION].update_one(
+            {"_id": job["evaluation_id"]},
+            {"$set": {"judge_status": "failed", "judged_at": datetime.utcnow()}}
+        )
+        await publish(job["evaluation_id"], STATUS_EVENT, {"judge_status": "failed"})
+
+
+JOB_HANDLERS: Dict[str, JobHandler] = {
+    EVALUATION_ITEMS_JOB: JobHandler(run_evaluation_items_job, count_finished_evaluation_job),
+    EVALUATION_BATCH_JOB: JobHandler(run_evaluation_batch_job, count_finished_evaluation_job),
+    LLM_JUDGING_JOB: JobHandler(run_llm_judging_job, fail_llm_judging_job),
+}
+# --- End Job Queue Handlers ---
+
 # --- API Endpoints (Modified) --- M
 
-@router.post(
-    "/",
-    response_model=Evaluation,
-    status_code=status.HTTP_202_ACCEPTED,
-    summary="Start a new multi-prompt evaluation session",
-    description="Accepts evaluation details for multiple prompts and schedules background processing.",
-)
-async def create_evaluation(
-    eval_request: EvaluationCreateRequest, # Now expects prompt_ids list
-    background_tasks: BackgroundTasks,
-    db: AsyncIOMotorDatabase = Depends(get_database),
-    current_user: UserModel = Depends(get_current_active_user)
-):
-    """Initiate an evaluation run for multiple prompts."""
+async def _resolve_evaluation_request(
+    db: AsyncIOMotorDatabase,
+    eval_request: EvaluationCreateRequest,
+    current_user: UserModel
+) -> Tuple[Optional[str], Optional[str], List[Dict[str, Any]], int]:
+    """Validates an evaluation request's prompts and items.
+
+    Returns (language, test_set_name, test_set_data, item_count); test_set_data
+    is empty when the items are read from test_set_id.
+    """
+    if (eval_request.test_set_data is None) == (eval_request.test_set_id is None):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Provide exactly one of test_set_data or test_set_id."
+        )
+    if eval_request.judge_pipelined and eval_request.execution_mode == "batch":
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="judge_pipelined requires execution_mode='interactive'; judge a batch evaluation once it has completed."
+        )
+    if eval_request.execution_mode == "batch" and not message_batches_supported():
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"execution_mode='batch' is not available: LLM provider '{settings.llm_provider}' does not support message batches."
+        )
+
     # 1. Validate all prompt IDs exist AND belong to the current user's language
     prompt_ids = eval_request.prompt_ids
     found_prompts_cursor = db[PROMPT_COLLECTION].find(
@@ -332,31 +1029,100 @@ async def create_evaluation(
                 detail="All prompts in an evaluation must belong to the same language."
             )
 
+    # --- Resolve Test Set Reference --- M
+    test_set_name = eval_request.test_set_name
+    if eval_request.test_set_id is not None:
+        test_set = await db[USER_TEST_SETS_COLLECTION].find_one(
+            {"_id": eval_request.test_set_id},
+            {"user_id": 1, "test_set_name": 1}
+        )
+        if not test_set:
+            raise HTTPException(status_code=404, detail=f"Test set {eval_request.test_set_id} not found.")
+        if test_set.get("user_id") != str(current_user.id):
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="User not authorized to use this test set.")
+        await ensure_item_indexes(db, eval_request.test_set_id)
+        item_count = await count_test_set_entries(db, eval_request.test_set_id)
+        if item_count == 0:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Test set {eval_request.test_set_id} has no entries.")
+        test_set_name = test_set_name or test_set.get("test_set_name")
+        test_set_data = []
+    else:
+        test_set_data = [item.model_dump() for item in eval_request.test_set_data]
+        item_count = len(test_set_data)
+    # --- End Resolve Test Set Reference ---
+    return first_prompt_language, test_set_name, test_set_data, item_count
+
+
+@router.post(
+    "/",
+    response_model=Evaluation,
+    status_code=status.HTTP_202_ACCEPTED,
+    summary="Start a new multi-prompt evaluation session",
+    description="Accepts evaluation details for multiple prompts and enqueues the work for the worker processes.",
+    responses={429: {"description": "The queue is overloaded; see Retry-After and X-Predicted-Start-At"}}
+)
+async def create_evaluation(
+    eval_request: EvaluationCreateRequest, # Now expects prompt_ids list
+    db: AsyncIOMotorDatabase = Depends(get_database),
+    current_user: UserModel = Depends(get_current_active_user)
+):
+    """Initiate an evaluation run for multiple prompts.
+
+    Items come either inline (test_set_data) or from an uploaded test set
+    (test_set_id), which workers read from test_set_entries as they go instead
+    of copying it into the evaluation document.
+    """
+    first_prompt_language, test_set_name, test_set_data, item_count = await _resolve_evaluation_request(db, eval_request, current_user)
+    prompt_ids = eval_request.prompt_ids
+
     # 2. Create the main Evaluation record
+    item_concurrency = resolve_item_concurrency(eval_request.item_concurrency)
+    chunks_per_prompt = -(-item_count // max(1, settings.job_queue_items_per_job))
+    priority_class = scheduler.classify(len(prompt_ids) * item_count, eval_request.priority_class, batch=eval_request.execution_mode == "batch")
+    est_row_tokens = await _estimate_row_tokens(db, test_set_data, eval_request.test_set_id, first_prompt_language)
+    await _admit(db, priority_class, "This evaluation")
     eval_data_dict = {
         "prompt_ids": prompt_ids, # Store list of IDs
-        "test_set_name": eval_request.test_set_name,
+        "test_set_name": test_set_name,
         "status": "pending",
         "created_at": datetime.utcnow(),
-        "test_set_data": [item.model_dump() for item in eval_request.test_set_data],
-        "total_prompt_tasks": len(prompt_ids), # Store how many tasks to expect
+        "test_set_data": test_set_data, # Empty when the items are read from test_set_id
+        "test_set_id": eval_request.test_set_id,
+        "item_count": item_count,
+        "total_prompt_tasks": len(prompt_ids) * (chunks_per_prompt if eval_request.execution_mode != "batch" else 1), # Work units to expect
         "completed_prompt_tasks": 0, # Initialize completion counter
+        "item_concurrency": item_concurrency,
+        "use_cache": eval_request.use_cache,
+        "execution_mode": eval_request.execution_mode,
+        "priority_class": priority_class,
+        "workspace": workspace_key(current_user.id, first_prompt_language), # Fair-share unit of the scheduler
+        "est_row_tokens": est_row_tokens,
+        "judge_pipelined": eval_request.judge_pipelined,
         "user_id": current_user.id # ADDED: Link evaluation to user
     }
+    if eval_request.judge_pipelined:
+        eval_data_dict["judge_status"] = "running" # Settled when generation ends (see _finish_pipelined_judging)
     insert_result = await db[EVAL_COLLECTION].insert_one(eval_data_dict)
     created_eval_id = insert_result.inserted_id
 
-    # 3. Schedule background task for EACH prompt
-    for prompt_id in prompt_ids:
-        # FIX: Pass list of dicts, not list of models, to background task
-        test_set_data_dicts = [item.model_dump() for item in eval_request.test_set_data]
-        background_tasks.add_task(run_single_prompt_evaluation_task, created_eval_id, prompt_id, db, test_set_data_dicts)
-    logger.info(f"Scheduled {len(prompt_ids)} background sub-tasks for Evaluation ID: {created_eval_id}")
+    # 3. Enqueue the work units (one per prompt x item chunk, or one batch job for all of them)
+    if eval_request.execution_mode == "batch":
+        kind = EVALUATION_BATCH_JOB
+        jobs = [{ # One job drives every prompt's batch
+            "evaluation_id": created_eval_id,
+            "task_units": len(prompt_ids),
+            "est_tokens": len(prompt_ids) * item_count * est_row_tokens,
+        }]
+    else:
+        kind = EVALUATION_ITEMS_JOB
+        jobs = _evaluation_item_jobs(created_eval_id, prompt_ids, item_count)
+    await _schedule_jobs(db, eval_data_dict, kind, jobs)
+    logger.info(f"Enqueued {len(jobs)} '{kind}' jobs for Evaluation ID: {created_eval_id}")
 
     # --- Set status to running (after scheduling) --- M
     await db[EVAL_COLLECTION].update_one(
         {"_id": created_eval_id, "status": "pending"}, # Ensure we only update if still pending
-        {"$set": {"status": "running"}}
+        {"$set": {"status": "running", "started_at": datetime.utcnow()}}
     )
     # --- End Status Update ---
 
@@ -368,7 +1134,330 @@ async def create_evaluation(
     else:
         raise HTTPException(status_code=500, detail="Failed to retrieve evaluation record after creation.")
 
+# --- Dry-Run Planner --- M
+# Builds every prompt an evaluation would send, as the workers would, and prices it without calling the model.
+
+def _plan_cost(input_tokens: int, cache_write_tokens: int, cache_read_tokens: int, output_tokens: int, batch: bool) -> float:
+    """USD cost of the given token counts at the configured prices."""
+    input_price = settings.llm_input_price_per_mtok
+    cost = (
+        input_tokens * input_price
+        + cache_write_tokens * input_price * settings.llm_cache_write_price_factor
+        + cache_read_tokens * input_price * settings.llm_cache_read_price_factor
+        + output_tokens * settings.llm_output_price_per_mtok
+    ) / 1_000_000
+    return round(cost * (settings.llm_batch_price_factor if batch else 1.0), 4)
+
+
+@router.post(
+    "/plan",
+    response_model=EvaluationPlan,
+    summary="Dry-run an evaluation request",
+    description="Takes the same payload as POST /evaluations/ and returns the input tokens, projected output tokens, estimated cost and expected wall-clock time at the current throughput. Nothing is enqueued and the model is not called.",
+)
+async def plan_evaluation(
+    eval_request: EvaluationCreateRequest,
+    db: AsyncIOMotorDatabase = Depends(get_database),
+    current_user: UserModel = Depends(get_current_active_user)
+):
+    """Projects the tokens, cost and duration of an evaluation request.
+
+    System and user prompts are assembled with build_system_prompt and
+    build_user_prompt and token-counted in one batch. All prompts of an
+    evaluation share its language, so each item's user prompt is identical
+    across prompts: it is built and counted once and multiplied by the prompt
+    count. The time estimate uses the admission controller's backlog and
+    throughput for the evaluation's priority class.
+    """
+    started = time.perf_counter()
+    language, _, test_set_data, item_count = await _resolve_evaluation_request(db, eval_request, current_user)
+    batch = eval_request.execution_mode == "batch"
+    priority_class = scheduler.classify(len(eval_request.prompt_ids) * item_count, eval_request.priority_class, batch=batch)
+    if eval_request.test_set_id is not None:
+        items = EvaluationItems(db, test_set_id=eval_request.test_set_id, count=item_count)
+        test_set_data = await items.window(range(item_count))
+
+    # --- Count Tokens --- M
+    prompt_records = await db[PROMPT_COLLECTION].find({"_id": {"$in": eval_request.prompt_ids}}).to_list(length=None)
+    prompts_by_id = {record["_id"]: record for record in prompt_records}
+    system_prompts = []
+    for prompt_id in eval_request.prompt_ids:
+        try:
+            system_prompts.append(build_system_prompt(Prompt.model_validate(prompts_by_id[prompt_id])))
+        except Exception as e: # The workers would record every row of this prompt as an error
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=f"Prompt {prompt_id} cannot be assembled: {e}")
+    user_prompts = [build_user_prompt(test_set_data, index, language) for index in range(item_count)]
+    sources = [str(test_set_data[index].get("source_text", "")) for index in range(item_count)]
+    counts = estimate_token_counts(system_prompts + user_prompts + sources)
+    system_tokens = counts[:len(system_prompts)]
+    user_tokens = sum(counts[len(system_prompts):len(system_prompts) + item_count])
+    source_tokens = counts[len(system_prompts) + item_count:]
+    # --- End Count Tokens ---
+
+    # Output is projected as _base_result budgets it: from the source tokens and the language's expansion ratio
+    ratio = output_budget.expansion_ratio(language)
+    projected_output = sum(math.ceil(tokens * ratio) + settings.llm_output_overhead_tokens for tokens in source_tokens)
+    max_output = sum(output_budget.budget_for(language, tokens) for tokens in source_tokens)
+
+    plan_prompts = []
+    for prompt_id, system_token_count in zip(eval_request.prompt_ids, system_tokens):
+        # The system prompt is marked cacheable: the first call writes it, later calls read it
+        cached = (
+            settings.anthropic_prompt_caching_enabled
+            and system_token_count >= settings.llm_prompt_cache_min_tokens
+            and item_count > 1
+        )
+        uncached_input = user_tokens if cached else user_tokens + system_token_count * item_count
+        cache_write = system_token_count if cached else 0
+        cache_read = system_token_count * (item_count - 1) if cached else 0
+        plan_prompts.append(EvaluationPlanPrompt(
+            prompt_id=prompt_id,
+            system_prompt_tokens=system_token_count,
+            system_prompt_cached=cached,
+            input_tokens=user_tokens + system_token_count * item_count,
+            projected_output_tokens=projected_output,
+            max_output_tokens=max_output,
+            estimated_cost_usd=_plan_cost(uncached_input, cache_write, cache_read, projected_output, batch),
+        ))
+
+    input_tokens = sum(plan_prompt.input_tokens for plan_prompt in plan_prompts)
+    output_tokens = projected_output * len(plan_prompts)
+    notes = []
+    if not TIKTOKEN_AVAILABLE:
+        notes.append("tiktoken is not installed; token counts are estimated from text length.")
+
+    # --- Wall-Clock Estimate --- M
+    decision = await admission_controller.forecast(db, priority_class)
+    throughput = decision.throughput_tokens_per_second
+    run_seconds = None
+    if batch:
+        notes.append(f"Message batches finish within {settings.anthropic_batch_max_wait_seconds / 3600:g} h; their run time cannot be predicted.")
+    elif throughput:
+        run_seconds = round((input_tokens + output_tokens) / throughput, 1)
+    else:
+        notes.append("No throughput history and unlimited token quotas; the run time cannot be predicted.")
+    predicted_start = decision.predicted_start_at
+    predicted_completion = predicted_start + timedelta(seconds=run_seconds) if predicted_start and run_seconds is not None else None
+    if not decision.admitted:
+        notes.append(f"The {priority_class} queue is overloaded; submitting now would be rejected with 429.")
+    # --- End Wall-Clock Estimate ---
+
+    planning_ms = (time.perf_counter() - started) * 1000
+    logger.info(
+        f"Planned evaluation for user {current_user.id}: {len(plan_prompts)} prompts x {item_count} items, "
+        f"{input_tokens} input tokens, ~{output_tokens} output tokens ({planning_ms:.0f} ms)."
+    )
+    return EvaluationPlan(
+        prompt_count=len(plan_prompts),
+        item_count=item_count,
+        execution_mode=eval_request.execution_mode,
+        priority_class=priority_class,
+        target_language=language,
+        input_tokens=input_tokens,
+        projected_output_tokens=output_tokens,
+        max_output_tokens=max_output * len(plan_prompts),
+        estimated_cost_usd=round(sum(plan_prompt.estimated_cost_usd for plan_prompt in plan_prompts), 4),
+        prompts=plan_prompts,
+        throughput_tokens_per_second=throughput,
+        queue_wait_seconds=decision.drain_seconds,
+        run_seconds=run_seconds,
+        predicted_start_at=predicted_start,
+        predicted_completion_at=predicted_completion,
+        would_be_admitted=decision.admitted,
+        notes=notes,
+        planning_ms=round(planning_ms, 1),
+    )
+# --- End Dry-Run Planner ---
+
+# --- Resume / Retry Failed Rows --- M
+EVALUATION_JOB_KINDS = [EVALUATION_ITEMS_JOB, EVALUATION_BATCH_JOB]
+
+
+async def _requeue_evaluation_rows(db: AsyncIOMotorDatabase, eval_record: Dict[str, Any], only_failed: bool) -> Dict[str, Any]:
+    """Enqueues work units for the rows of an evaluation that still need output.
+
+    Without `only_failed` that is every missing or errored row; with it, only rows
+    that have an error. Rows are regenerated interactively, also for batch-mode
+    evaluations. The progress counters restart for the new work units. For
+    pipelined judging, units whose rows are generated but not judged are
+    enqueued as well.
+    """
+    evaluation_id = eval_record["_id"]
+    if eval_record.get("status") == "cancelled":
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Evaluation {evaluation_id} was cancelled and cannot be resumed; start a new evaluation."
+        )
+    if await job_queue.count_active(db, evaluation_id, EVALUATION_JOB_KINDS):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Evaluation {evaluation_id} still has queued or running work; wait for it to finish first."
+        )
+    await job_queue.abandon_stranded(db, evaluation_id, EVALUATION_JOB_KINDS, "Superseded by resume.")
+
+    item_count = len(EvaluationItems.for_evaluation(db, eval_record))
+    chunk = max(1, settings.job_queue_items_per_job)
+    jobs = []
+    for prompt_id in eval_record.get("prompt_ids", []):
+        done_rows, failed_rows = await _existing_row_states(db[RESULTS_COLLECTION], evaluation_id, prompt_id, range(item_count))
+        unjudged_rows: Set[int] = set()
+        if eval_record.get("judge_pipelined"):
+            unjudged_rows = {row["row_index"] for row in await _unjudged_rows(db[RESULTS_COLLECTION], evaluation_id, prompt_id, range(item_count))}
+        for start in range(0, item_count, chunk):
+            rows = range(start, min(start + chunk, item_count))
+            needs_work = any(index in failed_rows for index in rows) if only_failed else any(index not in done_rows for index in rows)
+            needs_work = needs_work or any(index in unjudged_rows for index in rows)
+            if needs_work:
+                jobs.append({"evaluation_id": evaluation_id, "prompt_id": prompt_id, "row_start": rows.start, "row_end": rows.stop, "only_failed": only_failed})
+
+    if not jobs:
+        # Nothing left to generate; settle an evaluation stranded in 'running' (or paused, or failed by the sweeper)
+        await mark_evaluation_completed(db, evaluation_id, ("pending", "running", "paused", "failed"))
+    else:
+        restart = {"status": "running", "started_at": datetime.utcnow(), "total_prompt_tasks": len(jobs), "completed_prompt_tasks": 0}
+        if eval_record.get("judge_pipelined"):
+            restart["judge_status"] = "running" # The new units judge what they generate
+        await db[EVAL_COLLECTION].update_one(
+            {"_id": evaluation_id},
+            {"$set": restart, "$unset": {"completed_at": "", "status_detail": ""}}
+        )
+        await _schedule_jobs(db, eval_record, EVALUATION_ITEMS_JOB, jobs)
+        await publish(evaluation_id, STATUS_EVENT, {k: v for k, v in restart.items() if k != "started_at"})
+    logger.info(f"Evaluation {evaluation_id}: {'retry of failed rows' if only_failed else 'resume'} enqueued {len(jobs)} work units.")
+    return await db[EVAL_COLLECTION].find_one({"_id": evaluation_id})
+
+
+async def _get_owned_evaluation(db: AsyncIOMotorDatabase, evaluation_id: PyObjectId, current_user: UserModel) -> Dict[str, Any]:
+    eval_record = await db[EVAL_COLLECTION].find_one({"_id": evaluation_id})
+    if not eval_record:
+        raise HTTPException(status_code=404, detail=f"Evaluation {evaluation_id} not found")
+    if eval_record.get("user_id") != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="User not authorized to access this evaluation",
+        )
+    return eval_record
+
+
+@router.post(
+    "/{evaluation_id}/resume",
+    response_model=Evaluation,
+    status_code=status.HTTP_202_ACCEPTED,
+    summary="Resume an interrupted evaluation",
+    description="Generates only the rows that are missing or errored; rows that already have output are kept.",
+    responses={409: {"description": "The evaluation still has queued or running work"}}
+)
+async def resume_evaluation(
+    evaluation_id: PyObjectId,
+    db: AsyncIOMotorDatabase = Depends(get_database),
+    current_user: UserModel = Depends(get_current_active_user)
+):
+    """Re-enqueues the work units that still have missing or errored rows."""
+    eval_record = await _get_owned_evaluation(db, evaluation_id, current_user)
+    return Evaluation(**await _requeue_evaluation_rows(db, eval_record, only_failed=False))
+
+
+@router.post(
+    "/{evaluation_id}/retry-failed",
+    response_model=Evaluation,
+    status_code=status.HTTP_202_ACCEPTED,
+    summary="Retry the failed rows of an evaluation",
+    description="Regenerates only the rows whose output is an error (e.g., after an API outage).",
+    responses={409: {"description": "The evaluation still has queued or running work"}}
+)
+async def retry_failed_rows(
+    evaluation_id: PyObjectId,
+    db: AsyncIOMotorDatabase = Depends(get_database),
+    current_user: UserModel = Depends(get_current_active_user)
+):
+    """Re-enqueues the work units that contain errored rows."""
+    eval_record = await _get_owned_evaluation(db, evaluation_id, current_user)
+    return Evaluation(**await _requeue_evaluation_rows(db, eval_record, only_failed=True))
+# --- End Resume / Retry Failed Rows ---
+
+# --- Cancel / Pause --- M
+# Both drop the evaluation's queued work units and stop the running ones: workers poll their jobs for
+# cancel_requested, cancel the handler task (in-flight LLM calls are abandoned, no row is written for
+# them) and mark the job cancelled. Rows already written are kept. A paused evaluation continues from
+# its missing rows with /resume; a cancelled one is final.
+STOPPED_STATUSES = ("paused", "cancelled")
+
+
+async def _stop_evaluation(db: AsyncIOMotorDatabase, eval_record: Dict[str, Any], new_status: str) -> Dict[str, Any]:
+    evaluation_id = eval_record["_id"]
+    update: Dict[str, Any] = {"status": new_status}
+    if new_status == "cancelled":
+        update["completed_at"] = datetime.utcnow()
+    stopped = await db[EVAL_COLLECTION].find_one_and_update(
+        {"_id": evaluation_id, "status": {"$in": ["pending", "running"]}},
+        {"$set": update},
+        return_document=ReturnDocument.AFTER
+    )
+    if not stopped:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Evaluation {evaluation_id} is '{eval_record.get('status')}'; only pending or running evaluations can be stopped."
+        )
+    jobs = await job_queue.cancel(db, evaluation_id, EVALUATION_JOB_KINDS, f"Evaluation {new_status} by the user.")
+    await publish(evaluation_id, STATUS_EVENT, {"status": new_status})
+    if new_status == "cancelled":
+        await _finish_pipelined_judging(db, stopped)
+    logger.info(f"Evaluation {evaluation_id} {new_status}: dropped {jobs['dropped']} queued work units, stopping {jobs['stopping']} running ones.")
+    return stopped
+
+
+@router.post(
+    "/{evaluation_id}/pause",
+    response_model=Evaluation,
+    summary="Pause a running evaluation",
+    description="Drops queued work and stops running work promptly, keeping the rows already generated. Resume continues from the missing rows.",
+    responses={409: {"description": "The evaluation is not pending or running"}}
+)
+async def pause_evaluation(
+    evaluation_id: PyObjectId,
+    db: AsyncIOMotorDatabase = Depends(get_database),
+    current_user: UserModel = Depends(get_current_active_user)
+):
+    """Stops an evaluation so it can be resumed later."""
+    eval_record = await _get_owned_evaluation(db, evaluation_id, current_user)
+    return Evaluation(**await _stop_evaluation(db, eval_record, "paused"))
+
+
+@router.post(
+    "/{evaluation_id}/cancel",
+    response_model=Evaluation,
+    summary="Cancel a running evaluation",
+    description="Drops queued work and stops running work promptly (including submitted message batches), keeping the rows already generated.",
+    responses={409: {"description": "The evaluation is not pending or running"}}
+)
+async def cancel_evaluation(
+    evaluation_id: PyObjectId,
+    db: AsyncIOMotorDatabase = Depends(get_database),
+    current_user: UserModel = Depends(get_current_active_user)
+):
+    """Stops an evaluation for good."""
+    eval_record = await _get_owned_evaluation(db, evaluation_id, current_user)
+    return Evaluation(**await _stop_evaluation(db, eval_record, "cancelled"))
+# --- End Cancel / Pause ---
+
 # --- Endpoint to Check Status (Potentially Needed) --- M
+async def mark_evaluation_completed(
+    db: AsyncIOMotorDatabase,
+    evaluation_id: PyObjectId,
+    from_statuses: Tuple[str, ...] = ("pending", "running")
+) -> Optional[Dict[str, Any]]:
+    """Moves an evaluation in one of `from_statuses` to completed. Returns the updated record, or None if it was in another status."""
+    updated_eval_record = await db[EVAL_COLLECTION].find_one_and_update(
+        {"_id": evaluation_id, "status": {"$in": list(from_statuses)}},
+        {"$set": {"status": "completed", "completed_at": datetime.utcnow()}, "$unset": {"status_detail": ""}},
+        return_document=ReturnDocument.AFTER
+    )
+    if updated_eval_record:
+        await publish(evaluation_id, STATUS_EVENT, {"status": "completed"})
+        await _finish_pipelined_judging(db, updated_eval_record)
+    return updated_eval_record
+
+
 @router.patch(
     "/{evaluation_id}/check_completion",
     response_model=Evaluation,
@@ -398,14 +1487,8 @@ async def check_evaluation_completion(
         completed = eval_record.get("completed_prompt_tasks", 0)
         if completed >= total > 0:
             logger.info(f"Marking evaluation {evaluation_id} as completed.")
-            update_filter = {"_id": evaluation_id, "status": {"$in": ["pending", "running"]}}
-            update_payload = {"$set": {"status": "completed", "completed_at": datetime.utcnow()}}
             try:
-                updated_eval_record = await db[EVAL_COLLECTION].find_one_and_update(
-                     update_filter,
-                     update_payload,
-                     return_document=ReturnDocument.AFTER
-                )
+                updated_eval_record = await mark_evaluation_completed(db, evaluation_id)
                 if updated_eval_record:
                      logger.info(f"Successfully marked evaluation {evaluation_id} as completed.")
                      eval_record = updated_eval_record
@@ -433,6 +1516,160 @@ async def check_evaluation_completion(
 
     return Evaluation(**final_eval_record) # Return the freshly fetched record
 
+# --- Stranded Evaluation Sweeper --- M
+# count_finished_evaluation_job completes evaluations as their last work unit is counted. The sweeper
+# settles the ones that never get there: counters already at the total (e.g. from before that change),
+# or no queued/leased work left at all (jobs lost, or enqueueing failed after the record was created).
+
+async def sweep_stranded_evaluations(db: AsyncIOMotorDatabase) -> Dict[str, int]:
+    """Completes or fails pending/running evaluations that no work unit will finish. Returns the counts."""
+    cutoff = datetime.utcnow() - timedelta(seconds=settings.evaluation_sweep_grace_seconds)
+    cursor = db[EVAL_COLLECTION].find(
+        {
+            "status": {"$in": ["pending", "running"]},
+            "$or": [
+                {"started_at": {"$lte": cutoff}},
+                {"started_at": None, "created_at": {"$lte": cutoff}},
+            ],
+        },
+        {"status": 1, "started_at": 1, "completed_prompt_tasks": 1, "total_prompt_tasks": 1, "judge_pipelined": 1}
+    )
+    swept = {"completed": 0, "failed": 0}
+    async for evaluation in cursor:
+        evaluation_id = evaluation["_id"]
+        total = evaluation.get("total_prompt_tasks") or 0
+        completed = evaluation.get("completed_prompt_tasks") or 0
+        if 0 < total <= completed:
+            if await mark_evaluation_completed(db, evaluation_id):
+                swept["completed"] += 1
+            continue
+        if await job_queue.count_unfinished(db, evaluation_id, EVALUATION_JOB_KINDS):
+            continue
+        # Matched on started_at, so an evaluation resumed since it was read is left alone
+        detail = f"Work lost: {completed} of {total} work units finished and none are queued. Resume to generate the missing rows."
+        result = await db[EVAL_COLLECTION].update_one(
+            {"_id": evaluation_id, "status": {"$in": ["pending", "running"]}, "started_at": evaluation.get("started_at")},
+            {"$set": {"status": "failed", "status_detail": detail, "completed_at": datetime.utcnow()}}
+        )
+        if result.modified_count:
+            swept["failed"] += 1
+            logger.warning(f"Evaluation {evaluation_id}: {detail}")
+            await publish(evaluation_id, STATUS_EVENT, {"status": "failed", "status_detail": detail})
+            await _finish_pipelined_judging(db, evaluation)
+    if swept["completed"] or swept["failed"]:
+        logger.info(f"Evaluation sweeper: completed {swept['completed']}, failed {swept['failed']} stranded evaluations.")
+    return swept
+
+
+async def run_evaluation_sweeper(db: AsyncIOMotorDatabase):
+    """Sweeps every evaluation_sweep_interval_seconds until cancelled (started by the API and the workers).
+
+    Every update is conditional on the status it read, so several processes may sweep at once.
+    """
+    if settings.evaluation_sweep_interval_seconds <= 0:
+        return
+    while True:
+        await asyncio.sleep(settings.evaluation_sweep_interval_seconds)
+        try:
+            await sweep_stranded_evaluations(db)
+        except Exception as e:
+            logger.warning(f"Evaluation sweeper failed: {e}")
+# --- End Stranded Evaluation Sweeper ---
+
+# --- Progress Stream --- M
+# Server-sent events replace polling check_completion: workers publish row/status/judge events
+# (progress_events) and every API process fans them out from one tailing cursor.
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+async def _load_progress(db: AsyncIOMotorDatabase, eval_record: Dict[str, Any]) -> EvaluationProgress:
+    """Progress state of an evaluation from its record and the rows already written."""
+    evaluation_id = eval_record["_id"]
+    progress = EvaluationProgress(eval_record, len(EvaluationItems.for_evaluation(db, eval_record)))
+    results_collection = db[RESULTS_COLLECTION]
+    async for doc in results_collection.find({"evaluation_id": evaluation_id}, {"prompt_id": 1, "row_index": 1}):
+        progress.seed_row(doc["prompt_id"], doc.get("row_index"), error=False)
+    failed_filter = {
+        "evaluation_id": evaluation_id,
+        "$or": [{"model_output": {"$regex": f"^{ERROR_OUTPUT_PREFIX}"}}, {"model_output": None}],
+    }
+    async for doc in results_collection.find(failed_filter, {"prompt_id": 1, "row_index": 1}):
+        progress.seed_row(doc["prompt_id"], doc.get("row_index"), error=True)
+    if eval_record.get("judge_pipelined"):
+        judged_filter = {
+            "evaluation_id": evaluation_id,
+            "$or": [{"llm_judge_score": {"$ne": None}}, {"llm_judge_error": {"$ne": None}}],
+        }
+        async for doc in results_collection.find(judged_filter, {"prompt_id": 1, "row_index": 1, "llm_judge_error": 1}):
+            progress.seed_judged_row(doc["prompt_id"], doc.get("row_index"), error=doc.get("llm_judge_error") is not None)
+    return progress
+
+
+async def _evaluation_event_stream(request: Request, db: AsyncIOMotorDatabase, eval_record: Dict[str, Any]):
+    evaluation_id = eval_record["_id"]
+    subscription = await progress_hub.subscribe(evaluation_id)
+    try:
+        # Loaded after subscribing, so no event falls between the snapshot and the stream
+        progress = await _load_progress(db, eval_record)
+        yield _sse("progress", progress.summary())
+        last_sent = last_summary = time.monotonic()
+        changed = False
+        while not await request.is_disconnected():
+            if subscription.overflowed:
+                # The client fell behind; drop the backlog and start over from MongoDB
+                while not subscription.queue.empty():
+                    subscription.queue.get_nowait()
+                subscription.overflowed = False
+                eval_record = await db[EVAL_COLLECTION].find_one({"_id": evaluation_id}) or eval_record
+                progress = await _load_progress(db, eval_record)
+                changed = True
+            event = await subscription.get(timeout=settings.progress_summary_interval_seconds)
+            if event is not None:
+                progress.apply(event)
+                changed = True
+                event_type = event.get("type")
+                payload = {k: v for k, v in event.items() if k not in ("_id", "type", "ts")}
+                yield _sse(event_type, payload)
+                last_sent = time.monotonic()
+            now = time.monotonic()
+            if changed and now - last_summary >= settings.progress_summary_interval_seconds:
+                yield _sse("progress", progress.summary())
+                last_sent = last_summary = now
+                changed = False
+            elif now - last_sent >= settings.progress_heartbeat_seconds:
+                yield ": keep-alive\n\n"
+                last_sent = now
+    finally:
+        progress_hub.unsubscribe(subscription)
+
+
+@router.get(
+    "/{evaluation_id}/events",
+    summary="Stream evaluation progress",
+    description=(
+        "Server-sent events: a 'progress' summary (per-prompt row counters, throughput and ETA) first and "
+        "then at most once per interval while anything changes, plus a 'row' event per written result, "
+        "'status' events for evaluation/judge status and work-unit counters, and 'judge' events with judging progress "
+        "(or a 'judged_row' event per verdict when judging is pipelined)."
+    ),
+)
+async def stream_evaluation_events(
+    evaluation_id: PyObjectId,
+    request: Request,
+    db: AsyncIOMotorDatabase = Depends(get_database),
+    current_user: UserModel = Depends(get_current_active_user)
+):
+    """Pushes the progress of one evaluation until the client disconnects."""
+    eval_record = await _get_owned_evaluation(db, evaluation_id, current_user)
+    return StreamingResponse(
+        _evaluation_event_stream(request, db, eval_record),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}, # No proxy buffering (nginx)
+    )
+# --- End Progress Stream ---
+
 @router.get(
     "/",
     response_model=List[Evaluation],
@@ -483,14 +1720,19 @@ async def get_evaluation(
     "/{evaluation_id}/results",
     response_model=List[EvaluationResult],
     summary="Get results for an evaluation session",
-    description="Retrieves all result rows associated with a specific evaluation session.",
+    description="Retrieves all result rows associated with a specific evaluation session. Pass include_sent_prompts=true to also get the exact prompts sent to the model.",
 )
 async def get_evaluation_results(
     evaluation_id: PyObjectId,
+    include_sent_prompts: bool = False,
     db: AsyncIOMotorDatabase = Depends(get_database),
     current_user: UserModel = Depends(get_current_active_user)
 ):
-    """Retrieve all results for a given evaluation ID."""
+    """Retrieve all results for a given evaluation ID.
+
+    The sent system/user prompts are looked up in the prompt text store only
+    when `include_sent_prompts` is set; otherwise rows carry just their hashes.
+    """
     # --- ADDED Authorization Check (on parent evaluation) --- M
     parent_eval = await db[EVAL_COLLECTION].find_one(
         {"_id": evaluation_id},
@@ -505,11 +1747,57 @@ async def get_evaluation_results(
         )
     # --- End Authorization Check ---
 
-    results_cursor = db[RESULTS_COLLECTION].find({"evaluation_id": evaluation_id})
+    # Rows are written in completion order; sort so clients always see test set order
+    projection = None if include_sent_prompts else {field: 0 for field in SENT_PROMPT_FIELDS}
+    results_cursor = db[RESULTS_COLLECTION].find({"evaluation_id": evaluation_id}, projection).sort([("row_index", 1), ("_id", 1)])
     results = await results_cursor.to_list(length=None)
+    if include_sent_prompts:
+        await rehydrate_sent_prompts(db, results)
     return [EvaluationResult.model_validate(res) for res in results]
 
 
+@router.get(
+    "/{evaluation_id}/hedging",
+    response_model=EvaluationHedgingStats,
+    summary="Get request hedging statistics for an evaluation",
+    description="Returns how many of the evaluation's LLM calls were hedged, how often the hedge won, and the estimated time saved.",
+)
+async def get_evaluation_hedging_stats(
+    evaluation_id: PyObjectId,
+    db: AsyncIOMotorDatabase = Depends(get_database),
+    current_user: UserModel = Depends(get_current_active_user)
+):
+    """Aggregates the hedging fields of an evaluation's result rows."""
+    parent_eval = await db[EVAL_COLLECTION].find_one({"_id": evaluation_id}, {"user_id": 1})
+    if not parent_eval:
+        raise HTTPException(status_code=404, detail=f"Evaluation {evaluation_id} not found")
+    if parent_eval.get("user_id") != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="User not authorized to access this evaluation",
+        )
+
+    pipeline = [
+        {"$match": {"evaluation_id": evaluation_id, "cache_hit": False, "output_token_count": {"$ne": None}}},
+        {"$group": {
+            "_id": None,
+            "llm_calls": {"$sum": 1},
+            "hedged_calls": {"$sum": {"$cond": [{"$eq": ["$hedged", True]}, 1, 0]}},
+            "hedge_wins": {"$sum": {"$cond": [{"$eq": ["$hedge_won", True]}, 1, 0]}},
+            "estimated_time_saved_ms": {"$sum": {"$ifNull": ["$hedge_saved_ms", 0]}},
+        }},
+    ]
+    totals = await db[RESULTS_COLLECTION].aggregate(pipeline).to_list(length=1)
+    stats = EvaluationHedgingStats(evaluation_id=evaluation_id)
+    if totals:
+        stats.llm_calls = totals[0]["llm_calls"]
+        stats.hedged_calls = totals[0]["hedged_calls"]
+        stats.hedge_wins = totals[0]["hedge_wins"]
+        stats.estimated_time_saved_ms = round(totals[0]["estimated_time_saved_ms"], 1)
+        stats.hedge_rate = round(stats.hedged_calls / stats.llm_calls, 4) if stats.llm_calls else 0.0
+    return stats
+
+
 @router.put(
     "/results/{result_id}",
     response_model=EvaluationResult,
@@ -585,16 +1873,16 @@ async def update_evaluation_result(
     "/{evaluation_id}/judge",
     status_code=status.HTTP_202_ACCEPTED,
     summary="Start LLM Judging for an Evaluation",
-    description="Triggers a background task to evaluate all results of an evaluation using an LLM judge.",
+    description="Enqueues a job to evaluate all results of an evaluation using an LLM judge.",
     responses={
         404: {"description": "Evaluation not found"},
         403: {"description": "User not authorized"},
-        409: {"description": "Judging already in progress or completed"}
+        409: {"description": "Judging already in progress or completed"},
+        429: {"description": "The judging queue is overloaded; see Retry-After and X-Predicted-Start-At"}
     }
 )
 async def trigger_llm_judging(
     evaluation_id: PyObjectId,
-    background_tasks: BackgroundTasks,
     db: AsyncIOMotorDatabase = Depends(get_database),
     current_user: UserModel = Depends(get_current_active_user)
 ):
@@ -617,6 +1905,9 @@ async def trigger_llm_judging(
              detail=f"LLM Judging for evaluation {evaluation_id} is already '{current_judge_status}'."
          )
 
+    rows = len(evaluation.get("prompt_ids", [])) * len(EvaluationItems.for_evaluation(db, evaluation))
+    await _admit(db, evaluation.get("priority_class") or scheduler.classify(rows), "Judging")
+
     # 4. Update status to pending and schedule task
     update_result = await db[EVAL_COLLECTION].update_one(
         {"_id": evaluation_id},
@@ -628,8 +1919,12 @@ async def trigger_llm_judging(
         logger.error(f"Failed to update judge_status to pending for evaluation {evaluation_id}")
         raise HTTPException(status_code=500, detail="Failed to initiate judging process.")
 
-    background_tasks.add_task(run_llm_judging_task, evaluation_id, db)
-    logger.info(f"Scheduled LLM judging task for Evaluation ID: {evaluation_id}")
+    await _schedule_jobs(db, evaluation, LLM_JUDGING_JOB, [{
+        "evaluation_id": evaluation_id,
+        "est_tokens": rows * (evaluation.get("est_row_tokens") or settings.scheduler_row_overhead_tokens),
+    }])
+    await publish(evaluation_id, STATUS_EVENT, {"judge_status": "pending"})
+    logger.info(f"Enqueued LLM judging job for Evaluation ID: {evaluation_id}")
 
     return {"message": "LLM judging process initiated."}
 # --- End Trigger Endpoint ---
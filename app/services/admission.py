@@ -0,0 +1,164 @@
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Optional, Dict, Any, NamedTuple
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from app.core.config import settings
+from app.services.job_queue import JOBS_COLLECTION, JOB_DONE, JOB_LEASED, JOB_QUEUED
+from app.services.llm_endpoints import endpoint_pool
+from app.services.scheduler import PRIORITY_RANKS
+
+logger = logging.getLogger(__name__)
+
+
+class AdmissionDecision(NamedTuple):
+    """Outcome of an admission check for new work of one priority class."""
+    admitted: bool
+    priority_class: str
+    backlog_tokens: int # Estimated tokens queued or running ahead of the new work
+    throughput_tokens_per_second: Optional[float] # None when unknown (no history and unlimited quotas)
+    drain_seconds: Optional[float] # Time to clear the backlog at that throughput
+    limit_seconds: float # Configured maximum drain time for the class (0 = unlimited)
+    predicted_start_at: Optional[datetime] # When the new work is expected to start
+
+    def retry_after_seconds(self) -> int:
+        """Wait until the backlog has drained below the limit."""
+        if self.drain_seconds is None:
+            return 0
+        return max(1, int(self.drain_seconds - self.limit_seconds) + 1)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "priority_class": self.priority_class,
+            "backlog_tokens": self.backlog_tokens,
+            "throughput_tokens_per_second": self.throughput_tokens_per_second,
+            "drain_seconds": self.drain_seconds,
+            "limit_seconds": self.limit_seconds,
+            "predicted_start_at": self.predicted_start_at.isoformat() + "Z" if self.predicted_start_at else None,
+        }
+
+
+class AdmissionController:
+    """Rejects new evaluations and judge runs while the queue cannot be drained in time.
+
+    The backlog ahead of new work is the estimated tokens (est_tokens, set by
+    the scheduler) of the jobs queued or running in its priority class or a
+    higher one. Throughput is the token rate of one job slot, measured from the
+    jobs finished over the last admission_throughput_window_seconds, times the
+    jobs running now; without enough history it falls back to the token quotas
+    of the endpoint pool. Work is admitted while
+    backlog / throughput stays under the class's admission_max_drain_seconds.
+    Measurements are cached for admission_cache_seconds so bursts of
+    submissions do not each aggregate the job queue.
+    """
+
+    def __init__(self):
+        self._load: Optional[Dict[str, Any]] = None
+        self._load_at = 0.0
+        self.admitted: Dict[str, int] = {}
+        self.rejected: Dict[str, int] = {}
+
+    def limit_seconds(self, priority_class: str) -> float:
+        return settings.admission_max_drain_seconds.get(priority_class, 0.0)
+
+    def _quota_throughput(self) -> Optional[float]:
+        """Tokens/s the endpoint quotas allow, or None if any endpoint has an unlimited token quota."""
+        total = 0.0
+        for endpoint in endpoint_pool.endpoints():
+            controller = endpoint.controller
+            if not controller.input_tokens_per_minute or not controller.output_tokens_per_minute:
+                return None
+            total += (controller.input_tokens_per_minute + controller.output_tokens_per_minute) / 60
+        return total * max(1, settings.llm_quota_processes) # Each process enforces its share of the quotas
+
+    async def _measure(self, db: AsyncIOMotorDatabase) -> Dict[str, Any]:
+        if self._load is not None and time.monotonic() - self._load_at < settings.admission_cache_seconds:
+            return self._load
+        jobs = db[JOBS_COLLECTION]
+        backlog: Dict[Optional[int], int] = {}
+        running = 0
+        async for row in jobs.aggregate([
+            {"$match": {"status": {"$in": [JOB_QUEUED, JOB_LEASED]}}},
+            {"$group": {"_id": {"rank": "$priority_rank", "status": "$status"}, "tokens": {"$sum": "$est_tokens"}, "jobs": {"$sum": 1}}},
+        ]):
+            rank = row["_id"].get("rank")
+            backlog[rank] = backlog.get(rank, 0) + (row["tokens"] or 0)
+            if row["_id"].get("status") == JOB_LEASED:
+                running += row["jobs"]
+
+        # Tokens per second of one busy job slot, from recent runs (idle time between jobs does not count)
+        since = datetime.utcnow() - timedelta(seconds=settings.admission_throughput_window_seconds)
+        finished_tokens = 0
+        finished_jobs = 0
+        run_seconds = 0.0
+        async for job in jobs.find(
+            {"status": JOB_DONE, "finished_at": {"$gte": since}},
+            {"est_tokens": 1, "first_claimed_at": 1, "finished_at": 1}
+        ):
+            if job.get("first_claimed_at") is None:
+                continue
+            finished_tokens += job.get("est_tokens") or 0
+            finished_jobs += 1
+            run_seconds += (job["finished_at"] - job["first_claimed_at"]).total_seconds()
+        if finished_jobs >= settings.admission_min_finished_jobs and run_seconds > 0:
+            # While there is a backlog every worker slot is busy, so the running jobs count the slots
+            throughput, source = finished_tokens / run_seconds * max(1, running), "measured"
+        else:
+            throughput, source = self._quota_throughput(), "quota"
+        self._load = {"backlog": backlog, "running_jobs": running, "throughput": throughput, "throughput_source": source, "finished_jobs": finished_jobs}
+        self._load_at = time.monotonic()
+        return self._load
+
+    def _decide(self, load: Dict[str, Any], priority_class: str) -> AdmissionDecision:
+        rank = PRIORITY_RANKS[priority_class]
+        backlog_tokens = sum(tokens for job_rank, tokens in load["backlog"].items() if job_rank is None or job_rank <= rank)
+        throughput = load["throughput"]
+        limit = self.limit_seconds(priority_class)
+        drain = backlog_tokens / throughput if throughput else None
+        return AdmissionDecision(
+            admitted=limit <= 0 or drain is None or drain <= limit,
+            priority_class=priority_class,
+            backlog_tokens=backlog_tokens,
+            throughput_tokens_per_second=round(throughput, 1) if throughput else None,
+            drain_seconds=round(drain, 1) if drain is not None else None,
+            limit_seconds=limit,
+            predicted_start_at=datetime.utcnow() + timedelta(seconds=drain) if drain is not None else None,
+        )
+
+    async def forecast(self, db: AsyncIOMotorDatabase, priority_class: str) -> AdmissionDecision:
+        """The decision check() would make now, without counting it as a submission (for dry runs)."""
+        return self._decide(await self._measure(db), priority_class)
+
+    async def check(self, db: AsyncIOMotorDatabase, priority_class: str) -> AdmissionDecision:
+        """Decides whether new work of `priority_class` may be enqueued now."""
+        decision = await self.forecast(db, priority_class)
+        counters = self.admitted if decision.admitted else self.rejected
+        counters[priority_class] = counters.get(priority_class, 0) + 1
+        if not decision.admitted:
+            logger.warning(
+                f"Admission: rejected {priority_class} work; backlog of {decision.backlog_tokens} tokens "
+                f"drains in {decision.drain_seconds}s (limit {decision.limit_seconds}s)."
+            )
+        return decision
+
+    async def snapshot(self, db: AsyncIOMotorDatabase) -> Dict[str, Any]:
+        load = await self._measure(db)
+        return {
+            "throughput_tokens_per_second": round(load["throughput"], 1) if load["throughput"] else None,
+            "throughput_source": load["throughput_source"],
+            "finished_jobs_in_window": load["finished_jobs"],
+            "running_jobs": load["running_jobs"],
+            "classes": {
+                priority_class: {
+                    **self._decide(load, priority_class).to_dict(),
+                    "admitted": self.admitted.get(priority_class, 0),
+                    "rejected": self.rejected.get(priority_class, 0),
+                }
+                for priority_class in PRIORITY_RANKS
+            },
+        }
+
+
+admission_controller = AdmissionController()
@@ -1,26 +1,362 @@
 import anthropic
+import asyncio
 import logging
+import time
 from app.core.config import settings
-from typing import Optional
+from app.core.token_utils import estimate_token_count
+from app.models.llm import LLMResponse
+from app.services.llm_cache import make_cache_key, response_cache
+from app.services.llm_endpoints import endpoint_pool
+from app.services.hedging import request_hedger
+from app.services.output_budget import output_budget
+from app.services.llm_resilience import (
+    CircuitOpenError, CIRCUIT_FAILURE_CLASSES, classify_error, get_circuit_breaker, retry_policy
+)
+from app.services.single_flight import SingleFlight
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
-# Initialize the Anthropic client once
-# Handle potential errors during initialization
-try:
-    client = anthropic.Anthropic(
-        # Defaults to os.environ.get("ANTHROPIC_API_KEY")
-        api_key=settings.anthropic_api_key,
+# Merges concurrent identical requests (same cache key) into one upstream call
+single_flight = SingleFlight()
+
+
+def _is_throttling_error(error: Exception) -> bool:
+    """True for responses that signal we are over capacity (429 rate limit, 529 overloaded)."""
+    return isinstance(error, anthropic.APIStatusError) and error.status_code in (429, 529)
+
+
+def _is_connection_failure(error: Exception) -> bool:
+    """True if the endpoint could not be reached at all; that says nothing about the model's health."""
+    return isinstance(error, anthropic.APIConnectionError) and not isinstance(error, anthropic.APITimeoutError)
+
+
+def _retry_after_seconds(error: Exception) -> Optional[float]:
+    """Parses the retry-after header (seconds form) from an API error, if present."""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    value = response.headers.get("retry-after")
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+DEFAULT_MODEL_ID = "claude-3-haiku-20240307"
+
+
+def resolve_model_id(model_id: Optional[str] = None) -> str:
+    """Returns the model to call: the given model_id, or the default."""
+    return model_id if model_id else DEFAULT_MODEL_ID
+
+
+def build_message_params(
+    prompt_text: str,
+    source_text: str,
+    model_id: Optional[str] = None,
+    max_tokens: int = 1024,
+    cache_system_prompt: bool = False,
+    stop_sequences: Optional[List[str]] = None,
+) -> Dict[str, Any]:
+    """Messages API parameters for one call; shared by interactive calls and message batches."""
+    if cache_system_prompt and settings.anthropic_prompt_caching_enabled:
+        # Mark the system prompt as a cacheable prefix so repeated calls with the same
+        # system prompt reuse Anthropic's prompt cache instead of re-processing it
+        system_param = [{"type": "text", "text": prompt_text, "cache_control": {"type": "ephemeral"}}]
+    else:
+        system_param = prompt_text
+    params = {
+        "model": resolve_model_id(model_id),
+        "max_tokens": max_tokens,
+        "system": system_param, # System prompt sets the context/instructions
+        "messages": [
+            {
+                "role": "user",
+                "content": source_text
+            }
+        ],
+    }
+    if stop_sequences:
+        params["stop_sequences"] = list(stop_sequences)
+    return params
+
+
+def message_to_llm_response(
+    message: Any,
+    target_model: str,
+    retry_count: Optional[int] = None,
+    latency_ms: Optional[float] = None,
+) -> LLMResponse:
+    """Converts an SDK Message into an LLMResponse.
+
+    If generation ended on a stop sequence, the sequence is appended to the text (the
+    API omits it), so callers parse the same text they would get without stopping early.
+    """
+    text = ""
+    # Assuming the response structure gives content in a list
+    if message.content and isinstance(message.content, list):
+        # Find the first text block
+        text_block = next((block.text for block in message.content if hasattr(block, 'text')), None)
+        if text_block:
+            logger.debug(f"Claude model returned: '{text_block[:50]}...'")
+            text = text_block
+        else:
+            logger.warning("Claude API returned message content but no text block found.")
+    else:
+        logger.warning(f"Claude API returned unexpected response structure: {message}")
+    if message.stop_reason == "stop_sequence" and message.stop_sequence:
+        text += message.stop_sequence
+
+    return LLMResponse(
+        text=text,
+        model_id=target_model,
+        stop_reason=message.stop_reason,
+        input_tokens=message.usage.input_tokens if message.usage else None,
+        output_tokens=message.usage.output_tokens if message.usage else None,
+        cache_creation_input_tokens=getattr(message.usage, "cache_creation_input_tokens", None),
+        cache_read_input_tokens=getattr(message.usage, "cache_read_input_tokens", None),
+        retry_count=retry_count,
+        latency_ms=latency_ms,
     )
-except Exception as e:
-    logger.error(f"Failed to initialize Anthropic client: {e}")
-    client = None # Set client to None if initialization fails
+
+
+async def _call_upstream(
+    target_model: str,
+    params: Dict[str, Any],
+    estimated_input_tokens: int,
+    stream: bool,
+) -> Tuple[Any, float, Optional[float], int]:
+    """The upstream call with retries. Returns (message, latency_ms, first_token_ms, retries).
+
+    Every attempt (including retries) is routed to the endpoint with the most headroom,
+    so a retry after a 429 normally lands on a different key.
+    """
+    breaker = get_circuit_breaker(target_model)
+    retries = 0
+    failovers = 0
+    while True:
+        try:
+            endpoint = endpoint_pool.pick(estimated_input_tokens)
+            breaker.before_call()
+            endpoint.breaker.before_call() # Cannot fail: pick() only returns available endpoints
+        except CircuitOpenError as e:
+            e.retry_count = retries
+            logger.warning(str(e))
+            raise
+
+        try:
+            # The endpoint's controller gates the call on its concurrency and per-minute quotas
+            async with endpoint.controller.slot(estimated_input_tokens) as ticket:
+                started = time.monotonic() # Timings exclude the wait for a slot
+                try:
+                    if stream:
+                        message, first_token_ms = await endpoint.provider.stream_message(params, started)
+                    else:
+                        message = await endpoint.provider.create_message(params)
+                        first_token_ms = None
+                except anthropic.APIError as e:
+                    if _is_throttling_error(e):
+                        ticket.record_throttle(_retry_after_seconds(e))
+                    raise
+                ticket.record_success(output_tokens=message.usage.output_tokens if message.usage else 0)
+        except asyncio.CancelledError:
+            # No verdict on upstream health, but a half-open probe must not stay in flight forever
+            breaker.release_probe()
+            endpoint.breaker.release_probe()
+            raise
+        except Exception as e:
+            error_class = classify_error(e)
+            endpoint.record_failure(e, error_class)
+            if error_class in CIRCUIT_FAILURE_CLASSES and not _is_connection_failure(e):
+                breaker.record_failure()
+            else:
+                breaker.record_success() # Upstream answered (e.g., 429 or 4xx); it is not unhealthy
+            if endpoint.breaker.state == "open" and failovers < len(endpoint_pool.endpoints()) - 1 and endpoint_pool.has_other_available(endpoint):
+                # The endpoint was just drained (e.g., revoked key); fail over at once without using the retry budget
+                failovers += 1
+                logger.warning(f"LLM endpoint '{endpoint.name}' drained after: {e}. Failing over to another endpoint.")
+                continue
+            if not retry_policy.should_retry(error_class, retries):
+                e.retry_count = retries
+                logger.error(f"Anthropic API call failed after {retries} retries: {e}")
+                raise # Re-raise the exception to be handled by the caller (API route)
+            retry_after = _retry_after_seconds(e)
+            if retry_after and endpoint_pool.has_spare_capacity(endpoint, estimated_input_tokens):
+                retry_after = None # Only this key is throttled; retry elsewhere without waiting it out
+            delay = retry_policy.backoff_delay(retries, retry_after)
+            retries += 1
+            logger.warning(f"Anthropic API call via endpoint '{endpoint.name}' failed ({error_class}): {e}. Retry {retries} in {delay:.1f}s.")
+            await asyncio.sleep(delay)
+            continue
+
+        breaker.record_success()
+        endpoint.record_success(message.usage.output_tokens if message.usage else 0)
+        latency_ms = (time.monotonic() - started) * 1000
+        return message, latency_ms, first_token_ms, retries
+
+
+async def _generate_once(
+    target_model: str,
+    prompt_text: str,
+    source_text: str,
+    max_tokens: int,
+    cache_key: str,
+    use_cache: bool,
+    cache_system_prompt: bool,
+    stop_sequences: Optional[List[str]] = None,
+    stream: bool = False,
+    hedge: bool = False,
+) -> LLMResponse:
+    """Cache lookup, then the upstream call (hedged if requested); stores successful responses in the cache."""
+    # --- Response Cache Lookup --- M
+    if use_cache and settings.llm_cache_enabled:
+        cached_response = await response_cache.get(cache_key)
+        if cached_response is not None:
+            logger.debug(f"LLM cache hit for model '{target_model}' (key {cache_key[:12]})")
+            return cached_response
+    # --- End Response Cache Lookup ---
+
+    logger.debug(f"Calling Claude model '{target_model}' with source text: '{source_text[:50]}...'")
+    estimated_input_tokens = estimate_token_count(prompt_text) + estimate_token_count(source_text)
+    params = build_message_params(prompt_text, source_text, target_model, max_tokens, cache_system_prompt, stop_sequences)
+    call = lambda: _call_upstream(target_model, params, estimated_input_tokens, stream)
+    outcome = None
+    if hedge:
+        (message, latency_ms, first_token_ms, retries), outcome = await request_hedger.run(
+            target_model, call, can_hedge=lambda: endpoint_pool.has_spare_capacity(None, estimated_input_tokens)
+        )
+    else:
+        message, latency_ms, first_token_ms, retries = await call()
+
+    response = message_to_llm_response(message, target_model, retry_count=retries, latency_ms=latency_ms)
+    response.time_to_first_token_ms = first_token_ms
+    if outcome is not None and outcome.hedged:
+        response.hedged = True
+        response.hedge_won = outcome.hedge_won
+        response.hedge_saved_ms = outcome.saved_ms
+    if message.stop_reason == "stop_sequence":
+        response.time_to_stop_sequence_ms = latency_ms
+    if settings.llm_cache_enabled:
+        await response_cache.put(cache_key, response)
+    return response
+
+
+async def _generate_coalesced(
+    target_model: str,
+    prompt_text: str,
+    source_text: str,
+    max_tokens: int,
+    use_cache: bool,
+    cache_system_prompt: bool,
+    stop_sequences: Optional[List[str]],
+    stream: bool,
+    hedge: bool,
+) -> LLMResponse:
+    """One generation at a fixed max_tokens, merged with identical in-flight requests."""
+    cache_key = make_cache_key(target_model, prompt_text, source_text, max_tokens, stop_sequences)
+    if use_cache and settings.llm_single_flight_enabled:
+        # Identical requests already in flight share one upstream call (and one cache lookup)
+        response, shared = await single_flight.do(
+            cache_key,
+            lambda: _generate_once(target_model, prompt_text, source_text, max_tokens, cache_key, use_cache, cache_system_prompt, stop_sequences, stream, hedge)
+        )
+        if shared:
+            logger.debug(f"Coalesced identical in-flight LLM request (key {cache_key[:12]})")
+            response = response.model_copy(update={"coalesced": True})
+        return response
+    return await _generate_once(target_model, prompt_text, source_text, max_tokens, cache_key, use_cache, cache_system_prompt, stop_sequences, stream, hedge)
+
+
+async def generate_with_claude(
+    prompt_text: str,
+    source_text: str,
+    model_id: Optional[str] = None,
+    max_tokens: int = 1024,
+    use_cache: bool = True,
+    cache_system_prompt: bool = False,
+    stop_sequences: Optional[List[str]] = None,
+    stream: bool = False,
+    max_tokens_ceiling: Optional[int] = None,
+    hedge: Optional[bool] = None,
+) -> LLMResponse:
+    """
+    Generates text using the specified Claude model, with retries and a circuit breaker.
+
+    Responses are served from the persistent cache when an identical request
+    (model, system prompt, user prompt, max_tokens) was answered before, and
+    identical requests already in flight are merged into one upstream call.
+    Transient failures (429, 5xx, timeouts) are retried with exponential backoff and
+    jitter, each error class with its own retry budget. While a model's circuit is open
+    calls fail fast with CircuitOpenError. Any exception raised carries a `retry_count`
+    attribute with the number of retries attempted before giving up.
+
+    Args:
+        prompt_text: The system prompt or instructions.
+        source_text: The user input text to be processed.
+        model_id: Optional ID of the Claude model to use (e.g., "claude-3-5-sonnet-20240620"). If None, uses default.
+        max_tokens: The maximum number of tokens to generate.
+        use_cache: If False, skip the cache lookup and request coalescing and always call
+            the model (the fresh response still replaces the cached one). Used for
+            deliberate resampling.
+        cache_system_prompt: Mark the system prompt as cacheable (Anthropic prompt caching).
+            Use when many calls share the same system prompt; cache read/write token
+            counts are reported on the response.
+        stop_sequences: End generation as soon as the model emits one of these. The matched
+            sequence is appended back to the returned text.
+        stream: Stream the response and record time-to-first-token. The returned text is
+            the same as for a non-streaming call.
+        max_tokens_ceiling: If set, a response cut off at max_tokens is requested again
+            with double the budget, up to this ceiling.
+        hedge: Send a duplicate request if the call runs past the model's rolling latency
+            percentile; the first answer wins. None uses settings.llm_hedging_enabled.
+
+    Returns:
+        An LLMResponse with the generated text and call metadata.
+
+    Raises:
+        CircuitOpenError: If the model's circuit is open or every endpoint is drained.
+        anthropic.APIStatusError: If upstream answers with an error status (e.g., 400, or
+            429/5xx once their retries are used up).
+        anthropic.APIConnectionError: If the call times out or the connection fails after
+            all retries (anthropic.APITimeoutError is a subclass).
+    """
+    # --- Determine model to use ---
+    target_model = resolve_model_id(model_id)
+    logger.info(f"Using Claude model: {target_model}") # Log the actual model being used
+    # --- End Determine model ---
+
+    if hedge is None:
+        hedge = settings.llm_hedging_enabled
+    truncation_retries = 0
+    while True:
+        response = await _generate_coalesced(
+            target_model, prompt_text, source_text, max_tokens,
+            use_cache, cache_system_prompt, stop_sequences, stream, hedge
+        )
+        if response.stop_reason != "max_tokens":
+            break
+        # --- Truncation Retry --- M
+        retry = bool(max_tokens_ceiling) and max_tokens < max_tokens_ceiling
+        output_budget.record_truncation(retried=retry)
+        if not retry:
+            logger.warning(f"Response from '{target_model}' truncated at max_tokens={max_tokens}; no larger budget allowed.")
+            break
+        previous = max_tokens
+        max_tokens = min(max_tokens * 2, max_tokens_ceiling)
+        truncation_retries += 1
+        logger.info(f"Response from '{target_model}' truncated at max_tokens={previous}; retrying with {max_tokens}.")
+        # --- End Truncation Retry ---
+    return response.model_copy(update={"max_tokens": max_tokens, "truncation_retries": truncation_retries})
+
 
 async def generate_text_with_claude(
     prompt_text: str,
     source_text: str,
     model_id: Optional[str] = None,
     max_tokens: int = 1024,
+    max_tokens_ceiling: Optional[int] = None,
+    hedge: Optional[bool] = None,
 ) -> str:
     """
     Generates text using the specified Claude model.
@@ -30,75 +366,77 @@ async def generate_text_with_claude(
         source_text: The user input text to be processed.
         model_id: Optional ID of the Claude model to use (e.g., "claude-3-5-sonnet-20240620"). If None, uses default.
         max_tokens: The maximum number of tokens to generate.
+        max_tokens_ceiling: If set, truncated responses are retried with a larger budget up to this.
+        hedge: Hedge slow calls with a duplicate request (None uses settings.llm_hedging_enabled).
 
     Returns:
         The generated text content.
 
     Raises:
-        ValueError: If the Anthropic client is not initialized.
-        anthropic.APIError: If the API call fails.
+        CircuitOpenError: If the model's circuit is open or every endpoint is drained.
+        anthropic.APIStatusError: If upstream answers with an error status (e.g., 400, or
+            429/5xx once their retries are used up).
+        anthropic.APIConnectionError: If the call times out or the connection fails after
+            all retries (anthropic.APITimeoutError is a subclass).
     """
-    if client is None:
-        logger.error("Anthropic client is not initialized. Cannot make API call.")
-        # Depending on policy, could raise specific internal error
-        raise ValueError("Anthropic client failed to initialize.")
+    response = await generate_with_claude(
+        prompt_text, source_text, model_id=model_id, max_tokens=max_tokens, max_tokens_ceiling=max_tokens_ceiling,
+        hedge=hedge
+    )
+    return response.text
 
-    logger.debug(f"Calling Claude model '{model_id}' with source text: '{source_text[:50]}...'")
-    try:
-        # --- Determine model to use ---
-        # Use provided model_id if available, otherwise fall back to a default (e.g., from settings or hardcoded)
-        # For now, let's assume a hardcoded default if model_id is None
-        target_model = model_id if model_id else "claude-3-haiku-20240307" # Example default
-        logger.info(f"Using Claude model: {target_model}") # Log the actual model being used
-        # --- End Determine model ---
-
-        # Note: Anthropic SDK is synchronous by default.
-        # For high throughput, consider httpx for async calls or running sync calls in a thread pool.
-        # For this MVP, a direct synchronous call might be acceptable.
-        message = client.messages.create(
-            model=target_model, # Use the determined model
-            max_tokens=max_tokens,
-            system=prompt_text, # System prompt sets the context/instructions
-            messages=[
-                {
-                    "role": "user",
-                    "content": source_text
-                }
-            ]
-        )
-        # Assuming the response structure gives content in a list
-        if message.content and isinstance(message.content, list):
-            # Find the first text block
-            text_block = next((block.text for block in message.content if hasattr(block, 'text')), None)
-            if text_block:
-                logger.debug(f"Claude model returned: '{text_block[:50]}...'")
-                return text_block
-            else:
-                 logger.warning("Claude API returned message content but no text block found.")
-                 return "" # Or raise an error
+# --- Message Batches --- M
+# Offline path for large evaluations: requests are submitted as Message Batches, which
+# are processed asynchronously upstream at a lower price and outside the per-minute
+# rate limits that gate interactive calls.
+BATCH_ENDED_STATUS = "ended"
+
+
+def message_batches_supported() -> bool:
+    """True if every endpoint's provider can run message batches (submission may go to any of them)."""
+    return all(endpoint.provider.supports_batches for endpoint in endpoint_pool.endpoints())
+
+
+async def submit_message_batch(requests: List[Dict[str, Any]]) -> Tuple[str, str]:
+    """Submits a message batch; each request is {"custom_id": ..., "params": build_message_params(...)}.
+
+    Returns (batch id, endpoint name). Batches are scoped to the API key that submitted them,
+    so callers persist both and pass the name to every later call for that batch.
+    """
+    endpoint = endpoint_pool.pick()
+    batch_id = await endpoint.provider.submit_batch(requests)
+    logger.info(f"Submitted message batch {batch_id} with {len(requests)} requests via endpoint '{endpoint.name}'.")
+    return batch_id, endpoint.name
+
+
+async def get_message_batch_status(batch_id: str, endpoint_name: str) -> Tuple[str, Dict[str, int]]:
+    """Returns (processing_status, request_counts) for a batch."""
+    return await endpoint_pool.endpoint_named(endpoint_name).provider.get_batch_status(batch_id)
+
+
+async def cancel_message_batch(batch_id: str, endpoint_name: str):
+    """Asks upstream to stop a batch; requests it has not processed yet end as canceled."""
+    await endpoint_pool.endpoint_named(endpoint_name).provider.cancel_batch(batch_id)
+    logger.info(f"Requested cancellation of message batch {batch_id}.")
+
+
+async def iter_message_batch_results(
+    batch_id: str,
+    endpoint_name: str,
+    model_ids: Dict[str, str],
+) -> AsyncIterator[Tuple[str, Optional[LLMResponse], Optional[str]]]:
+    """Streams the results of an ended batch as (custom_id, response, error) tuples.
+
+    Exactly one of response and error is set. `model_ids` maps custom_id to the model
+    the request was sent to, for the LLMResponse.
+    """
+    async for entry in endpoint_pool.endpoint_named(endpoint_name).provider.iter_batch_results(batch_id):
+        result = entry.result
+        if result.type == "succeeded":
+            target_model = model_ids.get(entry.custom_id, result.message.model)
+            yield entry.custom_id, message_to_llm_response(result.message, target_model, retry_count=0), None
+        elif result.type == "errored":
+            yield entry.custom_id, None, f"Batch request errored: {result.error.error.message}"
         else:
-            logger.warning(f"Claude API returned unexpected response structure: {message}")
-            return "" # Or raise an error
-
-    except anthropic.APIError as e:
-        logger.error(f"Anthropic API call failed: {e}")
-        raise # Re-raise the exception to be handled by the caller (API route)
-    except Exception as e:
-        # Catch other potential exceptions during the call
-        logger.error(f"An unexpected error occurred during Claude API call: {e}")
-        raise anthropic.APIError(f"Unexpected error: {e}") # Wrap as APIError for consistent handling
-
-# --- Placeholder for Abstract Base Service (Future Enhancement) ---
-# from abc import ABC, abstractmethod
-#
-# class LanguageModelService(ABC):
-#     @abstractmethod
-#     async def generate(self, prompt_text: str, source_text: str) -> str:
-#         pass
-#
-# class ClaudeService(LanguageModelService):
-#     async def generate(self, prompt_text: str, source_text: str) -> str:
-#         # Current implementation uses sync call, ideally make async or use thread pool
-#         return await generate_text_with_claude(prompt_text, source_text)
-#
-# # You could then inject the appropriate service based on configuration 
\ No newline at end of file
+            yield entry.custom_id, None, f"Batch request {result.type}."
+# --- End Message Batches ---
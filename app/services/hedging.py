@@ -0,0 +1,165 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class HedgeOutcome:
+    """What hedging did for one call."""
+
+    def __init__(self, hedged: bool = False, hedge_won: bool = False, saved_ms: Optional[float] = None):
+        self.hedged = hedged # A duplicate request was sent
+        self.hedge_won = hedge_won # The duplicate answered first
+        self.saved_ms = saved_ms # Estimated wall-clock time saved (0 if the original won)
+
+
+class _ModelLatencies:
+    def __init__(self):
+        self.samples: deque = deque(maxlen=settings.llm_hedge_latency_samples)
+        self.calls = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.saved_ms = 0.0
+
+
+class RequestHedger:
+    """Sends a duplicate of a slow LLM call and keeps whichever answers first.
+
+    Each model keeps a rolling window of call latencies. A call still running after
+    that model's llm_hedge_percentile latency (at least llm_hedge_min_delay_seconds)
+    gets a second, identical call; the first to succeed wins and the other is
+    cancelled. Hedges are limited to llm_hedge_budget_fraction of the model's calls
+    and are only sent while some endpoint has spare capacity, so hedging never
+    queues behind the traffic it is trying to get ahead of.
+
+    Time saved by a winning hedge is estimated from the mean of recent latencies
+    above the hedge delay (what the original call would likely have taken).
+    """
+
+    def __init__(self):
+        self._models: Dict[str, _ModelLatencies] = {}
+
+    def _stats(self, model_id: str) -> _ModelLatencies:
+        stats = self._models.get(model_id)
+        if stats is None:
+            stats = self._models[model_id] = _ModelLatencies()
+        return stats
+
+    def hedge_delay(self, model_id: str) -> Optional[float]:
+        """Seconds to wait before hedging a call to this model, or None while there is too little history."""
+        samples = self._stats(model_id).samples
+        if len(samples) < settings.llm_hedge_min_samples:
+            return None
+        ordered = sorted(samples)
+        percentile = ordered[min(len(ordered) - 1, int(settings.llm_hedge_percentile * len(ordered)))]
+        return max(settings.llm_hedge_min_delay_seconds, percentile)
+
+    def _tail_mean(self, stats: _ModelLatencies, delay: float) -> Optional[float]:
+        tail = [s for s in stats.samples if s > delay]
+        return sum(tail) / len(tail) if tail else None
+
+    def _within_budget(self, stats: _ModelLatencies) -> bool:
+        return stats.hedges + 1 <= settings.llm_hedge_budget_fraction * stats.calls
+
+    async def run(
+        self,
+        model_id: str,
+        call: Callable[[], Awaitable[Any]],
+        can_hedge: Callable[[], bool] = lambda: True,
+    ) -> Tuple[Any, HedgeOutcome]:
+        """Runs call(), hedging it with a second call() if it is slow.
+
+        `can_hedge` is checked at hedge time (e.g., spare upstream capacity).
+        Returns (result, outcome). If both calls fail, the original call's error is raised.
+        """
+        stats = self._stats(model_id)
+        stats.calls += 1
+        delay = self.hedge_delay(model_id)
+        started = time.monotonic()
+        primary = asyncio.ensure_future(call())
+        try:
+            if delay is None:
+                result = await primary
+                stats.samples.append(time.monotonic() - started)
+                return result, HedgeOutcome()
+
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if done or not self._within_budget(stats) or not can_hedge():
+                result = await primary
+                stats.samples.append(time.monotonic() - started)
+                return result, HedgeOutcome()
+
+            # --- Hedge --- M
+            stats.hedges += 1
+            hedge_started = time.monotonic()
+            hedge = asyncio.ensure_future(call())
+            logger.debug(f"Hedging call to '{model_id}' after {delay:.2f}s")
+            pending = {primary, hedge}
+            primary_error: Optional[BaseException] = None
+            try:
+                while pending:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    # Prefer the original if both finished in the same tick
+                    for task in sorted(done, key=lambda t: t is not primary):
+                        if task.exception() is None:
+                            return task.result(), self._record_win(stats, delay, started, hedge_started, task is hedge)
+                        if task is primary:
+                            primary_error = task.exception()
+                raise primary_error or hedge.exception()
+            finally:
+                for task in pending:
+                    task.cancel()
+            # --- End Hedge ---
+        finally:
+            if not primary.done():
+                primary.cancel() # Caller was cancelled
+
+    def _record_win(
+        self,
+        stats: _ModelLatencies,
+        delay: float,
+        started: float,
+        hedge_started: float,
+        hedge_won: bool,
+    ) -> HedgeOutcome:
+        now = time.monotonic()
+        if not hedge_won:
+            stats.samples.append(now - started)
+            return HedgeOutcome(hedged=True, hedge_won=False, saved_ms=0.0)
+        stats.hedge_wins += 1
+        tail_mean = self._tail_mean(stats, delay)
+        # The cancelled original ran at least this long; keep it so the tail stays visible
+        stats.samples.append(now - started)
+        stats.samples.append(now - hedge_started)
+        saved_ms = max(0.0, (tail_mean - (now - started)) * 1000) if tail_mean is not None else None
+        if saved_ms:
+            stats.saved_ms += saved_ms
+        return HedgeOutcome(hedged=True, hedge_won=True, saved_ms=saved_ms)
+
+    def snapshot(self) -> Dict[str, Any]:
+        models = {}
+        for model_id, stats in self._models.items():
+            delay = self.hedge_delay(model_id)
+            models[model_id] = {
+                "hedge_delay_seconds": round(delay, 3) if delay is not None else None,
+                "samples": len(stats.samples),
+                "calls": stats.calls,
+                "hedges": stats.hedges,
+                "hedge_wins": stats.hedge_wins,
+                "hedge_rate": round(stats.hedges / stats.calls, 4) if stats.calls else 0.0,
+                "estimated_saved_seconds": round(stats.saved_ms / 1000, 1),
+            }
+        return {
+            "enabled": settings.llm_hedging_enabled,
+            "percentile": settings.llm_hedge_percentile,
+            "budget_fraction": settings.llm_hedge_budget_fraction,
+            "models": models,
+        }
+
+
+request_hedger = RequestHedger()
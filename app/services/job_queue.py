@@ -0,0 +1,256 @@
+import logging
+import uuid
+from datetime import datetime, timedelta
+from typing import Optional, Dict, Any, List
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ASCENDING, ReturnDocument
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+JOBS_COLLECTION = "jobs"
+
+# Job kinds
+EVALUATION_ITEMS_JOB = "evaluation_items" # One prompt over a range of test items
+EVALUATION_BATCH_JOB = "evaluation_batch" # A whole evaluation through message batches
+LLM_JUDGING_JOB = "llm_judging" # Judge every result of an evaluation
+
+# Claim order: priority class, then fair-share start tag, then the cheapest job (fields set by scheduler.tag).
+# Jobs without scheduling fields sort first.
+CLAIM_ORDER = [("priority_rank", ASCENDING), ("start_tag", ASCENDING), ("est_tokens", ASCENDING), ("available_at", ASCENDING), ("_id", ASCENDING)]
+
+# Job states
+JOB_QUEUED = "queued"
+JOB_LEASED = "leased"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+
+
+class JobQueue:
+    """Durable work queue stored in MongoDB.
+
+    A worker claims a job with one findAndModify that sets a lease (a fresh lease_id
+    and lease_expires_at = now + job_lease_seconds) and must renew it with heartbeats
+    while it runs. A job whose lease expires (worker crashed, restarted or lost its
+    connection) is claimable again, so lost work is requeued without a separate
+    sweeper. Completion, failure and heartbeats only apply while the caller still
+    holds the lease, so a job is finished at most once even if two workers ran it.
+
+    Cancelling drops queued jobs at once and flags leased ones (cancel_requested);
+    the worker running a flagged job notices within job_cancel_poll_interval_seconds,
+    stops it and marks it cancelled. A flagged job is never claimed or requeued.
+    """
+
+    async def ensure_indexes(self, db: AsyncIOMotorDatabase):
+        """Creates the claim and retention indexes (called on startup)."""
+        try:
+            collection = db[JOBS_COLLECTION]
+            await collection.create_index(
+                [("status", ASCENDING), ("kind", ASCENDING), ("available_at", ASCENDING)],
+                name="claim_order",
+            )
+            await collection.create_index(
+                [("status", ASCENDING), ("kind", ASCENDING), *CLAIM_ORDER[:3]],
+                name="fair_share_order",
+            )
+            await collection.create_index([("evaluation_id", ASCENDING)], name="evaluation_id")
+            await collection.create_index(
+                [("finished_at", ASCENDING)],
+                expireAfterSeconds=settings.job_retention_seconds,
+                name="finished_ttl",
+            )
+        except Exception as e:
+            logger.warning(f"Could not create job queue indexes: {e}")
+
+    async def enqueue(self, db: AsyncIOMotorDatabase, kind: str, payloads: List[Dict[str, Any]]) -> List[Any]:
+        """Adds one job of `kind` per payload; payload fields are stored on the job document."""
+        if not payloads:
+            return []
+        now = datetime.utcnow()
+        docs = [
+            {
+                **payload,
+                "kind": kind,
+                "status": JOB_QUEUED,
+                "attempts": 0,
+                "available_at": now,
+                "created_at": now,
+                "updated_at": now,
+            }
+            for payload in payloads
+        ]
+        result = await db[JOBS_COLLECTION].insert_many(docs)
+        logger.info(f"Enqueued {len(docs)} '{kind}' jobs.")
+        return result.inserted_ids
+
+    async def claim(self, db: AsyncIOMotorDatabase, worker_id: str, kinds: List[str]) -> Optional[Dict[str, Any]]:
+        """Leases the next available job (queued, or leased with an expired lease) in CLAIM_ORDER. Returns None if there is none."""
+        now = datetime.utcnow()
+        return await db[JOBS_COLLECTION].find_one_and_update(
+            {
+                "kind": {"$in": kinds},
+                "cancel_requested": {"$ne": True},
+                "$or": [
+                    {"status": JOB_QUEUED, "available_at": {"$lte": now}},
+                    {"status": JOB_LEASED, "lease_expires_at": {"$lte": now}}, # Lost lease
+                ],
+            },
+            {
+                "$set": {
+                    "status": JOB_LEASED,
+                    "lease_id": uuid.uuid4().hex,
+                    "lease_owner": worker_id,
+                    "lease_expires_at": now + timedelta(seconds=settings.job_lease_seconds),
+                    "heartbeat_at": now,
+                    "updated_at": now,
+                },
+                "$inc": {"attempts": 1},
+                "$min": {"first_claimed_at": now}, # Queue wait = first_claimed_at - created_at
+            },
+            sort=CLAIM_ORDER,
+            return_document=ReturnDocument.AFTER,
+        )
+
+    def _leased(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        return {"_id": job["_id"], "status": JOB_LEASED, "lease_id": job["lease_id"]}
+
+    async def heartbeat(self, db: AsyncIOMotorDatabase, job: Dict[str, Any]) -> bool:
+        """Renews the lease. Returns False if it was lost (expired and claimed by another worker)."""
+        now = datetime.utcnow()
+        result = await db[JOBS_COLLECTION].update_one(
+            self._leased(job),
+            {"$set": {
+                "lease_expires_at": now + timedelta(seconds=settings.job_lease_seconds),
+                "heartbeat_at": now,
+            }},
+        )
+        return result.matched_count == 1
+
+    async def complete(self, db: AsyncIOMotorDatabase, job: Dict[str, Any]) -> bool:
+        """Marks the job done. Returns False if the lease was lost (another worker owns the job now)."""
+        now = datetime.utcnow()
+        result = await db[JOBS_COLLECTION].update_one(
+            self._leased(job),
+            {"$set": {"status": JOB_DONE, "finished_at": now, "updated_at": now}, "$unset": {"lease_expires_at": ""}},
+        )
+        return result.matched_count == 1
+
+    async def fail(self, db: AsyncIOMotorDatabase, job: Dict[str, Any], error: str) -> Optional[str]:
+        """Records a failed run: requeues the job with a delay, or marks it failed after job_max_attempts.
+
+        Returns the new status, or None if the lease was lost.
+        """
+        if await self.finish_cancelled(db, job):
+            return JOB_CANCELLED
+        now = datetime.utcnow()
+        if job.get("attempts", 0) < settings.job_max_attempts:
+            update = {"$set": {
+                "status": JOB_QUEUED,
+                "available_at": now + timedelta(seconds=settings.job_retry_delay_seconds),
+                "last_error": error,
+                "updated_at": now,
+            }}
+            new_status = JOB_QUEUED
+        else:
+            update = {"$set": {"status": JOB_FAILED, "last_error": error, "finished_at": now, "updated_at": now}}
+            new_status = JOB_FAILED
+        update["$unset"] = {"lease_expires_at": ""}
+        result = await db[JOBS_COLLECTION].update_one(self._leased(job), update)
+        return new_status if result.matched_count == 1 else None
+
+    async def release(self, db: AsyncIOMotorDatabase, job: Dict[str, Any]):
+        """Returns a job to the queue without counting the attempt (worker shutting down)."""
+        if await self.finish_cancelled(db, job):
+            return
+        now = datetime.utcnow()
+        await db[JOBS_COLLECTION].update_one(
+            self._leased(job),
+            {
+                "$set": {"status": JOB_QUEUED, "available_at": now, "updated_at": now},
+                "$unset": {"lease_expires_at": ""},
+                "$inc": {"attempts": -1},
+            },
+        )
+
+    async def cancel(self, db: AsyncIOMotorDatabase, evaluation_id: Any, kinds: List[str], reason: str) -> Dict[str, int]:
+        """Cancels an evaluation's unfinished jobs: queued ones (and lost leases) now, running ones via cancel_requested."""
+        now = datetime.utcnow()
+        collection = db[JOBS_COLLECTION]
+        dropped = await collection.update_many(
+            {
+                "evaluation_id": evaluation_id,
+                "kind": {"$in": kinds},
+                "$or": [
+                    {"status": JOB_QUEUED},
+                    {"status": JOB_LEASED, "lease_expires_at": {"$lte": now}},
+                ],
+            },
+            {"$set": {"status": JOB_CANCELLED, "last_error": reason, "finished_at": now, "updated_at": now}, "$unset": {"lease_expires_at": ""}},
+        )
+        flagged = await collection.update_many(
+            {"evaluation_id": evaluation_id, "kind": {"$in": kinds}, "status": JOB_LEASED},
+            {"$set": {"cancel_requested": True, "last_error": reason, "updated_at": now}},
+        )
+        return {"dropped": dropped.modified_count, "stopping": flagged.modified_count}
+
+    async def cancel_requested(self, db: AsyncIOMotorDatabase, job_ids: List[Any]) -> List[Any]:
+        """The ids among `job_ids` whose cancellation was requested."""
+        if not job_ids:
+            return []
+        return await db[JOBS_COLLECTION].distinct("_id", {"_id": {"$in": job_ids}, "cancel_requested": True})
+
+    async def finish_cancelled(self, db: AsyncIOMotorDatabase, job: Dict[str, Any]) -> bool:
+        """Marks a leased job whose cancellation was requested as cancelled. Returns False if it was not flagged (or the lease was lost)."""
+        now = datetime.utcnow()
+        result = await db[JOBS_COLLECTION].update_one(
+            {**self._leased(job), "cancel_requested": True},
+            {"$set": {"status": JOB_CANCELLED, "finished_at": now, "updated_at": now}, "$unset": {"lease_expires_at": ""}},
+        )
+        return result.matched_count == 1
+
+    async def count_active(self, db: AsyncIOMotorDatabase, evaluation_id: Any, kinds: List[str]) -> int:
+        """Jobs of an evaluation that are queued or running under a live lease."""
+        return await db[JOBS_COLLECTION].count_documents({
+            "evaluation_id": evaluation_id,
+            "kind": {"$in": kinds},
+            "$or": [
+                {"status": JOB_QUEUED},
+                {"status": JOB_LEASED, "lease_expires_at": {"$gt": datetime.utcnow()}},
+            ],
+        })
+
+    async def count_unfinished(self, db: AsyncIOMotorDatabase, evaluation_id: Any, kinds: List[str]) -> int:
+        """Jobs of an evaluation that a worker will still run: queued, or leased (a lost lease is reclaimed)."""
+        return await db[JOBS_COLLECTION].count_documents({
+            "evaluation_id": evaluation_id,
+            "kind": {"$in": kinds},
+            "status": {"$in": [JOB_QUEUED, JOB_LEASED]},
+        })
+
+    async def abandon_stranded(self, db: AsyncIOMotorDatabase, evaluation_id: Any, kinds: List[str], reason: str) -> int:
+        """Marks an evaluation's jobs with expired leases as failed so no worker reclaims them."""
+        now = datetime.utcnow()
+        result = await db[JOBS_COLLECTION].update_many(
+            {"evaluation_id": evaluation_id, "kind": {"$in": kinds}, "status": JOB_LEASED, "lease_expires_at": {"$lte": now}},
+            {"$set": {"status": JOB_FAILED, "last_error": reason, "finished_at": now, "updated_at": now}, "$unset": {"lease_expires_at": ""}},
+        )
+        return result.modified_count
+
+    async def snapshot(self, db: AsyncIOMotorDatabase) -> Dict[str, Any]:
+        """Job counts by kind and status, plus leases that have expired and wait to be reclaimed."""
+        counts: Dict[str, Dict[str, int]] = {}
+        async for row in db[JOBS_COLLECTION].aggregate([
+            {"$group": {"_id": {"kind": "$kind", "status": "$status"}, "count": {"$sum": 1}}}
+        ]):
+            counts.setdefault(row["_id"]["kind"], {})[row["_id"]["status"]] = row["count"]
+        expired_leases = await db[JOBS_COLLECTION].count_documents(
+            {"status": JOB_LEASED, "lease_expires_at": {"$lte": datetime.utcnow()}}
+        )
+        workers = await db[JOBS_COLLECTION].distinct("lease_owner", {"status": JOB_LEASED})
+        return {"jobs": counts, "expired_leases": expired_leases, "active_workers": sorted(w for w in workers if w)}
+
+
+job_queue = JobQueue()
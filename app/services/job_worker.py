@@ -0,0 +1,185 @@
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from typing import Any, Awaitable, Callable, Dict, NamedTuple, Optional
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from app.core.config import settings
+from app.services.job_queue import JOB_CANCELLED, JOB_FAILED, job_queue
+from app.services.scheduler import scheduler
+
+logger = logging.getLogger(__name__)
+
+
+class JobHandler(NamedTuple):
+    """How a worker runs one job kind."""
+    run: Callable[[AsyncIOMotorDatabase, Dict[str, Any]], Awaitable[None]]
+    # Called once when the job reaches a final state: error is None when done, the last error when failed
+    on_finished: Optional[Callable[[AsyncIOMotorDatabase, Dict[str, Any], Optional[str]], Awaitable[None]]] = None
+
+
+class JobWorker:
+    """Claims jobs from the queue and runs them, renewing each job's lease while it runs.
+
+    Up to `concurrency` jobs run at once. If a heartbeat finds the lease lost (it
+    expired and another worker claimed the job) the local run is cancelled. A job
+    flagged with cancel_requested is stopped the same way and marked cancelled. On
+    shutdown running jobs are cancelled and released back to the queue.
+    """
+
+    def __init__(
+        self,
+        db: AsyncIOMotorDatabase,
+        handlers: Dict[str, JobHandler],
+        concurrency: Optional[int] = None,
+        worker_id: Optional[str] = None,
+    ):
+        self.db = db
+        self.handlers = handlers
+        self.concurrency = max(1, concurrency or settings.job_worker_concurrency)
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._stopping = asyncio.Event()
+        self._running: Dict[Any, asyncio.Task] = {} # job _id -> handler task
+        # Counters
+        self.completed = 0
+        self.failed = 0
+        self.lost_leases = 0
+        self.cancelled = 0
+
+    def stop(self):
+        self._stopping.set()
+
+    async def run(self):
+        """Runs the claim loops until stop() is called."""
+        logger.info(f"Job worker {self.worker_id} started ({self.concurrency} slots, kinds {sorted(self.handlers)})")
+        loops = [asyncio.ensure_future(self._loop()) for _ in range(self.concurrency)]
+        loops.append(asyncio.ensure_future(self._watch_cancellations()))
+        try:
+            await self._stopping.wait()
+        finally:
+            for loop in loops:
+                loop.cancel()
+            await asyncio.gather(*loops, return_exceptions=True)
+            logger.info(f"Job worker {self.worker_id} stopped (completed {self.completed}, failed {self.failed}, cancelled {self.cancelled}, lost leases {self.lost_leases})")
+
+    async def _loop(self):
+        kinds = list(self.handlers)
+        while not self._stopping.is_set():
+            try:
+                job = await job_queue.claim(self.db, self.worker_id, kinds)
+            except Exception as e:
+                logger.warning(f"Job worker {self.worker_id}: claim failed: {e}")
+                job = None
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), timeout=settings.job_worker_poll_interval_seconds)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await scheduler.advance(self.db, job)
+            await self._execute(job)
+
+    async def _watch_cancellations(self):
+        """Stops running jobs whose cancellation was requested (one query per interval for all of them)."""
+        while not self._stopping.is_set():
+            await asyncio.sleep(settings.job_cancel_poll_interval_seconds)
+            try:
+                job_ids = await job_queue.cancel_requested(self.db, list(self._running))
+            except Exception as e:
+                logger.warning(f"Job worker {self.worker_id}: cancellation check failed: {e}")
+                continue
+            for job_id in job_ids:
+                task = self._running.get(job_id)
+                if task is not None and not task.done():
+                    logger.info(f"Job worker {self.worker_id}: cancelling job {job_id} on request")
+                    task.cancel()
+
+    async def _execute(self, job: Dict[str, Any]):
+        handler = self.handlers[job["kind"]]
+        label = f"job {job['_id']} ({job['kind']}, attempt {job['attempts']})"
+        if job["attempts"] > settings.job_max_attempts:
+            # Only reachable through lost leases: every run of this job died without reporting back
+            await self._finish_failed(handler, job, f"Lease lost {job['attempts'] - 1} times; giving up.")
+            return
+
+        logger.info(f"Job worker {self.worker_id}: running {label}")
+        task = asyncio.ensure_future(handler.run(self.db, job))
+        self._running[job["_id"]] = task
+        try:
+            while True:
+                done, _ = await asyncio.wait({task}, timeout=settings.job_heartbeat_interval_seconds)
+                if done:
+                    break
+                try:
+                    still_leased = await job_queue.heartbeat(self.db, job)
+                except Exception as e:
+                    logger.warning(f"Job worker {self.worker_id}: heartbeat for {label} failed: {e}")
+                    continue # Keep working; the lease may still be renewed by the next heartbeat
+                if not still_leased:
+                    self.lost_leases += 1
+                    logger.warning(f"Job worker {self.worker_id}: lease on {label} was lost; abandoning the run.")
+                    task.cancel()
+                    await asyncio.gather(task, return_exceptions=True)
+                    return
+        except asyncio.CancelledError:
+            # Worker shutting down: stop the run and hand the job straight back to the queue
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            await asyncio.shield(job_queue.release(self.db, job))
+            logger.info(f"Job worker {self.worker_id}: released {label} on shutdown")
+            raise
+        finally:
+            self._running.pop(job["_id"], None)
+
+        if task.cancelled():
+            # Stopped by _watch_cancellations; fail() also settles a flagged job as cancelled
+            if await job_queue.fail(self.db, job, "Run was cancelled.") == JOB_CANCELLED:
+                self.cancelled += 1
+                logger.info(f"Job worker {self.worker_id}: cancelled {label}")
+            return
+
+        error = task.exception()
+        if error is None:
+            if await job_queue.complete(self.db, job):
+                self.completed += 1
+                logger.info(f"Job worker {self.worker_id}: finished {label}")
+                await self._notify_finished(handler, job, None)
+            else:
+                self.lost_leases += 1
+                logger.warning(f"Job worker {self.worker_id}: finished {label} after its lease was lost; result left to the new owner.")
+            return
+
+        logger.error(f"Job worker {self.worker_id}: {label} failed: {error}", exc_info=error)
+        new_status = await job_queue.fail(self.db, job, str(error))
+        if new_status == JOB_FAILED:
+            self.failed += 1
+            await self._notify_finished(handler, job, str(error))
+        elif new_status == JOB_CANCELLED:
+            self.cancelled += 1
+
+    async def _finish_failed(self, handler: JobHandler, job: Dict[str, Any], error: str):
+        if await job_queue.fail(self.db, job, error) == JOB_FAILED:
+            self.failed += 1
+            logger.error(f"Job worker {self.worker_id}: job {job['_id']} ({job['kind']}) failed: {error}")
+            await self._notify_finished(handler, job, error)
+
+    async def _notify_finished(self, handler: JobHandler, job: Dict[str, Any], error: Optional[str]):
+        if handler.on_finished is None:
+            return
+        try:
+            await handler.on_finished(self.db, job, error)
+        except Exception as e:
+            logger.error(f"Job worker {self.worker_id}: completion hook for job {job['_id']} failed: {e}", exc_info=True)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "worker_id": self.worker_id,
+            "concurrency": self.concurrency,
+            "completed": self.completed,
+            "failed": self.failed,
+            "cancelled": self.cancelled,
+            "lost_leases": self.lost_leases,
+        }
@@ -2,6 +2,7 @@ import logging
 import json
 from typing import Optional, Dict, Any
 
+from app.core.config import settings
 from app.services.claude_service import generate_text_with_claude # Reuse existing Claude service
 
 logger = logging.getLogger(__name__)
@@ -104,7 +105,9 @@ async def evaluate_translation(
         raw_output = await generate_text_with_claude(
             prompt_text=system_prompt, 
             source_text=formatted_prompt, # Main content goes here
-            model_id=judge_model_id
+            model_id=judge_model_id,
+            max_tokens=settings.llm_judge_max_tokens,
+            max_tokens_ceiling=settings.llm_output_max_tokens
         )
         logger.debug(f'Raw response from Judge LLM: {raw_output}')
 
@@ -0,0 +1,151 @@
+import hashlib
+import json
+import logging
+from datetime import datetime
+from typing import Optional, Dict, Any, List
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ASCENDING, ReturnDocument
+
+from app.core.config import settings
+from app.db.client import mongo_db
+from app.models.llm import LLMResponse
+
+logger = logging.getLogger(__name__)
+
+LLM_CACHE_COLLECTION = "llm_response_cache"
+
+
+def make_cache_key(
+    model_id: str,
+    system_prompt: str,
+    user_prompt: str,
+    max_tokens: int,
+    stop_sequences: Optional[List[str]] = None,
+) -> str:
+    """Content address of an LLM request: SHA-256 over (model, system, user, max_tokens[, stop_sequences])."""
+    request = [model_id, system_prompt, user_prompt, max_tokens]
+    if stop_sequences:
+        request.append(list(stop_sequences)) # Only when set, so existing keys stay valid
+    payload = json.dumps(request, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """Persistent LLM response cache stored in MongoDB.
+
+    Entries expire through a TTL index on `last_accessed_at`, which every hit refreshes,
+    so rarely used entries age out first. A size cap evicts the least recently used
+    entries once the collection grows past `llm_cache_max_entries`. Cache failures are
+    logged and treated as misses; they never fail the LLM call.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self.saved_seconds = 0.0
+        self.saved_output_tokens = 0
+        self._writes_since_trim = 0
+
+    def _collection(self):
+        return mongo_db.db[LLM_CACHE_COLLECTION] if mongo_db.db is not None else None
+
+    async def ensure_indexes(self, db: AsyncIOMotorDatabase):
+        """Creates the sliding TTL index (called on startup)."""
+        try:
+            await db[LLM_CACHE_COLLECTION].create_index(
+                [("last_accessed_at", ASCENDING)],
+                expireAfterSeconds=settings.llm_cache_ttl_seconds,
+                name="last_accessed_ttl",
+            )
+        except Exception as e:
+            logger.warning(f"Could not create LLM cache TTL index: {e}")
+
+    async def get(self, key: str) -> Optional[LLMResponse]:
+        collection = self._collection()
+        if collection is None:
+            return None
+        try:
+            doc = await collection.find_one_and_update(
+                {"_id": key},
+                {"$set": {"last_accessed_at": datetime.utcnow()}, "$inc": {"hit_count": 1}},
+                return_document=ReturnDocument.AFTER,
+            )
+        except Exception as e:
+            logger.warning(f"LLM cache lookup failed, treating as miss: {e}")
+            doc = None
+        if not doc:
+            self.misses += 1
+            return None
+        self.hits += 1
+        response = LLMResponse.model_validate(doc["response"])
+        self.saved_seconds += (response.latency_ms or 0) / 1000
+        self.saved_output_tokens += response.output_tokens or 0
+        # No API call was made, so no retries, prompt-cache tokens or stream timings to report
+        return response.model_copy(update={
+            "cached": True,
+            "retry_count": 0,
+            "cache_creation_input_tokens": None,
+            "cache_read_input_tokens": None,
+            "time_to_first_token_ms": None,
+            "time_to_stop_sequence_ms": None,
+        })
+
+    async def put(self, key: str, response: LLMResponse):
+        collection = self._collection()
+        if collection is None:
+            return
+        if len(response.text.encode("utf-8")) > settings.llm_cache_max_entry_bytes:
+            return # Oversized responses are not worth the working-set cost
+        now = datetime.utcnow()
+        try:
+            await collection.update_one(
+                {"_id": key},
+                {
+                    "$set": {
+                        "model_id": response.model_id,
+                        "response": response.model_dump(exclude={"cached", "coalesced", "retry_count", "truncation_retries", "hedged", "hedge_won", "hedge_saved_ms"}),
+                        "last_accessed_at": now,
+                    },
+                    "$setOnInsert": {"created_at": now, "hit_count": 0},
+                },
+                upsert=True,
+            )
+            self.writes += 1
+            self._writes_since_trim += 1
+            if self._writes_since_trim >= settings.llm_cache_trim_interval_writes:
+                self._writes_since_trim = 0
+                await self._enforce_size_cap(collection)
+        except Exception as e:
+            logger.warning(f"LLM cache write failed: {e}")
+
+    async def _enforce_size_cap(self, collection):
+        """Evicts least recently used entries beyond llm_cache_max_entries."""
+        excess = await collection.estimated_document_count() - settings.llm_cache_max_entries
+        if excess <= 0:
+            return
+        oldest = collection.find({}, {"_id": 1}).sort("last_accessed_at", ASCENDING).limit(excess)
+        ids = [doc["_id"] async for doc in oldest]
+        if ids:
+            result = await collection.delete_many({"_id": {"$in": ids}})
+            self.evictions += result.deleted_count
+            logger.info(f"LLM cache evicted {result.deleted_count} least recently used entries.")
+
+    def snapshot(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": settings.llm_cache_enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            "writes": self.writes,
+            "evictions": self.evictions,
+            "saved_api_calls": self.hits,
+            "saved_seconds": round(self.saved_seconds, 2),
+            "saved_output_tokens": self.saved_output_tokens,
+        }
+
+
+response_cache = LLMResponseCache()
@@ -0,0 +1,136 @@
+import itertools
+import logging
+from typing import Optional, Dict, Any, List
+
+import anthropic
+
+from app.core.config import AnthropicEndpointConfig, settings
+from app.services.llm_providers import LanguageModelProvider, create_provider
+from app.services.llm_resilience import CircuitBreaker, CircuitOpenError, CIRCUIT_FAILURE_CLASSES
+from app.services.rate_controller import AdaptiveConcurrencyController
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ENDPOINT_NAME = "default"
+CREDENTIAL_ERROR_STATUSES = (401, 403) # The key itself is bad: drain the endpoint at once
+
+
+class LLMEndpoint:
+    """One API key / base URL: its provider, its own rate controller and a health breaker."""
+
+    def __init__(self, config: AnthropicEndpointConfig):
+        self.name = config.name
+        self.provider: LanguageModelProvider = create_provider(config)
+        self.controller = AdaptiveConcurrencyController.from_settings(
+            requests_per_minute=config.requests_per_minute,
+            input_tokens_per_minute=config.input_tokens_per_minute,
+            output_tokens_per_minute=config.output_tokens_per_minute,
+            max_concurrency=config.max_concurrency,
+        )
+        self.breaker = CircuitBreaker(
+            f"endpoint:{config.name}",
+            failure_threshold=settings.llm_endpoint_failure_threshold,
+            reset_timeout_seconds=settings.llm_endpoint_drain_seconds,
+        )
+        # Lifetime counters
+        self.successes = 0
+        self.failures = 0
+        self.output_tokens = 0
+
+    def record_success(self, output_tokens: int):
+        self.successes += 1
+        self.output_tokens += output_tokens or 0
+        self.breaker.record_success()
+
+    def record_failure(self, error: BaseException, error_class: Optional[str]):
+        self.failures += 1
+        if isinstance(error, anthropic.APIStatusError) and error.status_code in CREDENTIAL_ERROR_STATUSES:
+            self.breaker.trip(f"credentials rejected ({error.status_code})")
+        elif error_class in CIRCUIT_FAILURE_CLASSES:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success() # It answered (e.g., 429 or a 4xx for this request); it is healthy
+
+    def snapshot(self) -> Dict[str, Any]:
+        limits = self.controller.snapshot()
+        return {
+            "health": self.breaker.snapshot(),
+            "successes": self.successes,
+            "failures": self.failures,
+            "output_tokens": self.output_tokens,
+            "requests_last_minute": limits["requests_last_minute"],
+            "output_tokens_last_minute": limits["output_tokens_last_minute"],
+            "concurrency_limit": limits["concurrency_limit"],
+            "in_flight": limits["in_flight"],
+            "throttled": limits["total_throttled"],
+            "provider": self.provider.snapshot(),
+        }
+
+
+class EndpointPool:
+    """Routes each LLM call to the healthy endpoint with the most headroom.
+
+    Endpoints come from settings.anthropic_endpoints (or a single default endpoint).
+    Headroom is the free fraction of the endpoint's concurrency and per-minute quotas,
+    so load spreads across keys and a throttled key (blocked by retry-after) is skipped
+    while others have capacity. Endpoints whose breaker is open are drained until a
+    probe succeeds.
+    """
+
+    def __init__(self):
+        self._endpoints: Optional[List[LLMEndpoint]] = None
+        self._rotation = itertools.count()
+
+    def endpoints(self) -> List[LLMEndpoint]:
+        """The pool, created from settings on first use."""
+        if self._endpoints is None:
+            configs = settings.anthropic_endpoints or [AnthropicEndpointConfig(name=DEFAULT_ENDPOINT_NAME)]
+            self._endpoints = [LLMEndpoint(config) for config in configs]
+            logger.info(f"LLM endpoint pool: {[endpoint.name for endpoint in self._endpoints]} (provider '{settings.llm_provider}')")
+        return self._endpoints
+
+    def pick(self, estimated_input_tokens: int = 0) -> LLMEndpoint:
+        """Returns the available endpoint with the most headroom (ties rotate).
+
+        Does not change breaker state; call `endpoint.breaker.before_call()` before using it.
+        Raises CircuitOpenError if every endpoint is drained.
+        """
+        endpoints = self.endpoints()
+        offset = next(self._rotation) % len(endpoints)
+        rotated = endpoints[offset:] + endpoints[:offset]
+        available = [e for e in rotated if e.breaker.is_available()]
+        if not available:
+            raise CircuitOpenError(f"All {len(endpoints)} LLM endpoints are drained.")
+        return max(available, key=lambda e: e.controller.headroom(estimated_input_tokens))
+
+    def has_other_available(self, exclude: LLMEndpoint) -> bool:
+        return any(e is not exclude and e.breaker.is_available() for e in self.endpoints())
+
+    def has_spare_capacity(self, exclude: Optional[LLMEndpoint], estimated_input_tokens: int = 0) -> bool:
+        """True if another available endpoint could take a call now (used to skip retry-after waits and to allow hedges)."""
+        return any(
+            e is not exclude and e.breaker.is_available() and e.controller.headroom(estimated_input_tokens) > 0
+            for e in self.endpoints()
+        )
+
+    def endpoint_named(self, name: str) -> LLMEndpoint:
+        """The endpoint called `name`; raises LookupError if it is not configured (e.g., a key was removed)."""
+        for endpoint in self.endpoints():
+            if endpoint.name == name:
+                return endpoint
+        raise LookupError(f"LLM endpoint '{name}' is not configured.")
+
+    async def close(self):
+        """Closes every endpoint's provider (called on application shutdown)."""
+        for endpoint in self._endpoints or []:
+            await endpoint.provider.close()
+        self._endpoints = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {endpoint.name: endpoint.snapshot() for endpoint in self.endpoints()}
+
+    def limits_snapshot(self) -> Dict[str, Any]:
+        return {endpoint.name: endpoint.controller.snapshot() for endpoint in self.endpoints()}
+
+
+endpoint_pool = EndpointPool()
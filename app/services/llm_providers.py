@@ -0,0 +1,437 @@
+import abc
+import asyncio
+import contextlib
+import hashlib
+import importlib
+import json
+import logging
+import math
+import random
+import re
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+import anthropic
+from anthropic.types import Message
+from anthropic.types.messages import MessageBatchIndividualResponse
+
+from app.core.config import AnthropicEndpointConfig, settings
+from app.core.token_utils import estimate_token_count
+from app.db.client import mongo_db
+
+logger = logging.getLogger(__name__)
+
+
+# --- Provider Interface --- M
+class BatchesNotSupportedError(Exception):
+    """Raised by the batch methods of a provider without message batch support."""
+
+
+class LanguageModelProvider(abc.ABC):
+    """Backend that executes Messages API requests for claude_service.
+
+    claude_service keeps retries, rate control, caching and coalescing; a provider only
+    sends a request (parameters as built by `build_message_params`) and returns an
+    `anthropic.types.Message`. Failures are raised as the SDK's exception types so the
+    retry policy and circuit breaker treat every provider the same way.
+    """
+
+    name = "base"
+    supports_batches = False # Providers that implement the batch methods set this
+
+    @abc.abstractmethod
+    async def create_message(self, params: Dict[str, Any]) -> Message:
+        """Sends one request and returns the complete message."""
+
+    @abc.abstractmethod
+    async def stream_message(self, params: Dict[str, Any], started: float) -> Tuple[Message, Optional[float]]:
+        """Streams one request. Returns (final message, ms from `started` to the first text delta)."""
+
+    async def submit_batch(self, requests: List[Dict[str, Any]]) -> str:
+        raise BatchesNotSupportedError(f"LLM provider '{self.name}' does not support message batches.")
+
+    async def get_batch_status(self, batch_id: str) -> Tuple[str, Dict[str, int]]:
+        raise BatchesNotSupportedError(f"LLM provider '{self.name}' does not support message batches.")
+
+    async def iter_batch_results(self, batch_id: str) -> AsyncIterator[MessageBatchIndividualResponse]:
+        raise BatchesNotSupportedError(f"LLM provider '{self.name}' does not support message batches.")
+        yield # Makes this an async generator, like the implementations
+
+    async def cancel_batch(self, batch_id: str):
+        raise BatchesNotSupportedError(f"LLM provider '{self.name}' does not support message batches.")
+
+    async def close(self):
+        """Releases connections (called on application shutdown)."""
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"provider": self.name}
+# --- End Provider Interface ---
+
+
+# --- Anthropic Provider --- M
+def _build_http_client():
+    """Builds the pooled async HTTP client used by the Anthropic SDK.
+
+    Limits and Timeout come from the SDK's own exports so the objects always match
+    the httpx flavour the installed SDK was built against.
+    """
+    limits_cls = type(anthropic.DEFAULT_CONNECTION_LIMITS)
+    return anthropic.DefaultAsyncHttpxClient(
+        limits=limits_cls(
+            max_connections=settings.anthropic_max_connections,
+            max_keepalive_connections=settings.anthropic_max_keepalive_connections,
+            keepalive_expiry=settings.anthropic_keepalive_expiry_seconds,
+        ),
+        timeout=anthropic.Timeout(
+            settings.anthropic_timeout_seconds,
+            connect=settings.anthropic_connect_timeout_seconds,
+        ),
+    )
+
+
+class AnthropicProvider(LanguageModelProvider):
+    """The Anthropic API, through one API key and base URL.
+
+    One AsyncAnthropic client (and therefore one pooled connection pool) per endpoint is
+    shared by every caller in the process, so concurrent evaluations and judge calls
+    reuse keep-alive connections instead of each paying the TLS handshake.
+    """
+
+    name = "anthropic"
+    supports_batches = True
+
+    def __init__(self, endpoint: AnthropicEndpointConfig):
+        self.endpoint_name = endpoint.name
+        self.api_key = endpoint.api_key or settings.anthropic_api_key
+        self.base_url = endpoint.base_url or settings.anthropic_base_url
+        self._client: Optional[anthropic.AsyncAnthropic] = None
+
+    def client(self) -> anthropic.AsyncAnthropic:
+        """Returns the shared async client, creating it on first use."""
+        if self._client is None:
+            try:
+                self._client = anthropic.AsyncAnthropic(
+                    api_key=self.api_key,
+                    base_url=self.base_url,
+                    http_client=_build_http_client(),
+                    max_retries=0, # Retries are handled by generate_with_claude's retry policy
+                )
+            except Exception as e:
+                logger.error(f"Failed to initialize Anthropic client for endpoint '{self.endpoint_name}': {e}")
+                raise ValueError("Anthropic client failed to initialize.") from e
+        return self._client
+
+    async def create_message(self, params: Dict[str, Any]) -> Message:
+        # Non-blocking call: awaits on the shared connection pool instead of blocking the event loop
+        return await self.client().messages.create(**params)
+
+    async def stream_message(self, params: Dict[str, Any], started: float) -> Tuple[Message, Optional[float]]:
+        first_token_ms = None
+        async with self.client().messages.stream(**params) as stream:
+            async for text in stream.text_stream:
+                if first_token_ms is None and text:
+                    first_token_ms = (time.monotonic() - started) * 1000
+            message = await stream.get_final_message()
+        return message, first_token_ms
+
+    async def submit_batch(self, requests: List[Dict[str, Any]]) -> str:
+        batch = await self.client().messages.batches.create(requests=requests)
+        return batch.id
+
+    async def get_batch_status(self, batch_id: str) -> Tuple[str, Dict[str, int]]:
+        batch = await self.client().messages.batches.retrieve(batch_id)
+        return batch.processing_status, batch.request_counts.model_dump()
+
+    async def iter_batch_results(self, batch_id: str) -> AsyncIterator[MessageBatchIndividualResponse]:
+        results = await self.client().messages.batches.results(batch_id)
+        async for entry in results:
+            yield entry
+
+    async def cancel_batch(self, batch_id: str):
+        await self.client().messages.batches.cancel(batch_id)
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+            logger.info(f"Anthropic client connection pool for endpoint '{self.endpoint_name}' closed.")
+# --- End Anthropic Provider ---
+
+
+# --- Simulated Provider --- M
+def _sdk_httpx():
+    """The httpx module the installed SDK is built on, found through the SDK's own exports."""
+    return importlib.import_module(type(anthropic.DEFAULT_CONNECTION_LIMITS).__module__.split(".")[0])
+
+
+_SIMULATED_URL = "https://simulated.invalid/v1/messages"
+SIMULATED_BATCHES_COLLECTION = "simulated_message_batches"
+SIMULATED_BATCH_REQUESTS_COLLECTION = "simulated_message_batch_requests"
+_SIMULATED_STATUS_ERRORS = {
+    404: anthropic.NotFoundError,
+    429: anthropic.RateLimitError,
+    500: anthropic.InternalServerError,
+    529: anthropic.OverloadedError,
+}
+
+
+def _simulated_status_error(status_code: int, retry_after: Optional[float] = None) -> anthropic.APIStatusError:
+    httpx = _sdk_httpx()
+    headers = {"retry-after": f"{retry_after:.3f}"} if retry_after else {}
+    response = httpx.Response(status_code, request=httpx.Request("POST", _SIMULATED_URL), headers=headers)
+    return _SIMULATED_STATUS_ERRORS[status_code](f"Simulated {status_code} response.", response=response, body=None)
+
+
+def _simulated_reply(user_text: str) -> str:
+    match = re.search(r"<source_text>(.*?)</source_text>", user_text, re.DOTALL)
+    if match:
+        return f"<translated_text>[simulated] {match.group(1).strip()}</translated_text>"
+    return '{"score": 4.0, "rationale": "Simulated evaluation."}'
+
+
+def _simulated_message(params: Dict[str, Any]) -> Message:
+    """Builds a deterministic reply, honouring stop_sequences and max_tokens."""
+    system = params.get("system") or ""
+    if not isinstance(system, str):
+        system = "".join(block.get("text", "") for block in system)
+    user_text = "\n".join(
+        m["content"] if isinstance(m["content"], str) else "".join(b.get("text", "") for b in m["content"])
+        for m in params.get("messages", [])
+    )
+    text, stop_reason, stop_sequence = _simulated_reply(user_text), "end_turn", None
+    for sequence in params.get("stop_sequences") or []:
+        index = text.find(sequence)
+        if index != -1:
+            text, stop_reason, stop_sequence = text[:index], "stop_sequence", sequence
+            break
+    max_tokens = params.get("max_tokens", 1024)
+    if estimate_token_count(text) > max_tokens: # The budget runs out before the stop sequence is reached
+        text, stop_reason, stop_sequence = text[: max_tokens * 4], "max_tokens", None
+    return Message.model_validate({
+        "id": f"msg_sim_{uuid.uuid4().hex[:24]}",
+        "type": "message",
+        "role": "assistant",
+        "model": params.get("model", "simulated"),
+        "content": [{"type": "text", "text": text}],
+        "stop_reason": stop_reason,
+        "stop_sequence": stop_sequence,
+        "usage": {
+            "input_tokens": estimate_token_count(system) + estimate_token_count(user_text),
+            "output_tokens": estimate_token_count(text),
+        },
+    })
+
+
+class SimulatedProvider(LanguageModelProvider):
+    """Deterministic offline backend for load testing (no network).
+
+    Latency is lognormal around a configurable median. A share of calls fail with
+    500/529/timeouts, 429s are injected at random and whenever the simulated
+    requests-per-minute quota is exceeded. Each outcome is drawn from a generator
+    seeded with (seed, request, attempt number), so a run replays the same latencies
+    and failures for the same requests regardless of scheduling order. Each endpoint in
+    the pool gets its own instance, and therefore its own simulated quota.
+    """
+
+    name = "simulated"
+    supports_batches = True
+
+    def __init__(
+        self,
+        seed: Any,
+        latency_median_seconds: float,
+        latency_sigma: float,
+        first_token_fraction: float,
+        error_rate: float,
+        rate_limit_rate: float,
+        requests_per_minute: int,
+        retry_after_seconds: float,
+        batch_seconds: float,
+    ):
+        self.seed = seed
+        self.latency_median_seconds = latency_median_seconds
+        self.latency_sigma = latency_sigma
+        self.first_token_fraction = min(max(first_token_fraction, 0.0), 1.0)
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.requests_per_minute = requests_per_minute
+        self.retry_after_seconds = retry_after_seconds
+        self.batch_seconds = batch_seconds
+
+        self._attempts: Dict[str, int] = {} # request digest -> failed attempts so far
+        self._in_flight: Dict[str, int] = {} # request digest -> identical calls running (e.g., hedges)
+        self._window: deque = deque() # start times within the last minute
+
+        # Lifetime counters
+        self.total_requests = 0
+        self.total_rate_limited = 0
+        self.total_errors = 0
+
+    @classmethod
+    def from_settings(cls, endpoint: AnthropicEndpointConfig) -> "SimulatedProvider":
+        return cls(
+            seed=f"{settings.simulated_llm_seed}:{endpoint.name}",
+            latency_median_seconds=settings.simulated_llm_latency_median_seconds,
+            latency_sigma=settings.simulated_llm_latency_sigma,
+            first_token_fraction=settings.simulated_llm_first_token_fraction,
+            error_rate=settings.simulated_llm_error_rate,
+            rate_limit_rate=settings.simulated_llm_rate_limit_rate,
+            requests_per_minute=settings.simulated_llm_requests_per_minute,
+            retry_after_seconds=settings.simulated_llm_retry_after_seconds,
+            batch_seconds=settings.simulated_llm_batch_seconds,
+        )
+
+    def _digest(self, params: Dict[str, Any]) -> str:
+        return hashlib.sha256(json.dumps(params, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+    def _rng(self, digest: str, duplicates: int = 0) -> random.Random:
+        seed = f"{self.seed}:{digest}:{self._attempts.get(digest, 0)}"
+        if duplicates:
+            seed += f":{duplicates}" # A concurrent duplicate (hedge) gets its own latency and errors
+        return random.Random(seed)
+
+    def _fail(self, digest: str, error: Exception) -> Exception:
+        self._attempts[digest] = self._attempts.get(digest, 0) + 1 # The retry draws a fresh outcome
+        return error
+
+    async def _simulate(self, digest: str, duplicates: int, params: Dict[str, Any]) -> Tuple[Message, float]:
+        """Applies quota, injected failures and latency. Returns (message, latency) for a successful call."""
+        rng = self._rng(digest, duplicates)
+        self.total_requests += 1
+        now = time.monotonic()
+        while self._window and self._window[0] <= now - 60:
+            self._window.popleft()
+        if self.requests_per_minute and len(self._window) >= self.requests_per_minute:
+            self.total_rate_limited += 1
+            raise self._fail(digest, _simulated_status_error(429, self._window[0] + 60 - now))
+        self._window.append(now)
+        if rng.random() < self.rate_limit_rate:
+            self.total_rate_limited += 1
+            raise self._fail(digest, _simulated_status_error(429, self.retry_after_seconds))
+
+        latency = rng.lognormvariate(math.log(max(self.latency_median_seconds, 1e-6)), self.latency_sigma)
+        if rng.random() < self.error_rate:
+            self.total_errors += 1
+            await asyncio.sleep(latency * rng.random()) # Failures surface part-way through the call
+            kind = rng.choice([500, 529, "timeout"])
+            if kind == "timeout":
+                httpx = _sdk_httpx()
+                raise self._fail(digest, anthropic.APITimeoutError(request=httpx.Request("POST", _SIMULATED_URL)))
+            raise self._fail(digest, _simulated_status_error(kind))
+        self._attempts.pop(digest, None)
+        return _simulated_message(params), latency
+
+    @contextlib.contextmanager
+    def _tracked(self, params: Dict[str, Any]):
+        """Counts identical calls in flight; yields (digest, identical calls already running)."""
+        digest = self._digest(params)
+        duplicates = self._in_flight.get(digest, 0)
+        self._in_flight[digest] = duplicates + 1
+        try:
+            yield digest, duplicates
+        finally:
+            self._in_flight[digest] -= 1
+            if not self._in_flight[digest]:
+                del self._in_flight[digest]
+
+    async def create_message(self, params: Dict[str, Any]) -> Message:
+        with self._tracked(params) as (digest, duplicates):
+            message, latency = await self._simulate(digest, duplicates, params)
+            await asyncio.sleep(latency)
+            return message
+
+    async def stream_message(self, params: Dict[str, Any], started: float) -> Tuple[Message, Optional[float]]:
+        with self._tracked(params) as (digest, duplicates):
+            message, latency = await self._simulate(digest, duplicates, params)
+            await asyncio.sleep(latency * self.first_token_fraction)
+            first_token_ms = (time.monotonic() - started) * 1000
+            await asyncio.sleep(latency * (1 - self.first_token_fraction))
+            return message, first_token_ms
+
+    # Simulated batches live in Mongo (one document per batch, one per request) so any worker
+    # process can poll, collect or cancel a batch another process submitted, as upstream allows.
+
+    async def submit_batch(self, requests: List[Dict[str, Any]]) -> str:
+        batch_id = f"msgbatch_sim_{uuid.uuid4().hex[:24]}"
+        if requests:
+            await mongo_db.db[SIMULATED_BATCH_REQUESTS_COLLECTION].insert_many(
+                [{"batch_id": batch_id, "custom_id": r["custom_id"], "params": r["params"]} for r in requests]
+            )
+        await mongo_db.db[SIMULATED_BATCHES_COLLECTION].insert_one({
+            "_id": batch_id,
+            "request_count": len(requests),
+            "ends_at": datetime.utcnow() + timedelta(seconds=self.batch_seconds),
+            "canceled": False,
+        })
+        return batch_id
+
+    async def _get_batch(self, batch_id: str) -> Dict[str, Any]:
+        batch = await mongo_db.db[SIMULATED_BATCHES_COLLECTION].find_one({"_id": batch_id})
+        if batch is None:
+            raise _simulated_status_error(404)
+        return batch
+
+    async def get_batch_status(self, batch_id: str) -> Tuple[str, Dict[str, int]]:
+        batch = await self._get_batch(batch_id)
+        count = batch["request_count"]
+        if batch["canceled"]:
+            return "ended", {"processing": 0, "succeeded": 0, "errored": 0, "canceled": count, "expired": 0}
+        if datetime.utcnow() < batch["ends_at"]:
+            return "in_progress", {"processing": count, "succeeded": 0, "errored": 0, "canceled": 0, "expired": 0}
+        return "ended", {"processing": 0, "succeeded": count, "errored": 0, "canceled": 0, "expired": 0}
+
+    async def iter_batch_results(self, batch_id: str) -> AsyncIterator[MessageBatchIndividualResponse]:
+        batch = await self._get_batch(batch_id)
+        async for request in mongo_db.db[SIMULATED_BATCH_REQUESTS_COLLECTION].find({"batch_id": batch_id}):
+            if batch["canceled"]:
+                result = {"type": "canceled"}
+            else:
+                result = {"type": "succeeded", "message": _simulated_message(request["params"]).model_dump()}
+            yield MessageBatchIndividualResponse.model_validate({"custom_id": request["custom_id"], "result": result})
+
+    async def cancel_batch(self, batch_id: str):
+        await mongo_db.db[SIMULATED_BATCHES_COLLECTION].update_one(
+            {"_id": batch_id, "ends_at": {"$gt": datetime.utcnow()}}, # An ended batch keeps its results
+            {"$set": {"canceled": True}}
+        )
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "provider": self.name,
+            "seed": self.seed,
+            "latency_median_seconds": self.latency_median_seconds,
+            "latency_sigma": self.latency_sigma,
+            "error_rate": self.error_rate,
+            "rate_limit_rate": self.rate_limit_rate,
+            "requests_per_minute": self.requests_per_minute,
+            "total_requests": self.total_requests,
+            "total_rate_limited": self.total_rate_limited,
+            "total_errors": self.total_errors,
+        }
+# --- End Simulated Provider ---
+
+
+# --- Provider Registry --- M
+ProviderFactory = Callable[[AnthropicEndpointConfig], LanguageModelProvider]
+
+_provider_factories: Dict[str, ProviderFactory] = {
+    AnthropicProvider.name: AnthropicProvider,
+    SimulatedProvider.name: SimulatedProvider.from_settings,
+}
+
+
+def register_provider(name: str, factory: ProviderFactory):
+    """Makes a provider selectable through settings.llm_provider."""
+    _provider_factories[name] = factory
+
+
+def create_provider(endpoint: AnthropicEndpointConfig) -> LanguageModelProvider:
+    """Creates the provider selected by settings.llm_provider for one endpoint."""
+    factory = _provider_factories.get(settings.llm_provider)
+    if factory is None:
+        raise ValueError(f"Unknown LLM provider '{settings.llm_provider}'. Available: {sorted(_provider_factories)}")
+    return factory(endpoint)
+# --- End Provider Registry ---
@@ -0,0 +1,170 @@
+import logging
+import random
+import time
+from typing import Optional, Dict, Any
+
+import anthropic
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# --- Error Classification --- M
+RATE_LIMIT = "rate_limit" # 429 Too Many Requests
+SERVER = "server" # 5xx, including 529 Overloaded
+TIMEOUT = "timeout" # Request timeouts and dropped connections
+
+# Error classes that indicate the upstream is unhealthy (429 only means we are too fast)
+CIRCUIT_FAILURE_CLASSES = {SERVER, TIMEOUT}
+
+
+def classify_error(error: BaseException) -> Optional[str]:
+    """Maps an exception to a retryable error class, or None if it should not be retried."""
+    if isinstance(error, anthropic.APIStatusError):
+        if error.status_code == 429:
+            return RATE_LIMIT
+        if error.status_code >= 500:
+            return SERVER
+        return None # Other 4xx: the request itself is wrong, retrying will not help
+    if isinstance(error, (anthropic.APITimeoutError, anthropic.APIConnectionError)):
+        return TIMEOUT # APITimeoutError subclasses APIConnectionError; both are transient network failures
+    return None
+# --- End Error Classification ---
+
+
+# --- Retry Policy --- M
+class RetryPolicy:
+    """Exponential backoff with full jitter, with a separate retry budget per error class."""
+
+    def __init__(self, max_retries: Dict[str, int], base_delay_seconds: float, max_delay_seconds: float):
+        self.max_retries = max_retries
+        self.base_delay_seconds = base_delay_seconds
+        self.max_delay_seconds = max_delay_seconds
+
+    @classmethod
+    def from_settings(cls) -> "RetryPolicy":
+        return cls(
+            max_retries={
+                RATE_LIMIT: settings.llm_retry_max_retries_rate_limit,
+                SERVER: settings.llm_retry_max_retries_server,
+                TIMEOUT: settings.llm_retry_max_retries_timeout,
+            },
+            base_delay_seconds=settings.llm_retry_base_delay_seconds,
+            max_delay_seconds=settings.llm_retry_max_delay_seconds,
+        )
+
+    def should_retry(self, error_class: Optional[str], retries_so_far: int) -> bool:
+        return error_class is not None and retries_so_far < self.max_retries.get(error_class, 0)
+
+    def backoff_delay(self, retries_so_far: int, retry_after: Optional[float] = None) -> float:
+        """Seconds to sleep before the next attempt; never shorter than the server's retry-after."""
+        ceiling = min(self.max_delay_seconds, self.base_delay_seconds * (2 ** retries_so_far))
+        delay = random.uniform(0, ceiling)
+        if retry_after:
+            delay = max(delay, retry_after)
+        return delay
+
+
+retry_policy = RetryPolicy.from_settings()
+# --- End Retry Policy ---
+
+
+# --- Circuit Breaker --- M
+class CircuitOpenError(Exception):
+    """Raised without calling upstream while a model's circuit is open."""
+
+
+class CircuitBreaker:
+    """Per-model circuit breaker.
+
+    closed    -> calls flow; consecutive upstream failures are counted.
+    open      -> calls fail fast with CircuitOpenError until reset_timeout elapses.
+    half_open -> a single probe call is let through; success closes, failure re-opens.
+    """
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout_seconds: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout_seconds = reset_timeout_seconds
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self._probe_in_flight = False
+        self.total_rejected = 0
+
+    def is_available(self) -> bool:
+        """True if before_call() would let a call through now (does not change state)."""
+        if self.state == "closed":
+            return True
+        if self.state == "open":
+            return time.monotonic() - self.opened_at >= self.reset_timeout_seconds
+        return not self._probe_in_flight
+
+    def before_call(self):
+        """Raises CircuitOpenError if the call must not go upstream."""
+        if self.state == "closed":
+            return
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout_seconds:
+            self.state = "half_open"
+            logger.info(f"Circuit for '{self.name}' half-open; sending probe request.")
+        if self.state == "half_open" and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return
+        self.total_rejected += 1
+        raise CircuitOpenError(f"Circuit open for model '{self.name}' after {self.consecutive_failures} consecutive upstream failures.")
+
+    def record_success(self):
+        if self.state != "closed":
+            logger.info(f"Circuit for '{self.name}' closed.")
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        self._probe_in_flight = False
+        if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+            if self.state != "open":
+                logger.warning(f"Circuit for '{self.name}' opened after {self.consecutive_failures} consecutive failures.")
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def release_probe(self):
+        """Gives back a probe slot without an outcome (the call was cancelled before upstream answered)."""
+        self._probe_in_flight = False
+
+    def trip(self, reason: str):
+        """Opens the circuit immediately (e.g., the credentials were rejected)."""
+        if self.state != "open":
+            logger.warning(f"Circuit for '{self.name}' opened: {reason}")
+        self.state = "open"
+        self.opened_at = time.monotonic()
+        self._probe_in_flight = False
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "total_rejected": self.total_rejected,
+        }
+
+
+_circuit_breakers: Dict[str, CircuitBreaker] = {}
+
+
+def get_circuit_breaker(model_id: str) -> CircuitBreaker:
+    """Returns the process-wide breaker for a model, creating it on first use."""
+    breaker = _circuit_breakers.get(model_id)
+    if breaker is None:
+        breaker = CircuitBreaker(
+            model_id,
+            failure_threshold=settings.llm_circuit_failure_threshold,
+            reset_timeout_seconds=settings.llm_circuit_reset_seconds,
+        )
+        _circuit_breakers[model_id] = breaker
+    return breaker
+
+
+def circuit_breaker_snapshot() -> Dict[str, Dict[str, Any]]:
+    return {model_id: breaker.snapshot() for model_id, breaker in _circuit_breakers.items()}
+# --- End Circuit Breaker ---
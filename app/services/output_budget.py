@@ -0,0 +1,119 @@
+import logging
+import math
+from collections import deque
+from typing import Optional, Dict, Any
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+LEGACY_MAX_TOKENS = 1024 # Fixed budget used for every call before adaptive sizing
+RATIO_PERCENTILE = 0.95
+RECOMPUTE_EVERY = 50 # Observations between percentile recomputations per language
+
+
+class OutputBudgetEstimator:
+    """Sizes max_tokens for a translation from the source length.
+
+    For each target language it keeps the output/source token ratios of recent
+    complete (not truncated) results and budgets
+        source_tokens * p95_ratio * margin + overhead
+    clamped to [llm_output_min_tokens, llm_output_max_tokens]. Languages without
+    history use llm_output_default_expansion_ratio. Ratios are seeded from
+    evaluation_results on startup and updated as new results arrive.
+    """
+
+    def __init__(self):
+        self._samples: Dict[str, deque] = {}
+        self._ratios: Dict[str, float] = {}
+        self._pending: Dict[str, int] = {} # observations since the last recomputation
+        self.truncated_responses = 0
+        self.truncation_retries = 0
+        self.unresolved_truncations = 0
+
+    def _language_key(self, language: Optional[str]) -> str:
+        return (language or "unknown").lower()
+
+    def observe(self, language: Optional[str], source_tokens: Optional[int], output_tokens: Optional[int]):
+        """Records the ratio of a complete (not truncated) generation."""
+        if not source_tokens or not output_tokens:
+            return
+        key = self._language_key(language)
+        samples = self._samples.get(key)
+        if samples is None:
+            samples = self._samples[key] = deque(maxlen=settings.llm_output_ratio_samples)
+        samples.append(output_tokens / source_tokens)
+        self._pending[key] = self._pending.get(key, 0) + 1
+        if len(samples) <= RECOMPUTE_EVERY or self._pending[key] >= RECOMPUTE_EVERY:
+            self._recompute(key)
+
+    def _recompute(self, key: str):
+        ordered = sorted(self._samples[key])
+        self._ratios[key] = ordered[min(len(ordered) - 1, int(RATIO_PERCENTILE * len(ordered)))]
+        self._pending[key] = 0
+
+    def expansion_ratio(self, language: Optional[str]) -> float:
+        return self._ratios.get(self._language_key(language), settings.llm_output_default_expansion_ratio)
+
+    def budget_for(self, language: Optional[str], source_tokens: int) -> int:
+        """max_tokens for translating `source_tokens` tokens into `language`."""
+        if not settings.llm_adaptive_max_tokens_enabled:
+            return LEGACY_MAX_TOKENS
+        estimate = source_tokens * self.expansion_ratio(language) * settings.llm_output_budget_margin
+        budget = math.ceil(estimate) + settings.llm_output_overhead_tokens
+        return max(settings.llm_output_min_tokens, min(budget, settings.llm_output_max_tokens))
+
+    def record_truncation(self, retried: bool):
+        """Counts a response that stopped at max_tokens, and whether it was retried with a larger budget."""
+        self.truncated_responses += 1
+        if retried:
+            self.truncation_retries += 1
+        else:
+            self.unresolved_truncations += 1
+
+    async def load_from_results(self, db: AsyncIOMotorDatabase):
+        """Seeds per-language ratios from the most recent evaluation_results (called on startup)."""
+        try:
+            collection = db["evaluation_results"]
+            languages = await collection.distinct("target_language", {"output_token_count": {"$gt": 0}})
+            for language in languages:
+                if not language:
+                    continue
+                cursor = collection.find(
+                    {
+                        "target_language": language,
+                        "source_token_count": {"$gt": 0},
+                        "output_token_count": {"$gt": 0},
+                        "stop_reason": {"$ne": "max_tokens"},
+                    },
+                    {"source_token_count": 1, "output_token_count": 1},
+                ).sort("_id", -1).limit(settings.llm_output_ratio_samples)
+                async for doc in cursor:
+                    self.observe(language, doc["source_token_count"], doc["output_token_count"])
+                key = self._language_key(language)
+                if key in self._samples:
+                    self._recompute(key)
+            logger.info(f"Output budget ratios loaded for {len(self._ratios)} languages.")
+        except Exception as e:
+            logger.warning(f"Could not load output budget ratios from results: {e}")
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "enabled": settings.llm_adaptive_max_tokens_enabled,
+            "default_expansion_ratio": settings.llm_output_default_expansion_ratio,
+            "margin": settings.llm_output_budget_margin,
+            "min_tokens": settings.llm_output_min_tokens,
+            "max_tokens": settings.llm_output_max_tokens,
+            "languages": {
+                key: {"p95_ratio": round(ratio, 3), "samples": len(self._samples.get(key, ()))}
+                for key, ratio in self._ratios.items()
+            },
+            "truncated_responses": self.truncated_responses,
+            "truncation_retries": self.truncation_retries,
+            "unresolved_truncations": self.unresolved_truncations,
+        }
+
+
+output_budget = OutputBudgetEstimator()
@@ -0,0 +1,112 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from app.core.config import settings
+from app.services.claude_service import single_flight
+from app.services.hedging import request_hedger
+from app.services.llm_cache import response_cache
+from app.services.llm_endpoints import endpoint_pool
+from app.services.llm_resilience import circuit_breaker_snapshot
+from app.services.output_budget import output_budget
+from app.services.prompt_store import prompt_texts
+from app.services.write_buffer import write_buffers_snapshot
+
+logger = logging.getLogger(__name__)
+
+PROCESS_STATS_COLLECTION = "process_stats"
+
+
+def _provider_snapshot() -> Dict[str, Any]:
+    return {
+        "provider": settings.llm_provider,
+        "endpoints": {endpoint.name: endpoint.provider.snapshot() for endpoint in endpoint_pool.endpoints()},
+    }
+
+
+# --- Process Stats --- M
+class ProcessStats:
+    """Makes the in-memory LLM counters of every process visible to the admin routes.
+
+    Rate controllers, breakers, cache and hedging counters live in the process that makes
+    the calls, which for evaluations is a worker, not the API process serving /admin.
+    Each process upserts its snapshots into process_stats every
+    process_stats_interval_seconds; the admin routes list them per process.
+    """
+
+    def __init__(self):
+        self.process_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.role = "api"
+        self.sources: Dict[str, Callable[[], Dict[str, Any]]] = {
+            "limits": endpoint_pool.limits_snapshot,
+            "endpoints": endpoint_pool.snapshot,
+            "circuits": circuit_breaker_snapshot,
+            "cache": response_cache.snapshot,
+            "coalescing": single_flight.snapshot,
+            "hedging": request_hedger.snapshot,
+            "provider": _provider_snapshot,
+            "output_budget": output_budget.snapshot,
+            "writes": write_buffers_snapshot,
+            "prompt_texts": prompt_texts.snapshot,
+        }
+
+    async def publish(self, db: AsyncIOMotorDatabase):
+        await db[PROCESS_STATS_COLLECTION].replace_one(
+            {"_id": self.process_id},
+            {
+                "role": self.role,
+                "updated_at": datetime.utcnow(),
+                # Stored as JSON: snapshot keys may contain dots (e.g., "evaluation_results.judge")
+                "stats": {name: json.dumps(source(), default=str) for name, source in self.sources.items()},
+            },
+            upsert=True
+        )
+
+    async def run_publisher(self, db: AsyncIOMotorDatabase, role: str):
+        """Publishes until cancelled (started by the API and the workers), then removes this process's entry."""
+        self.role = role
+        if settings.process_stats_interval_seconds <= 0:
+            return
+        try:
+            while True:
+                try:
+                    await self.publish(db)
+                except Exception as e:
+                    logger.warning(f"Publishing process stats failed: {e}")
+                await asyncio.sleep(settings.process_stats_interval_seconds)
+        finally:
+            try:
+                await db[PROCESS_STATS_COLLECTION].delete_one({"_id": self.process_id})
+            except Exception as e:
+                logger.warning(f"Removing process stats of {self.process_id} failed: {e}")
+
+    async def per_process(self, db: AsyncIOMotorDatabase, name: str) -> Dict[str, Any]:
+        """The `name` snapshot of every live process, keyed by process id.
+
+        This process's entry is taken live; the others are their last publication,
+        skipped once it is older than three publish intervals (the process is gone).
+        """
+        processes = {self.process_id: {"role": self.role, "updated_at": datetime.utcnow(), "stats": self.sources[name]()}}
+        cutoff = datetime.utcnow() - timedelta(seconds=3 * settings.process_stats_interval_seconds)
+        cursor = db[PROCESS_STATS_COLLECTION].find(
+            {"_id": {"$ne": self.process_id}, "updated_at": {"$gte": cutoff}},
+            {"role": 1, "updated_at": 1, f"stats.{name}": 1}
+        )
+        async for doc in cursor:
+            published = doc.get("stats", {}).get(name)
+            processes[doc["_id"]] = {
+                "role": doc["role"],
+                "updated_at": doc["updated_at"],
+                "stats": json.loads(published) if published is not None else None,
+            }
+        return {"processes": processes}
+
+
+process_stats = ProcessStats()
+# --- End Process Stats ---
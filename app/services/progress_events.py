@@ -0,0 +1,274 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from datetime import datetime
+from typing import Optional, Dict, Any, Set
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import CursorType, InsertOne
+from pymongo.errors import CollectionInvalid
+
+from app.core.config import settings
+from app.db.client import mongo_db
+from app.services.write_buffer import progress_event_writes
+
+logger = logging.getLogger(__name__)
+
+EVENTS_COLLECTION = "evaluation_events"
+
+# Event types
+ROW_EVENT = "row" # A result row was written: prompt_id, row_index, error
+STATUS_EVENT = "status" # Evaluation/judge status or work-unit counters changed
+JUDGE_EVENT = "judge" # Judging progress: processed, total, errors
+JUDGED_ROW_EVENT = "judged_row" # Pipelined judging wrote a row's verdict: prompt_id, row_index, error
+
+
+async def ensure_events_collection(db: AsyncIOMotorDatabase):
+    """Creates the capped event collection (called on startup by the API and the workers).
+
+    A collection created implicitly by an insert is not capped and cannot be
+    tailed, so an existing uncapped one is converted.
+    """
+    try:
+        await db.create_collection(EVENTS_COLLECTION, capped=True, size=settings.progress_events_capped_bytes)
+    except CollectionInvalid:
+        try:
+            options = await db[EVENTS_COLLECTION].options()
+            if not options.get("capped"):
+                await db.command("convertToCapped", EVENTS_COLLECTION, size=settings.progress_events_capped_bytes)
+                logger.info(f"Converted '{EVENTS_COLLECTION}' to a capped collection.")
+        except Exception as e:
+            logger.warning(f"Could not convert '{EVENTS_COLLECTION}' to a capped collection: {e}")
+    except Exception as e:
+        logger.warning(f"Could not create the '{EVENTS_COLLECTION}' collection: {e}")
+
+
+async def publish(evaluation_id: Any, event_type: str, data: Dict[str, Any]):
+    """Appends a progress event (batched through the write-behind buffer; never fails the caller)."""
+    try:
+        await progress_event_writes.add(InsertOne({
+            "evaluation_id": evaluation_id,
+            "type": event_type,
+            "ts": datetime.utcnow(),
+            **data,
+        }))
+    except Exception as e:
+        logger.warning(f"Dropped '{event_type}' progress event for evaluation {evaluation_id}: {e}")
+
+
+class ProgressSubscription:
+    """Events of one evaluation queued for one stream. Overflow marks it for a resync instead of blocking the hub."""
+
+    def __init__(self, evaluation_id: Any):
+        self.evaluation_id = evaluation_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, settings.progress_subscriber_queue_size))
+        self.overflowed = False
+
+    def offer(self, event: Dict[str, Any]):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    async def get(self, timeout: float) -> Optional[Dict[str, Any]]:
+        """Next event, or None if none arrived within `timeout` seconds."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class ProgressHub:
+    """Fans progress events out to the event streams open in this API process.
+
+    One tailable cursor on the capped evaluation_events collection follows what
+    every worker process appends and hands each event to the subscriptions for
+    its evaluation, so the number of open streams adds no MongoDB load. The
+    cursor starts at the newest event when the first stream subscribes; a
+    stream loads its starting state from MongoDB itself.
+    """
+
+    def __init__(self):
+        self._subscriptions: Dict[Any, Set[ProgressSubscription]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._tailing = asyncio.Event() # Set once the cursor position is fixed
+        self.events_read = 0
+        self.events_delivered = 0
+        self.overflows = 0
+
+    async def subscribe(self, evaluation_id: Any) -> ProgressSubscription:
+        """Registers a stream. Returns once the hub is tailing, so every event appended afterwards is delivered."""
+        subscription = ProgressSubscription(evaluation_id)
+        self._subscriptions.setdefault(evaluation_id, set()).add(subscription)
+        if self._task is None or self._task.done():
+            self._tailing.clear()
+            self._task = asyncio.ensure_future(self._tail())
+        await self._tailing.wait()
+        return subscription
+
+    def unsubscribe(self, subscription: ProgressSubscription):
+        subscriptions = self._subscriptions.get(subscription.evaluation_id)
+        if subscriptions is not None:
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                del self._subscriptions[subscription.evaluation_id]
+
+    def dispatch(self, event: Dict[str, Any]):
+        """Delivers one event document to the subscriptions for its evaluation."""
+        self.events_read += 1
+        for subscription in self._subscriptions.get(event.get("evaluation_id"), ()):
+            was_overflowed = subscription.overflowed
+            subscription.offer(event)
+            if subscription.overflowed and not was_overflowed:
+                self.overflows += 1
+            self.events_delivered += 1
+
+    async def _tail(self):
+        collection = mongo_db.db[EVENTS_COLLECTION]
+        last_id = None
+        try:
+            newest = await collection.find_one({}, {"_id": 1}, sort=[("$natural", -1)])
+            last_id = newest["_id"] if newest else None
+        except Exception as e:
+            logger.warning(f"Progress hub: could not read the newest event: {e}")
+        self._tailing.set()
+        while True:
+            # Capped collections keep insertion order; the _id filter only matters when the cursor is reopened
+            cursor = collection.find({"_id": {"$gt": last_id}} if last_id else {}, cursor_type=CursorType.TAILABLE_AWAIT)
+            try:
+                while cursor.alive:
+                    async for event in cursor:
+                        last_id = event["_id"]
+                        self.dispatch(event)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Progress hub: tailing '{EVENTS_COLLECTION}' failed, reopening: {e}")
+            # A tailable cursor on an empty collection dies at once; wait before reopening it
+            await asyncio.sleep(settings.progress_tail_retry_seconds)
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "tailing": self._task is not None and not self._task.done(),
+            "streams": sum(len(s) for s in self._subscriptions.values()),
+            "evaluations": len(self._subscriptions),
+            "events_read": self.events_read,
+            "events_delivered": self.events_delivered,
+            "overflows": self.overflows,
+        }
+
+
+class EvaluationProgress:
+    """Progress of one evaluation as followed by one event stream.
+
+    Seeded from the result rows already written, then updated from events.
+    Rows are tracked by (prompt_id, row_index), so an event that repeats a row
+    (a retry, or an event that raced the initial load) is not counted twice.
+    """
+
+    def __init__(self, evaluation: Dict[str, Any], item_count: int):
+        self.evaluation_id = evaluation["_id"]
+        self.prompt_ids = [str(prompt_id) for prompt_id in evaluation.get("prompt_ids", [])]
+        self.item_count = item_count
+        self.status = evaluation.get("status")
+        self.judge_status = evaluation.get("judge_status")
+        self.completed_units = evaluation.get("completed_prompt_tasks") or 0
+        self.total_units = evaluation.get("total_prompt_tasks") or 0
+        self.judge: Dict[str, Any] = {}
+        self.judge_pipelined = bool(evaluation.get("judge_pipelined"))
+        self._judged: Dict[str, Set[int]] = {}
+        self._judge_errors: Dict[str, Set[int]] = {}
+        self._done: Dict[str, Set[int]] = {prompt_id: set() for prompt_id in self.prompt_ids}
+        self._errors: Dict[str, Set[int]] = {prompt_id: set() for prompt_id in self.prompt_ids}
+        self._completions: deque = deque() # Monotonic times of newly finished rows
+        self._started = time.monotonic()
+
+    def seed_row(self, prompt_id: Any, row_index: Optional[int], error: bool):
+        if row_index is None:
+            return
+        prompt_id = str(prompt_id)
+        self._done.setdefault(prompt_id, set()).add(row_index)
+        if error:
+            self._errors.setdefault(prompt_id, set()).add(row_index)
+        else:
+            self._errors.get(prompt_id, set()).discard(row_index)
+
+    def seed_judged_row(self, prompt_id: Any, row_index: Optional[int], error: bool):
+        if row_index is None:
+            return
+        prompt_id = str(prompt_id)
+        self._judged.setdefault(prompt_id, set()).add(row_index)
+        if error:
+            self._judge_errors.setdefault(prompt_id, set()).add(row_index)
+        else:
+            self._judge_errors.get(prompt_id, set()).discard(row_index)
+
+    def apply(self, event: Dict[str, Any]):
+        event_type = event.get("type")
+        if event_type == ROW_EVENT:
+            prompt_id = str(event.get("prompt_id"))
+            is_new = event.get("row_index") not in self._done.get(prompt_id, ())
+            self.seed_row(prompt_id, event.get("row_index"), bool(event.get("error")))
+            if is_new:
+                self._completions.append(time.monotonic())
+        elif event_type == STATUS_EVENT:
+            for field, attribute in (("status", "status"), ("judge_status", "judge_status"),
+                                     ("completed_prompt_tasks", "completed_units"), ("total_prompt_tasks", "total_units")):
+                if event.get(field) is not None:
+                    setattr(self, attribute, event[field])
+        elif event_type == JUDGE_EVENT:
+            self.judge = {field: event.get(field) for field in ("processed", "total", "errors")}
+        elif event_type == JUDGED_ROW_EVENT:
+            self.seed_judged_row(event.get("prompt_id"), event.get("row_index"), bool(event.get("error")))
+
+    def rows_per_second(self) -> float:
+        now = time.monotonic()
+        window = settings.progress_throughput_window_seconds
+        while self._completions and self._completions[0] < now - window:
+            self._completions.popleft()
+        elapsed = min(window, now - self._started)
+        return len(self._completions) / elapsed if elapsed > 0 else 0.0
+
+    def summary(self) -> Dict[str, Any]:
+        prompts = {
+            prompt_id: {
+                "rows_done": len(self._done.get(prompt_id, ())),
+                "rows_failed": len(self._errors.get(prompt_id, ())),
+                "rows_total": self.item_count,
+            }
+            for prompt_id in self.prompt_ids
+        }
+        rows_done = sum(p["rows_done"] for p in prompts.values())
+        rows_total = self.item_count * len(self.prompt_ids)
+        rate = self.rows_per_second()
+        remaining = max(0, rows_total - rows_done)
+        judge = self.judge or None
+        if judge is None and self.judge_pipelined: # Counted per row; a separate judging run reports its own totals
+            judge = {
+                "processed": sum(len(rows) for rows in self._judged.values()),
+                "total": rows_total,
+                "errors": sum(len(rows) for rows in self._judge_errors.values()),
+            }
+        return {
+            "evaluation_id": str(self.evaluation_id),
+            "status": self.status,
+            "judge_status": self.judge_status,
+            "completed_prompt_tasks": self.completed_units,
+            "total_prompt_tasks": self.total_units,
+            "rows_done": rows_done,
+            "rows_failed": sum(p["rows_failed"] for p in prompts.values()),
+            "rows_total": rows_total,
+            "prompts": prompts,
+            "rows_per_second": round(rate, 2),
+            "eta_seconds": round(remaining / rate, 1) if rate > 0 and remaining else (0.0 if not remaining else None),
+            "judge": judge,
+        }
+
+
+progress_hub = ProgressHub()
@@ -0,0 +1,107 @@
+import hashlib
+import logging
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional, Dict, Any, Iterable, List, Set
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+
+from app.services.write_buffer import prompt_text_writes
+
+logger = logging.getLogger(__name__)
+
+PROMPT_TEXTS_COLLECTION = "prompt_texts"
+KNOWN_HASHES_MAX = 20000 # Hashes this process has durably stored (skips repeated upserts)
+
+
+def prompt_text_hash(text: str) -> str:
+    """Content address of a prompt text: SHA-256 of its UTF-8 bytes."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class PromptTextStore:
+    """Content-addressed store for the prompt texts sent to the LLM.
+
+    Each distinct text is stored once in `prompt_texts` under its SHA-256, and
+    result rows keep only the hash. The system prompt is the same for every row
+    of a prompt, and user prompts repeat across the prompts of an evaluation, so
+    this keeps evaluation_results (and the working set) small. Texts are written
+    with $setOnInsert through the write-behind buffer that result_writes flushes
+    first, so a row never reaches Mongo before the texts it references.
+    A hash counts as known only once the flush containing its write succeeded;
+    if the buffer drops the write, the next put() queues the text again.
+    """
+
+    def __init__(self):
+        self._known: "OrderedDict[str, None]" = OrderedDict()
+        self._queued: Dict[int, str] = {} # id(operation) -> hash, for writes not flushed yet
+        self._queued_hashes: Set[str] = set()
+        self.puts = 0
+        self.new_texts = 0
+        self.dropped_texts = 0
+
+    async def put(self, text: Optional[str]) -> Optional[str]:
+        """Stores `text` (if this process has not already) and returns its hash."""
+        if text is None:
+            return None
+        self.puts += 1
+        text_hash = prompt_text_hash(text)
+        if text_hash in self._known:
+            self._known.move_to_end(text_hash)
+            return text_hash
+        if text_hash in self._queued_hashes:
+            return text_hash # Written with the pending flush
+        operation = UpdateOne(
+            {"_id": text_hash},
+            {"$setOnInsert": {"text": text, "created_at": datetime.utcnow()}},
+            upsert=True
+        )
+        self._queued[id(operation)] = text_hash
+        self._queued_hashes.add(text_hash)
+        self.new_texts += 1
+        await prompt_text_writes.add(operation)
+        return text_hash
+
+    def _settle(self, operations: List[Any]) -> List[str]:
+        """Forgets the given writes as queued; returns their hashes."""
+        hashes = []
+        for operation in operations:
+            text_hash = self._queued.pop(id(operation), None)
+            if text_hash is not None:
+                self._queued_hashes.discard(text_hash)
+                hashes.append(text_hash)
+        return hashes
+
+    def mark_written(self, operations: List[Any]):
+        """prompt_text_writes callback: the texts are in Mongo, later puts can skip them."""
+        for text_hash in self._settle(operations):
+            self._known[text_hash] = None
+            self._known.move_to_end(text_hash)
+        while len(self._known) > KNOWN_HASHES_MAX:
+            self._known.popitem(last=False)
+
+    def mark_dropped(self, operations: List[Any]):
+        """prompt_text_writes callback: the writes were given up, so the next put() of these texts retries them."""
+        self.dropped_texts += len(self._settle(operations))
+
+    async def get_many(self, db: AsyncIOMotorDatabase, hashes: Iterable[str]) -> Dict[str, str]:
+        """Texts for the given hashes; hashes not in the store are left out."""
+        wanted = list({h for h in hashes if h})
+        if not wanted:
+            return {}
+        cursor = db[PROMPT_TEXTS_COLLECTION].find({"_id": {"$in": wanted}})
+        return {doc["_id"]: doc["text"] async for doc in cursor}
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "puts": self.puts,
+            "new_texts": self.new_texts,
+            "dedup_ratio": round(1 - self.new_texts / self.puts, 4) if self.puts else None,
+            "dropped_texts": self.dropped_texts,
+        }
+
+
+prompt_texts = PromptTextStore()
+prompt_text_writes.on_written = prompt_texts.mark_written
+prompt_text_writes.on_dropped = prompt_texts.mark_dropped
@@ -0,0 +1,245 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Optional, Dict, Any
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+WINDOW_SECONDS = 60.0 # Sliding window used for the per-minute quotas
+
+
+def process_share(quota: int) -> int:
+    """This process's share of a deployment-wide per-minute quota (0 stays unlimited)."""
+    if not quota:
+        return quota
+    return max(1, quota // max(1, settings.llm_quota_processes))
+
+
+class ControllerTicket:
+    """Outcome of one LLM call, filled in by the caller while it holds a slot."""
+
+    def __init__(self, estimated_input_tokens: int):
+        self.estimated_input_tokens = estimated_input_tokens
+        self.started_at = time.monotonic()
+        self.output_tokens: Optional[int] = None
+        self.throttled = False
+        self.retry_after: Optional[float] = None
+
+    def record_success(self, output_tokens: int = 0):
+        self.output_tokens = output_tokens or 0
+
+    def record_throttle(self, retry_after: Optional[float] = None):
+        self.throttled = True
+        self.retry_after = retry_after
+
+
+class AdaptiveConcurrencyController:
+    """Process-wide, quota-aware gate in front of every LLM call.
+
+    A call may start only while:
+      * fewer than `limit` calls are in flight (the AIMD-controlled concurrency),
+      * no `retry-after` block from a recent 429 is active,
+      * the last minute stays within the requests, input-token and output-token quotas.
+
+    The concurrency limit grows additively while calls succeed under the latency
+    target and shrinks multiplicatively on throttling or sustained slow calls.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: int,
+        input_tokens_per_minute: int,
+        output_tokens_per_minute: int,
+        initial_concurrency: int,
+        min_concurrency: int,
+        max_concurrency: int,
+        latency_target_seconds: float,
+        increase_step: float,
+        decrease_factor: float,
+        latency_decrease_factor: float,
+        cooldown_seconds: float,
+    ):
+        self.requests_per_minute = requests_per_minute
+        self.input_tokens_per_minute = input_tokens_per_minute
+        self.output_tokens_per_minute = output_tokens_per_minute
+        self.min_concurrency = max(1, min_concurrency)
+        self.max_concurrency = max(self.min_concurrency, max_concurrency)
+        self.latency_target_seconds = latency_target_seconds
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.latency_decrease_factor = latency_decrease_factor
+        self.cooldown_seconds = cooldown_seconds
+
+        self._limit = float(min(max(initial_concurrency, self.min_concurrency), self.max_concurrency))
+        self._in_flight = 0
+        self._waiting = 0
+        self._requests: deque = deque() # (started_at, estimated_input_tokens)
+        self._input_tokens_in_window = 0
+        self._outputs: deque = deque() # (finished_at, output_tokens)
+        self._output_tokens_in_window = 0
+        self._blocked_until = 0.0
+        self._last_decrease = float("-inf")
+        self._latency_ewma: Optional[float] = None
+        self._cond = asyncio.Condition()
+
+        # Lifetime counters
+        self.total_requests = 0
+        self.total_throttled = 0
+        self.total_errors = 0
+
+    @classmethod
+    def from_settings(
+        cls,
+        requests_per_minute: Optional[int] = None,
+        input_tokens_per_minute: Optional[int] = None,
+        output_tokens_per_minute: Optional[int] = None,
+        max_concurrency: Optional[int] = None,
+    ) -> "AdaptiveConcurrencyController":
+        """Controller with the configured defaults; an endpoint's own quotas override them.
+
+        Quotas are deployment-wide: this process enforces its 1/llm_quota_processes share.
+        """
+        return cls(
+            requests_per_minute=process_share(settings.llm_requests_per_minute if requests_per_minute is None else requests_per_minute),
+            input_tokens_per_minute=process_share(settings.llm_input_tokens_per_minute if input_tokens_per_minute is None else input_tokens_per_minute),
+            output_tokens_per_minute=process_share(settings.llm_output_tokens_per_minute if output_tokens_per_minute is None else output_tokens_per_minute),
+            initial_concurrency=settings.llm_initial_concurrency,
+            min_concurrency=settings.llm_min_concurrency,
+            max_concurrency=settings.llm_max_concurrency if max_concurrency is None else max_concurrency,
+            latency_target_seconds=settings.llm_latency_target_seconds,
+            increase_step=settings.llm_aimd_increase_step,
+            decrease_factor=settings.llm_aimd_decrease_factor,
+            latency_decrease_factor=settings.llm_aimd_latency_decrease_factor,
+            cooldown_seconds=settings.llm_aimd_cooldown_seconds,
+        )
+
+    # --- Window Bookkeeping --- M
+    def _prune(self, now: float):
+        cutoff = now - WINDOW_SECONDS
+        while self._requests and self._requests[0][0] <= cutoff:
+            self._input_tokens_in_window -= self._requests.popleft()[1]
+        while self._outputs and self._outputs[0][0] <= cutoff:
+            self._output_tokens_in_window -= self._outputs.popleft()[1]
+
+    def _capacity_delay(self, now: float, tokens: int) -> Optional[float]:
+        """Seconds until a call may start (<= 0 means now), or None to wait for a slot release."""
+        if now < self._blocked_until:
+            return self._blocked_until - now
+        if self._in_flight >= int(self._limit):
+            return None
+        if self.requests_per_minute and len(self._requests) >= self.requests_per_minute:
+            return self._requests[0][0] + WINDOW_SECONDS - now
+        # A single oversized request is allowed through once the window is empty
+        if self.input_tokens_per_minute and self._requests and self._input_tokens_in_window + tokens > self.input_tokens_per_minute:
+            return self._requests[0][0] + WINDOW_SECONDS - now
+        if self.output_tokens_per_minute and self._outputs and self._output_tokens_in_window >= self.output_tokens_per_minute:
+            return self._outputs[0][0] + WINDOW_SECONDS - now
+        return 0
+    # --- End Window Bookkeeping ---
+
+    # --- AIMD --- M
+    def _decrease(self, factor: float, now: float, reason: str):
+        if now - self._last_decrease < self.cooldown_seconds:
+            return # One decrease per cooldown, so a burst of failures counts once
+        previous = self._limit
+        self._limit = max(self.min_concurrency, self._limit * factor)
+        self._last_decrease = now
+        logger.info(f"LLM concurrency limit decreased {previous:.1f} -> {self._limit:.1f} ({reason})")
+
+    def _apply_outcome(self, ticket: ControllerTicket, now: float):
+        latency = now - ticket.started_at
+        if ticket.throttled:
+            self.total_throttled += 1
+            if ticket.retry_after:
+                self._blocked_until = max(self._blocked_until, now + ticket.retry_after)
+            self._decrease(self.decrease_factor, now, "throttled")
+            return
+        if ticket.output_tokens is None:
+            self.total_errors += 1 # Non-throttle failure: no signal about capacity
+            return
+
+        self._outputs.append((now, ticket.output_tokens))
+        self._output_tokens_in_window += ticket.output_tokens
+        self._latency_ewma = latency if self._latency_ewma is None else 0.8 * self._latency_ewma + 0.2 * latency
+        if self._latency_ewma > self.latency_target_seconds:
+            self._decrease(self.latency_decrease_factor, now, f"latency {self._latency_ewma:.1f}s over target")
+        else:
+            # Additive increase: roughly +increase_step per full window of successful calls
+            self._limit = min(self.max_concurrency, self._limit + self.increase_step / self._limit)
+    # --- End AIMD ---
+
+    def headroom(self, estimated_input_tokens: int = 0) -> float:
+        """Fraction of capacity still free (0..1) across concurrency and quotas; negative while blocked by retry-after."""
+        now = time.monotonic()
+        self._prune(now)
+        if now < self._blocked_until:
+            return -(self._blocked_until - now)
+        fractions = [(self._limit - self._in_flight - self._waiting) / self._limit]
+        if self.requests_per_minute:
+            fractions.append(1 - len(self._requests) / self.requests_per_minute)
+        if self.input_tokens_per_minute:
+            fractions.append(1 - (self._input_tokens_in_window + estimated_input_tokens) / self.input_tokens_per_minute)
+        if self.output_tokens_per_minute:
+            fractions.append(1 - self._output_tokens_in_window / self.output_tokens_per_minute)
+        return min(fractions)
+
+    @asynccontextmanager
+    async def slot(self, estimated_input_tokens: int):
+        """Waits for capacity, then yields a ticket the caller fills in with the call outcome."""
+        async with self._cond:
+            self._waiting += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._prune(now)
+                    delay = self._capacity_delay(now, estimated_input_tokens)
+                    if delay is not None and delay <= 0:
+                        break
+                    try:
+                        await asyncio.wait_for(self._cond.wait(), timeout=delay)
+                    except asyncio.TimeoutError:
+                        pass
+            finally:
+                self._waiting -= 1
+            self._in_flight += 1
+            self.total_requests += 1
+            self._requests.append((now, estimated_input_tokens))
+            self._input_tokens_in_window += estimated_input_tokens
+
+        ticket = ControllerTicket(estimated_input_tokens)
+        try:
+            yield ticket
+        finally:
+            async with self._cond:
+                self._in_flight -= 1
+                self._apply_outcome(ticket, time.monotonic())
+                self._cond.notify_all()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Live limits and state, for the admin endpoint."""
+        now = time.monotonic()
+        self._prune(now)
+        return {
+            "concurrency_limit": round(self._limit, 2),
+            "min_concurrency": self.min_concurrency,
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self._in_flight,
+            "waiting": self._waiting,
+            "requests_per_minute_limit": self.requests_per_minute,
+            "requests_last_minute": len(self._requests),
+            "input_tokens_per_minute_limit": self.input_tokens_per_minute,
+            "input_tokens_last_minute": self._input_tokens_in_window,
+            "output_tokens_per_minute_limit": self.output_tokens_per_minute,
+            "output_tokens_last_minute": self._output_tokens_in_window,
+            "retry_after_remaining_seconds": round(max(0.0, self._blocked_until - now), 2),
+            "latency_ewma_seconds": round(self._latency_ewma, 3) if self._latency_ewma is not None else None,
+            "latency_target_seconds": self.latency_target_seconds,
+            "total_requests": self.total_requests,
+            "total_throttled": self.total_throttled,
+            "total_errors": self.total_errors,
+        }
+
@@ -0,0 +1,163 @@
+import logging
+from datetime import datetime, timedelta
+from typing import Optional, Dict, Any, List
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+
+from app.core.config import settings
+from app.services.job_queue import JOBS_COLLECTION, JOB_QUEUED
+
+logger = logging.getLogger(__name__)
+
+SCHEDULER_STATE_COLLECTION = "scheduler_state"
+EVALUATIONS_COLLECTION = "evaluations"
+VIRTUAL_TIME_ID = "virtual_time"
+
+# Priority classes (claimed in rank order)
+PRIORITY_INTERACTIVE = "interactive" # Small runs someone is waiting on
+PRIORITY_BULK = "bulk" # Large regression runs and message batches
+PRIORITY_RANKS = {PRIORITY_INTERACTIVE: 0, PRIORITY_BULK: 1}
+
+
+def workspace_key(user_id: Any, language: Optional[str]) -> str:
+    """Fair-share unit: one user's work in one language."""
+    return f"{user_id}:{language or '-'}"
+
+
+def _percentiles(values: List[float]) -> Dict[str, Any]:
+    ordered = sorted(values)
+    def percentile(p: float) -> Optional[float]:
+        return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))], 2) if ordered else None
+    return {"count": len(ordered), "p50": percentile(0.5), "p95": percentile(0.95), "max": round(ordered[-1], 2) if ordered else None}
+
+
+class FairShareScheduler:
+    """Orders the job queue by priority class and weighted fair share (start-time fair queuing).
+
+    Every job is tagged on enqueue with its workspace, priority class and an
+    estimated cost in tokens. Jobs of one workspace get consecutive start tags,
+    each advancing the workspace's finish tag by cost / weight, beginning no
+    earlier than the global virtual time (the start tag of the job claimed
+    last). Claiming the lowest start tag therefore shares the workers between
+    workspaces in proportion to their weights however much each one queued,
+    and among jobs that arrive together the cheapest goes first. Interactive
+    jobs are claimed before bulk ones.
+    """
+
+    def classify(self, rows: int, requested: Optional[str] = None, batch: bool = False) -> str:
+        """Priority class of an evaluation of `rows` (prompt x item) rows. Only small runs may be interactive."""
+        if batch or rows > settings.scheduler_interactive_max_rows:
+            if requested == PRIORITY_INTERACTIVE:
+                logger.info(f"Scheduler: {rows}-row run requested as interactive; scheduling it as bulk.")
+            return PRIORITY_BULK
+        return requested or PRIORITY_INTERACTIVE
+
+    def weight(self, workspace: str) -> float:
+        weights = settings.scheduler_workspace_weights
+        language = workspace.rsplit(":", 1)[-1]
+        return max(0.01, weights.get(workspace, weights.get(language, 1.0)))
+
+    async def virtual_time(self, db: AsyncIOMotorDatabase) -> float:
+        state = await db[SCHEDULER_STATE_COLLECTION].find_one({"_id": VIRTUAL_TIME_ID})
+        return state.get("value", 0.0) if state else 0.0
+
+    async def tag(self, db: AsyncIOMotorDatabase, workspace: str, priority_class: str, payloads: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Adds the scheduling fields to job payloads (in place); each payload carries its est_tokens.
+
+        The workspace's span is reserved with one atomic update, so concurrent
+        enqueues of the same workspace never get overlapping tags.
+        """
+        if not payloads:
+            return payloads
+        weight = self.weight(workspace)
+        spans = [max(1, payload.get("est_tokens") or 1) / weight for payload in payloads]
+        now_virtual = await self.virtual_time(db)
+        before = await db[SCHEDULER_STATE_COLLECTION].find_one_and_update(
+            {"_id": f"workspace:{workspace}"},
+            [{"$set": {"finish_tag": {"$add": [{"$max": [{"$ifNull": ["$finish_tag", 0]}, now_virtual]}, sum(spans)]}}}],
+            upsert=True,
+            return_document=ReturnDocument.BEFORE
+        )
+        start = max((before or {}).get("finish_tag", 0.0), now_virtual)
+        for payload, span in zip(payloads, spans):
+            payload.update({
+                "workspace": workspace,
+                "priority_class": priority_class,
+                "priority_rank": PRIORITY_RANKS[priority_class],
+                "start_tag": start,
+            })
+            start += span
+        return payloads
+
+    async def advance(self, db: AsyncIOMotorDatabase, job: Dict[str, Any]):
+        """Moves the virtual time to a claimed job's start tag (called by the workers)."""
+        if job.get("start_tag") is None:
+            return
+        try:
+            await db[SCHEDULER_STATE_COLLECTION].update_one(
+                {"_id": VIRTUAL_TIME_ID}, {"$max": {"value": job["start_tag"]}}, upsert=True
+            )
+        except Exception as e:
+            logger.warning(f"Scheduler: could not advance the virtual time: {e}")
+
+    async def snapshot(self, db: AsyncIOMotorDatabase) -> Dict[str, Any]:
+        """Queue depth per class and workspace, plus queue-wait, run-time and evaluation latency percentiles per class."""
+        now = datetime.utcnow()
+        since = now - timedelta(seconds=settings.scheduler_metrics_window_seconds)
+        jobs = db[JOBS_COLLECTION]
+        classes: Dict[str, Dict[str, Any]] = {}
+
+        async for row in jobs.aggregate([
+            {"$match": {"status": JOB_QUEUED}},
+            {"$group": {"_id": "$priority_class", "queued": {"$sum": 1}, "oldest": {"$min": "$created_at"}}},
+        ]):
+            classes.setdefault(row["_id"] or "untagged", {}).update({
+                "queued": row["queued"],
+                "oldest_queued_seconds": round((now - row["oldest"]).total_seconds(), 1) if row.get("oldest") else None,
+            })
+
+        waits: Dict[str, List[float]] = {}
+        runs: Dict[str, List[float]] = {}
+        async for job in jobs.find(
+            {"first_claimed_at": {"$gte": since}},
+            {"priority_class": 1, "created_at": 1, "first_claimed_at": 1, "finished_at": 1, "status": 1}
+        ):
+            priority_class = job.get("priority_class") or "untagged"
+            waits.setdefault(priority_class, []).append((job["first_claimed_at"] - job["created_at"]).total_seconds())
+            if job.get("finished_at"):
+                runs.setdefault(priority_class, []).append((job["finished_at"] - job["first_claimed_at"]).total_seconds())
+        latencies: Dict[str, List[float]] = {}
+        async for evaluation in db[EVALUATIONS_COLLECTION].find(
+            {"status": "completed", "completed_at": {"$gte": since}},
+            {"priority_class": 1, "created_at": 1, "completed_at": 1}
+        ):
+            latencies.setdefault(evaluation.get("priority_class") or "untagged", []).append(
+                (evaluation["completed_at"] - evaluation["created_at"]).total_seconds()
+            )
+        for priority_class in set(waits) | set(runs) | set(latencies):
+            classes.setdefault(priority_class, {}).update({
+                "queue_wait_seconds": _percentiles(waits.get(priority_class, [])),
+                "job_run_seconds": _percentiles(runs.get(priority_class, [])),
+                "evaluation_latency_seconds": _percentiles(latencies.get(priority_class, [])),
+            })
+
+        workspaces = await jobs.aggregate([
+            {"$match": {"status": JOB_QUEUED, "workspace": {"$ne": None}}},
+            {"$group": {"_id": "$workspace", "queued": {"$sum": 1}, "queued_tokens": {"$sum": "$est_tokens"}, "next_start_tag": {"$min": "$start_tag"}}},
+            {"$sort": {"next_start_tag": 1}},
+            {"$limit": 20},
+        ]).to_list(length=None)
+        return {
+            "virtual_time": await self.virtual_time(db),
+            "window_seconds": settings.scheduler_metrics_window_seconds,
+            "classes": classes,
+            "workspaces": [
+                {"workspace": w["_id"], "weight": self.weight(w["_id"]), "queued": w["queued"],
+                 "queued_tokens": w["queued_tokens"], "next_start_tag": w["next_start_tag"]}
+                for w in workspaces
+            ],
+        }
+
+
+scheduler = FairShareScheduler()
@@ -0,0 +1,56 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """Merges concurrent calls that share a key into one execution.
+
+    The first caller for a key (the leader) starts the work as a task; callers that
+    arrive while it is running await the same task and receive the same result or
+    exception. A waiter being cancelled does not cancel the shared work unless it was
+    the last one waiting.
+    """
+
+    def __init__(self):
+        self._in_flight: Dict[str, asyncio.Task] = {}
+        self._waiters: Dict[str, int] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, func: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Runs func() once per concurrent key. Returns (result, shared) where shared is True for followers."""
+        task = self._in_flight.get(key)
+        shared = task is not None
+        if task is None:
+            self.leaders += 1
+            task = asyncio.ensure_future(func())
+            self._in_flight[key] = task
+            self._waiters[key] = 0
+            task.add_done_callback(lambda done, key=key: self._forget(key, done))
+        else:
+            self.coalesced += 1
+        self._waiters[key] += 1
+        try:
+            return await asyncio.shield(task), shared
+        except asyncio.CancelledError:
+            if not task.done() and self._waiters.get(key) == 1:
+                task.cancel() # Nobody else is interested in the result
+            raise
+        finally:
+            if self._in_flight.get(key) is task:
+                self._waiters[key] -= 1
+
+    def _forget(self, key: str, task: asyncio.Task):
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+            del self._waiters[key]
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "in_flight_keys": len(self._in_flight),
+            "leader_calls": self.leaders,
+            "coalesced_calls": self.coalesced,
+        }
@@ -1,9 +1,11 @@
 import pandas as pd
 from fastapi import HTTPException, UploadFile
 from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ASCENDING, UpdateOne
 import json
 import io # For reading UploadFile content into pandas
-from typing import List, Dict, Any
+import logging
+from typing import List, Dict, Any, Optional, Sequence, Tuple, AsyncIterator
 import uuid
 
 from app.models.test_set_models import (
@@ -14,6 +16,8 @@ from app.models.test_set_models import (
     TestSetEntryInDB
 )
 
+logger = logging.getLogger(__name__)
+
 # Collection names
 USER_TEST_SETS_COLLECTION = "user_test_sets"
 TEST_SET_ENTRIES_COLLECTION = "test_set_entries"
@@ -101,6 +105,7 @@ async def process_and_save_test_set(
         entry_data = TestSetEntryCreate(
             test_set_id=new_test_set.id,
             row_number_in_file=index + 1,
+            item_index=len(entries_to_insert), # Skipped rows leave gaps in row_number_in_file, not here
             source_text=source_text,
             reference_text=reference_text,
             text_id_value=text_id_value,
@@ -123,4 +128,157 @@ async def process_and_save_test_set(
     except Exception as e:
         # TODO: Add cleanup logic here if metadata was inserted but entries failed?
         # For now, simple re-raise.
-        raise HTTPException(status_code=500, detail=f"Database error: {e}") 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Database error: {e}")
+
+
+# --- Evaluation Items --- M
+# Evaluations either embed their items (test_set_data) or reference a stored test set (test_set_id).
+# Stored test sets are read from test_set_entries one work unit at a time. Row i of an evaluation is the
+# entry with item_index i (its position in row_number_in_file order), so a unit reads its rows with an
+# index range scan instead of skipping past every earlier entry.
+ENTRY_ITEM_PROJECTION = {"item_index": 1, "source_text": 1, "reference_text": 1, "extra_info_value": 1}
+ENTRY_ORDER = [("row_number_in_file", ASCENDING), ("_id", ASCENDING)]
+ITEM_INDEX_BACKFILL_BATCH = 1000 # Entries numbered per bulk write when backfilling item_index
+
+
+def _entry_to_item(entry: Dict[str, Any]) -> Dict[str, Any]:
+    """Maps a test_set_entries document to the EvaluationRequestData shape (extra info becomes instructions, as in the UI)."""
+    return {
+        "source_text": entry.get("source_text", ""),
+        "reference_text": entry.get("reference_text"),
+        "additional_instructions": entry.get("extra_info_value"),
+    }
+
+
+class TestSetWindow:
+    """Rows [start - 1, stop + 1) of a stored test set: one work unit plus its neighbours.
+
+    Indexed by absolute row index like the inline test_set_data list (prompt
+    assembly reads index - 1 and index + 1 for context); len() is the size of
+    the whole test set.
+    """
+
+    def __init__(self, items: Dict[int, Dict[str, Any]], total: int):
+        self._items = items
+        self._total = total
+
+    def __getitem__(self, index: int) -> Dict[str, Any]:
+        return self._items[index]
+
+    def __len__(self) -> int:
+        return self._total
+
+
+class EvaluationItems:
+    """The test items of one evaluation, loaded a range of rows at a time.
+
+    For a stored test set, row i is the entry with item_index i and only the
+    requested rows plus one neighbour on each side are read, so worker memory does
+    not grow with the size of the test set. Inline test_set_data
+    (evaluations created with the items in the request) is returned as is.
+    """
+
+    def __init__(
+        self,
+        db: AsyncIOMotorDatabase,
+        test_set_data: Optional[List[Dict[str, Any]]] = None,
+        test_set_id: Optional[uuid.UUID] = None,
+        count: Optional[int] = None,
+    ):
+        self.db = db
+        self.test_set_data = test_set_data
+        self.test_set_id = test_set_id
+        self.count = count if count is not None else len(test_set_data or [])
+
+    @classmethod
+    def for_evaluation(cls, db: AsyncIOMotorDatabase, evaluation: Dict[str, Any]) -> "EvaluationItems":
+        if evaluation.get("test_set_id") is not None:
+            return cls(db, test_set_id=evaluation["test_set_id"], count=evaluation.get("item_count", 0))
+        return cls(db, test_set_data=evaluation.get("test_set_data") or [])
+
+    def __len__(self) -> int:
+        return self.count
+
+    async def window(self, rows: range) -> Sequence[Dict[str, Any]]:
+        """Items for `rows` and their neighbours, indexable by absolute row index."""
+        if self.test_set_id is None:
+            return self.test_set_data
+        first = max(0, rows.start - 1)
+        last = min(self.count, rows.stop + 1)
+        cursor = self.db[TEST_SET_ENTRIES_COLLECTION].find(
+            {"test_set_id": self.test_set_id, "item_index": {"$gte": first, "$lt": last}},
+            ENTRY_ITEM_PROJECTION
+        )
+        items = {entry["item_index"]: _entry_to_item(entry) async for entry in cursor}
+        return TestSetWindow(items, self.count)
+
+    async def chunks(self, chunk_size: int) -> AsyncIterator[Tuple[range, Sequence[Dict[str, Any]]]]:
+        """Yields (rows, window) for consecutive chunks of `chunk_size` rows.
+
+        A stored test set is read with one cursor in item_index order; each chunk is
+        yielded once its following neighbour has been read.
+        """
+        chunk_size = max(1, chunk_size)
+        if self.test_set_id is None:
+            for start in range(0, self.count, chunk_size):
+                yield range(start, min(start + chunk_size, self.count)), self.test_set_data
+            return
+        cursor = self.db[TEST_SET_ENTRIES_COLLECTION].find(
+            {"test_set_id": self.test_set_id, "item_index": {"$lt": self.count}},
+            ENTRY_ITEM_PROJECTION
+        ).sort("item_index", ASCENDING)
+        items: Dict[int, Dict[str, Any]] = {}
+        start = 0
+        async for entry in cursor:
+            index = entry["item_index"]
+            items[index] = _entry_to_item(entry)
+            stop = min(start + chunk_size, self.count)
+            if index >= stop: # The chunk and its following neighbour are in
+                yield range(start, stop), TestSetWindow(items, self.count)
+                items = {i: item for i, item in items.items() if i >= stop - 1} # Keep the previous neighbour
+                start = stop
+        while start < self.count:
+            stop = min(start + chunk_size, self.count)
+            yield range(start, stop), TestSetWindow(items, self.count)
+            start = stop
+
+
+async def count_test_set_entries(db: AsyncIOMotorDatabase, test_set_id: uuid.UUID) -> int:
+    return await db[TEST_SET_ENTRIES_COLLECTION].count_documents({"test_set_id": test_set_id})
+
+
+async def ensure_item_indexes(db: AsyncIOMotorDatabase, test_set_id: uuid.UUID):
+    """Numbers the entries of a test set uploaded before item_index existed (one ordered pass).
+
+    Deterministic, so concurrent calls for the same test set write the same values.
+    """
+    collection = db[TEST_SET_ENTRIES_COLLECTION]
+    if await collection.find_one({"test_set_id": test_set_id, "item_index": None}, {"_id": 1}) is None:
+        return
+    logger.info(f"Backfilling item_index for test set {test_set_id}")
+    updates: List[UpdateOne] = []
+    position = 0
+    async for entry in collection.find({"test_set_id": test_set_id}, {"_id": 1}).sort(ENTRY_ORDER):
+        updates.append(UpdateOne({"_id": entry["_id"]}, {"$set": {"item_index": position}}))
+        position += 1
+        if len(updates) >= ITEM_INDEX_BACKFILL_BATCH:
+            await collection.bulk_write(updates, ordered=False)
+            updates = []
+    if updates:
+        await collection.bulk_write(updates, ordered=False)
+
+
+async def ensure_test_set_indexes(db: AsyncIOMotorDatabase):
+    """Indexes behind the entry reads (called on startup)."""
+    try:
+        await db[TEST_SET_ENTRIES_COLLECTION].create_index(
+            [("test_set_id", ASCENDING), *ENTRY_ORDER],
+            name="test_set_row_order",
+        )
+        await db[TEST_SET_ENTRIES_COLLECTION].create_index(
+            [("test_set_id", ASCENDING), ("item_index", ASCENDING)],
+            name="test_set_item_index",
+        )
+    except Exception as e:
+        logger.warning(f"Could not create test set entry index: {e}")
+# --- End Evaluation Items ---
@@ -0,0 +1,224 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+
+from pymongo import InsertOne
+from pymongo.errors import BulkWriteError
+
+from app.core.config import settings
+from app.db.client import mongo_db
+
+logger = logging.getLogger(__name__)
+
+FLUSH_LATENCY_SAMPLES = 500 # Recent flush latencies kept for the percentiles
+DUPLICATE_KEY_ERROR = 11000
+# Per-operation write errors worth retrying: write conflicts, time limits, and duplicate keys from racing upserts
+RETRYABLE_WRITE_ERROR_CODES = {DUPLICATE_KEY_ERROR, 50, 112, 262}
+
+
+class WriteBehindBuffer:
+    """Collects write operations for one collection and applies them with bulk_write.
+
+    Operations (pymongo UpdateOne/InsertOne/...) are flushed when `max_ops` are
+    pending or the oldest pending one is `max_delay_seconds` old, whichever comes
+    first, so many small writes cost one round trip. A failed flush puts its
+    operations back to be retried with the next flush, so they must be idempotent
+    (upserts, $set by _id); once more than 10 x `max_ops` are pending, add() flushes
+    inline and raises on failure, giving callers backpressure. When the bulk write
+    reports errors for single operations, the others are done: only the rejected
+    ones with a transient error are put back, at most write_buffer_max_attempts
+    times, and the rest are dropped and logged so one bad write cannot block the
+    buffer (or the buffers that flush it first). Callers that need
+    their writes durable (e.g., before a job is marked done) await flush().
+    Buffers in `flush_first` are flushed before every flush of this one, for
+    writes that reference documents written through another buffer.
+    `on_written` / `on_dropped`, if set, are called with the operations once they
+    are durable / once they are given up (rejected for good or lost on shutdown).
+    """
+
+    def __init__(
+        self,
+        collection_name: str,
+        max_ops: Optional[int] = None,
+        max_delay_seconds: Optional[float] = None,
+        flush_first: Optional[List["WriteBehindBuffer"]] = None,
+        name: Optional[str] = None,
+    ):
+        self.collection_name = collection_name
+        self.name = name or collection_name # Key in the admin snapshot
+        self.flush_first = flush_first or []
+        self.max_ops = max(1, max_ops or settings.write_buffer_max_ops)
+        self.max_delay_seconds = max_delay_seconds if max_delay_seconds is not None else settings.write_buffer_max_delay_seconds
+        self._pending: List[Any] = []
+        self._oldest_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+        self._timer: Optional[asyncio.Task] = None
+        self.on_written: Optional[Callable[[List[Any]], None]] = None
+        self.on_dropped: Optional[Callable[[List[Any]], None]] = None
+        # Instrumentation
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.ops_written = 0
+        self.dropped_ops = 0
+        self._attempts: Dict[int, int] = {} # id(operation) -> rejected attempts, for operations put back
+        self.max_batch_size = 0
+        self.write_seconds = 0.0
+        self._latencies: deque = deque(maxlen=FLUSH_LATENCY_SAMPLES)
+
+    async def add(self, operation: Any):
+        """Queues one write; flushes inline when the buffer is full."""
+        self._pending.append(operation)
+        if self._oldest_at is None:
+            self._oldest_at = time.monotonic()
+        if len(self._pending) >= self.max_ops:
+            try:
+                await self.flush()
+            except Exception:
+                if len(self._pending) >= 10 * self.max_ops:
+                    raise # Mongo keeps failing; stop accepting work instead of growing without bound
+        elif self._timer is None or self._timer.done():
+            self._timer = asyncio.ensure_future(self._flush_after_delay())
+
+    async def _flush_after_delay(self):
+        while self._pending:
+            wait = self._oldest_at + self.max_delay_seconds - time.monotonic() if self._oldest_at else 0
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+            try:
+                await self.flush()
+            except Exception:
+                await asyncio.sleep(self.max_delay_seconds) # Logged by flush(); retry with the next interval
+
+    async def flush(self):
+        """Writes everything pending. Raises if the bulk write fails (the operations stay queued)."""
+        for dependency in self.flush_first:
+            await dependency.flush()
+        async with self._lock:
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, []
+            self._oldest_at = None
+            if mongo_db.db is None:
+                self._requeue(batch)
+                raise RuntimeError("Database connection is not available.")
+            started = time.monotonic()
+            try:
+                await mongo_db.db[self.collection_name].bulk_write(batch, ordered=False)
+            except BulkWriteError as e:
+                self.failed_flushes += 1
+                if self._requeue_rejected(batch, e):
+                    raise # Some writes are still pending
+                return
+            except Exception as e:
+                self.failed_flushes += 1
+                self._requeue(batch)
+                logger.error(f"Write buffer '{self.name}': bulk write of {len(batch)} operations failed, will retry: {e}")
+                raise
+            elapsed = time.monotonic() - started
+            self.flushes += 1
+            self.ops_written += len(batch)
+            for operation in batch:
+                self._attempts.pop(id(operation), None)
+            self._notify(self.on_written, batch)
+            self.max_batch_size = max(self.max_batch_size, len(batch))
+            self.write_seconds += elapsed
+            self._latencies.append(elapsed)
+            logger.debug(f"Write buffer '{self.name}': wrote {len(batch)} operations in {elapsed * 1000:.1f} ms")
+
+    def _requeue_rejected(self, batch: List[Any], error: BulkWriteError) -> bool:
+        """Puts back the operations of a partly failed bulk write that may succeed when retried. Returns True if any were."""
+        details = error.details or {}
+        if details.get("writeConcernErrors"):
+            logger.warning(f"Write buffer '{self.name}': write concern not satisfied: {details['writeConcernErrors']}")
+        rejected = {write_error["index"]: write_error for write_error in details.get("writeErrors", [])}
+        retry, written, dropped = [], [], []
+        for index, operation in enumerate(batch):
+            write_error = rejected.get(index)
+            attempts = self._attempts.pop(id(operation), 0) + 1
+            if write_error is None:
+                written.append(operation) # Applied
+                continue
+            code = write_error.get("code")
+            if code == DUPLICATE_KEY_ERROR and isinstance(operation, InsertOne):
+                written.append(operation) # Inserted by an earlier attempt whose reply was lost
+                continue
+            if code in RETRYABLE_WRITE_ERROR_CODES and attempts < settings.write_buffer_max_attempts:
+                self._attempts[id(operation)] = attempts
+                retry.append(operation)
+            else:
+                dropped.append(operation)
+                logger.error(f"Write buffer '{self.name}': dropped {operation} after {attempts} attempt(s): {write_error.get('errmsg')} (code {code})")
+        self.ops_written += len(batch) - len(rejected)
+        self.dropped_ops += len(dropped)
+        self._notify(self.on_written, written)
+        self._notify(self.on_dropped, dropped)
+        if retry:
+            self._requeue(retry)
+        logger.error(f"Write buffer '{self.name}': {len(rejected)} of {len(batch)} operations rejected, {len(retry)} will be retried.")
+        return bool(retry)
+
+    def _notify(self, callback: Optional[Callable[[List[Any]], None]], operations: List[Any]):
+        if callback is None or not operations:
+            return
+        try:
+            callback(operations)
+        except Exception as e:
+            logger.error(f"Write buffer '{self.name}': write callback failed: {e}", exc_info=True)
+
+    def _requeue(self, batch: List[Any]):
+        self._pending[:0] = batch
+        if self._oldest_at is None:
+            self._oldest_at = time.monotonic()
+
+    async def close(self):
+        """Flushes what is pending (called on shutdown)."""
+        if self._timer is not None:
+            self._timer.cancel()
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"Write buffer '{self.name}': {len(self._pending)} operations lost on shutdown: {e}")
+            self.dropped_ops += len(self._pending)
+            lost, self._pending = self._pending, []
+            self._notify(self.on_dropped, lost)
+
+    def snapshot(self) -> Dict[str, Any]:
+        ordered = sorted(self._latencies)
+        def percentile(p: float) -> Optional[float]:
+            return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000, 1) if ordered else None
+        return {
+            "pending": len(self._pending),
+            "flushes": self.flushes,
+            "failed_flushes": self.failed_flushes,
+            "ops_written": self.ops_written,
+            "dropped_ops": self.dropped_ops,
+            "avg_batch_size": round(self.ops_written / self.flushes, 1) if self.flushes else None,
+            "max_batch_size": self.max_batch_size,
+            "avg_write_ms": round(self.write_seconds / self.flushes * 1000, 1) if self.flushes else None,
+            "p50_write_ms": percentile(0.5),
+            "p95_write_ms": percentile(0.95),
+        }
+
+
+# Deduplicated prompt texts (see prompt_store); flushed before the result rows that reference them
+prompt_text_writes = WriteBehindBuffer("prompt_texts")
+# Generated result rows and judge updates for evaluation_results
+result_writes = WriteBehindBuffer("evaluation_results", flush_first=[prompt_text_writes])
+# Verdicts of pipelined judging; flushed after the row upserts they update
+judge_writes = WriteBehindBuffer("evaluation_results", flush_first=[result_writes], name="evaluation_results.judge")
+# Progress events (see progress_events); flushed after the rows they announce
+progress_event_writes = WriteBehindBuffer("evaluation_events", flush_first=[judge_writes])
+
+WRITE_BUFFERS = (prompt_text_writes, result_writes, judge_writes, progress_event_writes) # In flush order
+
+
+def write_buffers_snapshot() -> Dict[str, Any]:
+    return {buffer.name: buffer.snapshot() for buffer in WRITE_BUFFERS}
+
+
+async def close_write_buffers():
+    for buffer in WRITE_BUFFERS:
+        await buffer.close()
@@ -25,7 +25,7 @@ import {
 import type { Prompt, EvaluationResult, Evaluation, UploadedFileInfo, ColumnMapping, TestSetUploadResponse, UserTestSetSummary, TestSetEntryBase } from "@/types"
 import { ScrollArea } from "@/components/ui/scroll-area"
 import { toast } from "sonner"
-import { apiClient } from "@/lib/apiClient"
+import { apiClient, apiEventStream } from "@/lib/apiClient"
 import TestSetUploadForm from './TestSetUploadForm'
 import * as XLSX from 'xlsx'
 
@@ -127,6 +127,9 @@ export function EvaluationPanel({ currentLanguage }: EvaluationPanelProps) {
   // ADDED: State for showing sent prompts
   const [showSentPrompts, setShowSentPrompts] = useState(false);
 
+  // Judge each row as soon as it is generated (pipelined judging)
+  const [judgePipelined, setJudgePipelined] = useState(false);
+
   // Projects data
   const projects = [
     { id: "genshin", name: "Genshin" },
@@ -150,9 +153,10 @@ export function EvaluationPanel({ currentLanguage }: EvaluationPanelProps) {
   const [pendingOutputs, setPendingOutputs] = useState<Set<string>>(new Set());
   // --- End Pending State ---
 
-  // --- Add Polling State --- M
-  const [pollingIntervalId, setPollingIntervalId] = useState<NodeJS.Timeout | null>(null);
-  // --- End Polling State ---
+  // --- Progress Stream State --- M
+  const [progressStreamActive, setProgressStreamActive] = useState(false);
+  const [progressSummary, setProgressSummary] = useState<{ rows_done: number; rows_total: number; rows_per_second: number; eta_seconds: number | null } | null>(null);
+  // --- End Progress Stream State ---
 
   // --- State for uploaded test set file --- NEW
   const [uploadedTestSetFile, setUploadedTestSetFile] = useState<UploadedFileInfo | null>(null);
@@ -383,15 +387,6 @@ export function EvaluationPanel({ currentLanguage }: EvaluationPanelProps) {
     return model ? model.name : "未知模型"
   }
 
-  // Function to clear any active polling
-  const clearPolling = () => {
-    if (pollingIntervalId) {
-      clearInterval(pollingIntervalId);
-      setPollingIntervalId(null);
-      console.log("Polling stopped.");
-    }
-  };
-
   // --- NEW: Function to fetch only the full results --- M
   const fetchFullEvaluationResults = async (evalId: string) => {
     if (!evalId) return;
@@ -403,7 +398,8 @@ export function EvaluationPanel({ currentLanguage }: EvaluationPanelProps) {
         // 2. Fetch the results (only if still needed?)
         // If check_completion returns updated data, maybe we don't need separate results call?
         // Assuming for now we still need it:
-        const resultsData = await apiClient<EvaluationResult[]>(`/evaluations/${evalId}/results`);
+        // Sent prompts are stored by hash on the backend; only ask for them when they are shown
+        const resultsData = await apiClient<EvaluationResult[]>(`/evaluations/${evalId}/results?include_sent_prompts=${showSentPrompts}`);
         setEvaluationResults(resultsData);
 
         // Note: Pending state update is removed, should be handled based on status polling
@@ -416,105 +412,76 @@ export function EvaluationPanel({ currentLanguage }: EvaluationPanelProps) {
   };
   // --- End Fetch Full Results ---
 
-  // --- NEW: Function to poll status --- M
-  const pollStatus = async (evalId: string) => {
-      if (!evalId) return;
-      console.log(`Polling CHECK_COMPLETION for evaluation ID: ${evalId}`);
-      try {
-          // FIX: Call check_completion endpoint which returns the full Evaluation object
-          const evalData = await apiClient<Evaluation>(`/evaluations/${evalId}/check_completion`, { method: 'PATCH' });
-          console.log("[Polling] Received Eval Data from check_completion:", evalData);
-
-          const newEvalStatus = evalData.status ?? null;
-          const newJudgeStatus = evalData.judge_status ?? null;
-
-          let shouldFetchFullResults = false;
-
-          // Update state if status changed
-          if (newEvalStatus !== evaluationStatus) {
-              console.log(`[Status Poll] Evaluation status changed: ${evaluationStatus} -> ${newEvalStatus}`);
-              setEvaluationStatus(newEvalStatus);
-              if (newEvalStatus === 'completed' || newEvalStatus === 'failed') {
-                 shouldFetchFullResults = true; // Fetch results when eval completes/fails
-                 setPendingOutputs(new Set()); // Clear pending gen outputs
-              }
-          }
-          if (newJudgeStatus !== judgeStatus) {
-              console.log(`[Status Poll] Judge status changed: ${judgeStatus} -> ${newJudgeStatus}`);
-              setJudgeStatus(newJudgeStatus);
-              if (newJudgeStatus === 'completed' || newJudgeStatus === 'failed') {
-                 shouldFetchFullResults = true; // Also fetch results when judge completes/fails
-              }
-          }
-
-          // Decide whether to stop polling
-          const isGenerationDone = newEvalStatus === 'completed' || newEvalStatus === 'failed';
-          const isJudgeDone = newJudgeStatus === 'completed' || newJudgeStatus === 'failed' || newJudgeStatus === 'not_started' || newJudgeStatus === null;
-
-          if (isGenerationDone && isJudgeDone) {
-              // Always clear the interval if both are done
-              clearPolling(); 
-              // Only show toast and log stop if not already shown for this run
-              if (!isCompletionToastShown) {
-                  setIsCompletionToastShown(true); // Set flag immediately
-                  const combinedStatus = `Eval: ${newEvalStatus ?? '-'} / Judge: ${newJudgeStatus ?? '-'}`;
-                  toast.info(`评估 ${evalId} 已完成。状态： ${combinedStatus}`);
-                  console.log(`Polling stopped by pollStatus (toast shown). Final Status: ${combinedStatus}`);
-                  shouldFetchFullResults = true; // Ensure final results are fetched
-              } else {
-                  console.log(`Polling stopped by pollStatus (toast already shown). Final Status: Eval: ${newEvalStatus ?? '-'} / Judge: ${newJudgeStatus ?? '-'}`);
-              }
-          } else {
-             // If still active, maybe fetch results less often? Or only on state change?
-             // For now, fetch results only if status changed to final state (handled above)
-             console.log(`[Status Poll] Still active. Eval: ${newEvalStatus}, Judge: ${newJudgeStatus}`);
-          }
+  // Reload the results with their sent prompts when the toggle is switched on
+  useEffect(() => {
+    if (showSentPrompts && currentEvaluationId) {
+      fetchFullEvaluationResults(currentEvaluationId);
+    }
+  }, [showSentPrompts]);
 
-          // Fetch full results if needed based on status changes
-          if (shouldFetchFullResults) {
-              console.log("[Status Poll] Triggering fetchFullEvaluationResults based on status change.");
-              fetchFullEvaluationResults(evalId);
-          }
+  // --- Progress Stream Effect --- M
+  // The backend pushes row, status and judge events (server-sent events) while generation or judging is active.
+  const isProgressActive = evaluationStatus === 'pending' || evaluationStatus === 'running' || judgeStatus === 'pending' || (judgeStatus === 'running' && evaluationStatus !== 'paused');
 
-      } catch (error) {
-          console.error("Failed during status poll:", error);
-          toast.error(`状态轮询失败： ${error instanceof Error ? error.message : "未知错误"}`);
-          // Consider stopping polling on error?
-          // clearPolling();
+  useEffect(() => {
+      if (!currentEvaluationId || !isProgressActive) {
+          return;
       }
-  };
-  // --- End Poll Status ---
+      const evalId = currentEvaluationId;
+      setProgressStreamActive(true);
+      const closeStream = apiEventStream(
+          `/evaluations/${evalId}/events`,
+          (type, data) => {
+              if (type === 'progress') {
+                  setProgressSummary(data);
+                  if (data.status) setEvaluationStatus(data.status);
+                  if (data.judge_status) setJudgeStatus(data.judge_status); // Keep an optimistic 'pending' until the server reports one
+              } else if (type === 'row') {
+                  // Row finished: stop its spinner (row ids follow the order rows were sent in)
+                  const rowId = testRows[data.row_index]?.id;
+                  const columnIds = columns.filter(col => col.selectedVersionId === data.prompt_id).map(col => col.id);
+                  if (rowId) {
+                      setPendingOutputs(prev => {
+                          const next = new Set(prev);
+                          columnIds.forEach(colId => next.delete(`${rowId}-${colId}`));
+                          return next;
+                      });
+                  }
+              } else if (type === 'status') {
+                  if (data.status) setEvaluationStatus(data.status);
+                  if (data.judge_status) setJudgeStatus(data.judge_status);
+              }
+          },
+          (error) => {
+              setProgressStreamActive(false);
+              if (error) {
+                  toast.error(`进度推送失败： ${error instanceof Error ? error.message : "未知错误"}`);
+              }
+          }
+      );
+      return () => {
+          closeStream();
+          setProgressStreamActive(false);
+      };
+  }, [currentEvaluationId, isProgressActive]);
 
-  // --- Polling Effect --- M
+  // Load the full results whenever generation or judging reaches a final state
   useEffect(() => {
-       // Determine if either generation or judging is active
-       const isGenerationActive = evaluationStatus === 'pending' || evaluationStatus === 'running';
-       const isJudgingActive = judgeStatus === 'pending'; // Only pending indicates active judging
- 
-       // --- MODIFIED: Always attempt fetch if ID exists, let fetch handle stop --- M
-       if (currentEvaluationId) { 
-           console.log(`Polling useEffect triggered for ${currentEvaluationId}. EvalStatus: ${evaluationStatus}, JudgeStatus: ${judgeStatus}`);
-           // Clear any existing interval first
-           clearPolling();
-           // Call pollStatus immediately, it might trigger fetchFullEvaluationResults
-           pollStatus(currentEvaluationId); 
-           // Set interval - fetchFullEvaluationResults will clear this if needed
-           const intervalId = setInterval(() => {
-               pollStatus(currentEvaluationId); // Poll status endpoint
-           }, 5000); // Poll every 5 seconds
-           setPollingIntervalId(intervalId);
-       } else {
-           // Stop polling if no active evaluation ID
-           console.log("Polling useEffect: No currentEvaluationId, stopping polling.");
-           clearPolling();
-       }
- 
-       // Cleanup function to stop polling when component unmounts or deps change
-       return () => {
-           clearPolling();
-       };
+      if (!currentEvaluationId) return;
+      const isGenerationDone = evaluationStatus === 'completed' || evaluationStatus === 'failed' || evaluationStatus === 'paused' || evaluationStatus === 'cancelled';
+      const isJudgeDone = judgeStatus === 'completed' || judgeStatus === 'failed' || judgeStatus === 'not_started' || judgeStatus === null;
+      if (isGenerationDone) {
+          setPendingOutputs(new Set());
+      }
+      if (isGenerationDone) {
+          fetchFullEvaluationResults(currentEvaluationId);
+      }
+      if (isGenerationDone && isJudgeDone && !isCompletionToastShown) {
+          setIsCompletionToastShown(true);
+          toast.info(`评估 ${currentEvaluationId} 已完成。状态： Eval: ${evaluationStatus ?? '-'} / Judge: ${judgeStatus ?? '-'}`);
+      }
   }, [currentEvaluationId, evaluationStatus, judgeStatus]);
-  // --- End Polling Effect ---
+  // --- End Progress Stream Effect ---
 
   // --- Function to parse file headers --- NEW
   const parseFileHeaders = async (file: File): Promise<string[]> => {
@@ -766,7 +733,8 @@ export function EvaluationPanel({ currentLanguage }: EvaluationPanelProps) {
     const requestBody = {
         prompt_ids: promptIds as string[],
         test_set_data: currentTestSetData,
-        test_set_name: currentTestSetName
+        test_set_name: currentTestSetName,
+        judge_pipelined: judgePipelined
     };
 
     console.log("Evaluation Request Body:", requestBody);
@@ -779,6 +747,7 @@ export function EvaluationPanel({ currentLanguage }: EvaluationPanelProps) {
         console.log("Evaluation started:", evaluationData);
         setCurrentEvaluationId(evaluationData.id);
         setEvaluationStatus(evaluationData.status);
+        setJudgeStatus(evaluationData.judge_status ?? null); // 'running' when judging is pipelined
         toast.success(`评估 ${evaluationData.id} 已成功开始！`);
 
         const initialPending = new Set<string>();
@@ -902,6 +871,32 @@ export function EvaluationPanel({ currentLanguage }: EvaluationPanelProps) {
   };
   // --- End Save Handler ---
 
+  // --- Pause / Cancel / Resume Handlers --- M
+  const handleStopEvaluation = async (action: 'pause' | 'cancel') => {
+    if (!currentEvaluationId) return;
+    try {
+        const evaluation = await apiClient(`/evaluations/${currentEvaluationId}/${action}`, { method: 'POST' });
+        setEvaluationStatus(evaluation.status); // Partial results are kept; the final-state effect loads them
+        toast.info(action === 'pause' ? "评估已暂停，可稍后继续。" : "评估已取消。");
+    } catch (error) {
+        console.error(`Failed to ${action} evaluation:`, error);
+        toast.error(`${action === 'pause' ? '暂停' : '取消'}评估失败： ${error instanceof Error ? error.message : "未知错误"}`);
+    }
+  };
+
+  const handleResumeEvaluation = async () => {
+    if (!currentEvaluationId) return;
+    try {
+        const evaluation = await apiClient(`/evaluations/${currentEvaluationId}/resume`, { method: 'POST' });
+        setIsCompletionToastShown(false);
+        setEvaluationStatus(evaluation.status); // The progress stream reopens while it is running
+    } catch (error) {
+        console.error("Failed to resume evaluation:", error);
+        toast.error(`继续评估失败： ${error instanceof Error ? error.message : "未知错误"}`);
+    }
+  };
+  // --- End Pause / Cancel / Resume Handlers ---
+
   // --- Handler to Trigger LLM Judging --- M
   const handleRunLLMJudge = async () => {
     if (!currentEvaluationId) {
@@ -925,7 +920,7 @@ export function EvaluationPanel({ currentLanguage }: EvaluationPanelProps) {
         });
         // No need to parse response body if using 202 Accepted
         toast.success("LLM 评审流程已成功启动。");
-        // Polling should automatically pick up the status change
+        // The progress stream picks up the status change
     } catch (error) {
         console.error("Failed to start LLM judging:", error);
         toast.error(`启动 LLM 评审失败： ${error instanceof Error ? error.message : "未知错误"}`);
@@ -977,6 +972,18 @@ export function EvaluationPanel({ currentLanguage }: EvaluationPanelProps) {
             </Label>
           </div>
 
+          {/* Pipelined judging toggle (applies to the next run) */}
+          <div className="flex items-center space-x-2">
+            <Checkbox
+              id="judge-pipelined"
+              checked={judgePipelined}
+              onCheckedChange={(checked) => setJudgePipelined(!!checked)}
+            />
+            <Label htmlFor="judge-pipelined" className="text-sm whitespace-nowrap">
+              边生成边评审
+            </Label>
+          </div>
+
         </div>
 
         <div className="flex items-center gap-2">
@@ -994,12 +1001,32 @@ export function EvaluationPanel({ currentLanguage }: EvaluationPanelProps) {
             </PopoverContent>
           </Popover>
 
+          {/* Live progress pushed by the backend */}
+          {progressStreamActive && progressSummary && (
+            <span className="text-xs text-muted-foreground whitespace-nowrap">
+              {progressSummary.rows_done}/{progressSummary.rows_total} 行
+              {progressSummary.rows_per_second > 0 ? ` · ${progressSummary.rows_per_second} 行/秒` : ''}
+              {progressSummary.eta_seconds != null && progressSummary.eta_seconds > 0 ? ` · 剩余约 ${Math.ceil(progressSummary.eta_seconds)} 秒` : ''}
+            </span>
+          )}
+
           {/* Run Evaluation Button */}
-          <Button onClick={handleRunEvaluation} disabled={isLoading || !!pollingIntervalId}>
+          <Button onClick={handleRunEvaluation} disabled={isLoading || progressStreamActive}>
             <Play className="mr-2 h-4 w-4" />
             {evaluationStatus === 'pending' || evaluationStatus === 'running' ? "运行中..." : "运行评估"}
           </Button>
 
+          {/* Pause / Cancel / Resume */}
+          {(evaluationStatus === 'pending' || evaluationStatus === 'running') && (
+            <>
+              <Button variant="outline" onClick={() => handleStopEvaluation('pause')} disabled={!currentEvaluationId}>暂停</Button>
+              <Button variant="outline" onClick={() => handleStopEvaluation('cancel')} disabled={!currentEvaluationId}>取消</Button>
+            </>
+          )}
+          {evaluationStatus === 'paused' && (
+            <Button variant="outline" onClick={handleResumeEvaluation}>继续</Button>
+          )}
+
           {/* Run LLM Judge Button */}
           <Button
              variant="outline"
@@ -1008,7 +1035,7 @@ export function EvaluationPanel({ currentLanguage }: EvaluationPanelProps) {
              title={!currentEvaluationId ? "请先运行评估" : (judgeStatus && judgeStatus !== 'failed' && judgeStatus !== 'not_started') ? `评审状态：${judgeStatus}` : "运行 LLM 评审评估"}
           >
             {/* Consider adding an icon e.g., <Sparkles className="mr-2 h-4 w-4" /> */}
-             {judgeStatus === 'pending' ? '评审中...' : '运行 LLM 评审'}
+             {judgeStatus === 'pending' || judgeStatus === 'running' ? '评审中...' : '运行 LLM 评审'}
           </Button>
 
           {/* Status Display */}
@@ -1255,7 +1282,7 @@ export function EvaluationPanel({ currentLanguage }: EvaluationPanelProps) {
                                       type="button"
                                       className={`w-5 h-5 ${ (output.score || 0) >= star ? "text-yellow-500" : "text-gray-300 dark:text-gray-600" }`}
                                       onClick={() => resultId && handleScoreChange(resultId, column.id, star)}
-                                      disabled={!!pollingIntervalId || isLoading || isJudgingPending}
+                                      disabled={progressStreamActive || isLoading || isJudgingPending}
                                     >
                                       ★
                                     </button>
@@ -1268,7 +1295,7 @@ export function EvaluationPanel({ currentLanguage }: EvaluationPanelProps) {
                                   onChange={(e) => resultId && handleCommentChange(resultId, column.id, e.target.value)}
                                   className="text-xs border rounded-md p-1 min-h-[50px] resize-y focus-visible:ring-1"
                                   rows={2}
-                                  disabled={!!pollingIntervalId || isLoading || isJudgingPending}
+                                  disabled={progressStreamActive || isLoading || isJudgingPending}
                                 />
                               </div>
                            </div>
@@ -1483,7 +1510,7 @@ export function EvaluationPanel({ currentLanguage }: EvaluationPanelProps) {
           <Download className="mr-2 h-4 w-4" />
           导出结果
         </Button>
-        <Button onClick={handleSaveEvaluation} disabled={!currentEvaluationId || isLoading || !!pollingIntervalId || judgeStatus === 'pending'}>
+        <Button onClick={handleSaveEvaluation} disabled={!currentEvaluationId || isLoading || progressStreamActive || judgeStatus === 'pending'}>
             保存评估
         </Button>
       </div>
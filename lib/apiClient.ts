@@ -81,4 +81,71 @@ export const apiClient = async <T = any>(
         // Re-throw the error so calling components can handle it
         throw error;
     }
-}; 
\ No newline at end of file
+}; 
+
+/**
+ * Opens a server-sent event stream with the same base URL and Authorization header as apiClient
+ * (EventSource cannot send headers, so the stream is read with fetch).
+ * Calls onEvent(type, data) for every event and onClose when the stream ends or fails.
+ * Returns a function that closes the stream.
+ */
+export const apiEventStream = (
+    endpoint: string,
+    onEvent: (type: string, data: any) => void,
+    onClose?: (error?: unknown) => void
+): (() => void) => {
+    let token: string | null = null;
+    if (typeof window !== 'undefined') {
+         try {
+             token = localStorage.getItem('authToken');
+         } catch (error) {
+             console.error("Error accessing localStorage for token:", error);
+         }
+    }
+    const url = endpoint.startsWith('http') ? endpoint : `${API_BASE_URL}${endpoint}`;
+    const headers = new Headers({ Accept: 'text/event-stream' });
+    if (token) {
+        headers.set('Authorization', `Bearer ${token}`);
+    }
+    const controller = new AbortController();
+
+    (async () => {
+        try {
+            const response = await fetch(url, { headers, signal: controller.signal });
+            if (!response.ok || !response.body) {
+                throw new Error(`HTTP error! Status: ${response.status} - ${response.statusText}`);
+            }
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = "";
+            while (true) {
+                const { done, value } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+                let boundary = buffer.indexOf("\n\n");
+                while (boundary !== -1) {
+                    const block = buffer.slice(0, boundary);
+                    buffer = buffer.slice(boundary + 2);
+                    boundary = buffer.indexOf("\n\n");
+                    let type = "message";
+                    const dataLines: string[] = [];
+                    for (const line of block.split("\n")) {
+                        if (line.startsWith("event: ")) type = line.slice(7);
+                        else if (line.startsWith("data: ")) dataLines.push(line.slice(6));
+                    }
+                    if (dataLines.length > 0) { // Lines starting with ':' are keep-alives
+                        onEvent(type, JSON.parse(dataLines.join("\n")));
+                    }
+                }
+            }
+            onClose?.();
+        } catch (error) {
+            if (!controller.signal.aborted) {
+                console.error(`Event stream error: ${url}`, error);
+                onClose?.(error);
+            }
+        }
+    })();
+
+    return () => controller.abort();
+};
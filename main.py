@@ -1,3 +1,4 @@
+import asyncio
 import logging
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
@@ -15,6 +16,16 @@ from app.db.client import connect_to_mongo, close_mongo_connection, get_database
 from app.routes import prompts, evaluations, evaluation_sessions, test_sets
 from app.routes import auth # Import the auth router
 from app.routes import prompt_config
+from app.routes import admin
+from app.services.llm_endpoints import endpoint_pool
+from app.services.output_budget import output_budget
+from app.services.llm_cache import response_cache
+from app.services.job_queue import job_queue
+from app.services.job_worker import JobWorker
+from app.services.write_buffer import close_write_buffers
+from app.services.test_set_service import ensure_test_set_indexes
+from app.services.progress_events import ensure_events_collection, progress_hub
+from app.services.process_stats import process_stats
 
 # Configure logging - Using settings.logging_level
 logging.basicConfig(level=settings.logging_level, 
@@ -54,9 +65,31 @@ async def lifespan(app: FastAPI):
     # Get the database instance and attach it to the app state
     # This makes it accessible via request.app.db in route handlers
     app.db = await get_database() 
+    await response_cache.ensure_indexes(app.db)
+    await job_queue.ensure_indexes(app.db)
+    await evaluations.ensure_result_indexes(app.db)
+    await ensure_test_set_indexes(app.db)
+    await ensure_events_collection(app.db)
+    await output_budget.load_from_results(app.db)
+    # Jobs normally run in separate `python worker.py` processes; embedded runners are for single-process setups
+    embedded_worker = None
+    if settings.job_embedded_workers > 0:
+        embedded_worker = JobWorker(app.db, evaluations.JOB_HANDLERS, concurrency=settings.job_embedded_workers)
+        embedded_worker_task = asyncio.ensure_future(embedded_worker.run())
+    sweeper_task = asyncio.ensure_future(evaluations.run_evaluation_sweeper(app.db))
+    stats_task = asyncio.ensure_future(process_stats.run_publisher(app.db, "api"))
     yield
     # Code to run on shutdown
     main_app_logger.info("Application shutdown...")
+    sweeper_task.cancel()
+    stats_task.cancel()
+    await asyncio.gather(sweeper_task, stats_task, return_exceptions=True)
+    if embedded_worker is not None:
+        embedded_worker.stop()
+        await embedded_worker_task
+    await progress_hub.close()
+    await close_write_buffers()
+    await endpoint_pool.close()
     await close_mongo_connection()
     app.db = None # Clear the reference on shutdown
 
@@ -101,6 +134,7 @@ app.include_router(evaluations.router, prefix="/api/v1/evaluations", tags=["Eval
 app.include_router(evaluation_sessions.router, prefix="/api/v1/evaluation-sessions", tags=["Evaluation Sessions"])
 app.include_router(prompt_config.router, prefix="/api/v1", tags=["Prompt Configuration"])
 app.include_router(test_sets.router)
+app.include_router(admin.router, prefix="/api/v1/admin", tags=["Admin"])
 
 # Placeholder for future evaluation router
 # from app.routes import evaluations
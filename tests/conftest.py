@@ -0,0 +1,14 @@
+import os
+
+# Settings are read on import; give the required ones test values before any app module loads
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017/promptcraft_test")
+os.environ.setdefault("ANTHROPIC_API_KEY", "test-key")
+os.environ.setdefault("SECRET_KEY", "test-secret")
+
+import pytest
+
+
+@pytest.fixture
+def anyio_backend():
+    """Async tests (marked anyio) run on asyncio, like the app."""
+    return "asyncio"
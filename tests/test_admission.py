@@ -0,0 +1,98 @@
+from datetime import datetime, timedelta
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+from app.core.config import settings
+from app.services.admission import AdmissionController
+from app.services.job_queue import JOBS_COLLECTION, JOB_DONE, JOB_LEASED, JOB_QUEUED
+from app.services.llm_endpoints import endpoint_pool
+from app.services.scheduler import PRIORITY_BULK, PRIORITY_INTERACTIVE, PRIORITY_RANKS
+
+INTERACTIVE = PRIORITY_RANKS[PRIORITY_INTERACTIVE]
+BULK = PRIORITY_RANKS[PRIORITY_BULK]
+
+
+@pytest.fixture
+def one_endpoint(monkeypatch):
+    """The pool's endpoint with this process's share of the token quotas: 3000 input + 3000 output tokens/minute."""
+    controller = endpoint_pool.endpoints()[0].controller
+    monkeypatch.setattr(controller, "input_tokens_per_minute", 3000)
+    monkeypatch.setattr(controller, "output_tokens_per_minute", 3000)
+    return controller
+
+
+def test_quota_throughput_counts_every_process(one_endpoint, monkeypatch):
+    monkeypatch.setattr(settings, "llm_quota_processes", 1)
+    assert AdmissionController()._quota_throughput() == 100
+    monkeypatch.setattr(settings, "llm_quota_processes", 4)
+    assert AdmissionController()._quota_throughput() == 400
+
+
+def test_unlimited_token_quota_means_unknown_throughput(one_endpoint, monkeypatch):
+    monkeypatch.setattr(one_endpoint, "output_tokens_per_minute", 0)
+    assert AdmissionController()._quota_throughput() is None
+
+
+@pytest.fixture
+def drain_limits(monkeypatch):
+    monkeypatch.setattr(settings, "admission_max_drain_seconds", {PRIORITY_INTERACTIVE: 60.0, PRIORITY_BULK: 0.0})
+
+
+def load(backlog, throughput):
+    return {"backlog": backlog, "running_jobs": 1, "throughput": throughput, "throughput_source": "measured", "finished_jobs": 10}
+
+
+def test_backlog_counts_the_class_and_those_ahead_of_it(drain_limits):
+    controller = AdmissionController()
+    backlog = {INTERACTIVE: 1000, BULK: 50000, None: 500} # Untagged jobs are claimed first
+    assert controller._decide(load(backlog, 100), PRIORITY_INTERACTIVE).backlog_tokens == 1500
+    assert controller._decide(load(backlog, 100), PRIORITY_BULK).backlog_tokens == 51500
+
+
+def test_admits_while_the_backlog_drains_within_the_limit(drain_limits):
+    controller = AdmissionController()
+    decision = controller._decide(load({INTERACTIVE: 6000}, 100), PRIORITY_INTERACTIVE)
+    assert decision.admitted and decision.drain_seconds == 60
+
+    decision = controller._decide(load({INTERACTIVE: 9000}, 100), PRIORITY_INTERACTIVE)
+    assert not decision.admitted
+    assert decision.drain_seconds == 90
+    assert decision.retry_after_seconds() == 31 # Until the drain time is back under 60s
+
+
+def test_unknown_throughput_or_no_limit_always_admits(drain_limits):
+    controller = AdmissionController()
+    assert controller._decide(load({INTERACTIVE: 10 ** 9}, None), PRIORITY_INTERACTIVE).admitted
+    assert controller._decide(load({BULK: 10 ** 9}, 1), PRIORITY_BULK).admitted # Limit 0: unlimited
+
+
+@pytest.mark.anyio
+async def test_measured_throughput_is_per_job_slot_times_running_jobs(one_endpoint, monkeypatch):
+    monkeypatch.setattr(settings, "admission_min_finished_jobs", 2)
+    db = AsyncMongoMockClient()["promptcraft_test"]
+    now = datetime.utcnow()
+    await db[JOBS_COLLECTION].insert_many([
+        # Two finished jobs: 3000 tokens in 30 busy seconds -> 100 tokens/s per slot
+        {"status": JOB_DONE, "est_tokens": 1000, "first_claimed_at": now - timedelta(seconds=20), "finished_at": now - timedelta(seconds=10)},
+        {"status": JOB_DONE, "est_tokens": 2000, "first_claimed_at": now - timedelta(seconds=25), "finished_at": now - timedelta(seconds=5)},
+        {"status": JOB_LEASED, "priority_rank": INTERACTIVE, "est_tokens": 400},
+        {"status": JOB_LEASED, "priority_rank": BULK, "est_tokens": 600},
+        {"status": JOB_QUEUED, "priority_rank": BULK, "est_tokens": 5000},
+    ])
+    controller = AdmissionController()
+    decision = await controller.check(db, PRIORITY_BULK)
+    assert decision.throughput_tokens_per_second == 200 # Two running jobs
+    assert decision.backlog_tokens == 6000
+    assert decision.drain_seconds == 30
+    assert controller.admitted == {PRIORITY_BULK: 1}
+
+
+@pytest.mark.anyio
+async def test_falls_back_to_the_quotas_without_enough_history(one_endpoint, monkeypatch):
+    monkeypatch.setattr(settings, "llm_quota_processes", 1)
+    db = AsyncMongoMockClient()["promptcraft_test"]
+    await db[JOBS_COLLECTION].insert_one({"status": JOB_QUEUED, "priority_rank": INTERACTIVE, "est_tokens": 3000})
+    decision = await AdmissionController().forecast(db, PRIORITY_INTERACTIVE)
+    assert decision.throughput_tokens_per_second == 100
+    assert decision.drain_seconds == 30
@@ -0,0 +1,112 @@
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Tuple
+
+import pytest
+from bson import ObjectId
+from mongomock_motor import AsyncMongoMockClient
+
+from app.core.config import settings
+from app.routes import evaluations
+from app.services.job_queue import EVALUATION_ITEMS_JOB, JOB_LEASED, JOBS_COLLECTION
+
+
+@pytest.fixture
+def db():
+    return AsyncMongoMockClient()["promptcraft_test"]
+
+
+@pytest.fixture
+def events(monkeypatch) -> List[Tuple[Any, str, Dict[str, Any]]]:
+    published = []
+
+    async def publish(evaluation_id, event_type, data):
+        published.append((evaluation_id, event_type, data))
+
+    monkeypatch.setattr(evaluations, "publish", publish)
+    return published
+
+
+async def create_evaluation(db, total: int, **fields) -> ObjectId:
+    evaluation_id = ObjectId()
+    await db[evaluations.EVAL_COLLECTION].insert_one({
+        "_id": evaluation_id, "status": "running", "total_prompt_tasks": total, "completed_prompt_tasks": 0,
+        "created_at": datetime.utcnow(), "started_at": datetime.utcnow(), **fields,
+    })
+    return evaluation_id
+
+
+async def finish_unit(db, evaluation_id: ObjectId, error=None):
+    await evaluations.count_finished_evaluation_job(db, {"_id": ObjectId(), "evaluation_id": evaluation_id}, error)
+
+
+def status_events(events, evaluation_id) -> List[str]:
+    return [data["status"] for target, _, data in events if target == evaluation_id and "status" in data]
+
+
+@pytest.mark.anyio
+async def test_last_work_unit_completes_the_evaluation(db, events):
+    evaluation_id = await create_evaluation(db, total=3)
+    await finish_unit(db, evaluation_id)
+    await finish_unit(db, evaluation_id, error="gave up") # A failed unit still counts as finished
+    evaluation = await db[evaluations.EVAL_COLLECTION].find_one({"_id": evaluation_id})
+    assert (evaluation["status"], evaluation["completed_prompt_tasks"]) == ("running", 2)
+    assert evaluation.get("completed_at") is None
+
+    await finish_unit(db, evaluation_id)
+    evaluation = await db[evaluations.EVAL_COLLECTION].find_one({"_id": evaluation_id})
+    assert (evaluation["status"], evaluation["completed_prompt_tasks"]) == ("completed", 3)
+    assert evaluation["completed_at"] is not None
+    assert status_events(events, evaluation_id) == ["completed"]
+
+
+@pytest.mark.anyio
+async def test_units_counted_after_completion_do_not_complete_again(db, events):
+    evaluation_id = await create_evaluation(db, total=1)
+    await finish_unit(db, evaluation_id)
+    completed_at = (await db[evaluations.EVAL_COLLECTION].find_one({"_id": evaluation_id}))["completed_at"]
+    await finish_unit(db, evaluation_id) # A unit re-run after a lost lease
+    evaluation = await db[evaluations.EVAL_COLLECTION].find_one({"_id": evaluation_id})
+    assert evaluation["completed_at"] == completed_at
+    assert status_events(events, evaluation_id) == ["completed"]
+
+
+@pytest.mark.anyio
+async def test_stopped_evaluation_is_not_completed(db, events):
+    evaluation_id = await create_evaluation(db, total=1, status="paused")
+    await finish_unit(db, evaluation_id)
+    evaluation = await db[evaluations.EVAL_COLLECTION].find_one({"_id": evaluation_id})
+    assert (evaluation["status"], evaluation["completed_prompt_tasks"]) == ("paused", 1)
+    assert status_events(events, evaluation_id) == []
+
+
+@pytest.mark.anyio
+async def test_completion_settles_pipelined_judging(db, events):
+    evaluation_id = await create_evaluation(db, total=1, judge_pipelined=True, judge_status="running")
+    await db[evaluations.RESULTS_COLLECTION].insert_many([
+        {"evaluation_id": evaluation_id, "row_index": 0, "llm_judge_score": 4.0, "llm_judge_error": None},
+        {"evaluation_id": evaluation_id, "row_index": 1, "llm_judge_score": None, "llm_judge_error": None},
+    ])
+    await finish_unit(db, evaluation_id)
+    evaluation = await db[evaluations.EVAL_COLLECTION].find_one({"_id": evaluation_id})
+    assert evaluation["judge_status"] == "failed" # Row 1 has no verdict
+
+
+@pytest.mark.anyio
+async def test_sweeper_completes_counted_and_fails_stranded_evaluations(db, events, monkeypatch):
+    monkeypatch.setattr(settings, "evaluation_sweep_grace_seconds", 60)
+    long_ago = datetime.utcnow() - timedelta(seconds=120)
+    counted = await create_evaluation(db, total=2, completed_prompt_tasks=2, started_at=long_ago)
+    stranded = await create_evaluation(db, total=2, completed_prompt_tasks=1, started_at=long_ago)
+    leased = await create_evaluation(db, total=2, completed_prompt_tasks=1, started_at=long_ago)
+    recent = await create_evaluation(db, total=2)
+    await db[JOBS_COLLECTION].insert_one({
+        "evaluation_id": leased, "kind": EVALUATION_ITEMS_JOB, "status": JOB_LEASED,
+        "lease_expires_at": long_ago, # Expired, but another worker will reclaim it
+    })
+
+    assert await evaluations.sweep_stranded_evaluations(db) == {"completed": 1, "failed": 1}
+    statuses = {
+        doc["_id"]: doc["status"]
+        async for doc in db[evaluations.EVAL_COLLECTION].find({}, {"status": 1})
+    }
+    assert statuses == {counted: "completed", stranded: "failed", leased: "running", recent: "running"}
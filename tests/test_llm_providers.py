@@ -0,0 +1,101 @@
+from datetime import datetime, timedelta
+
+import anthropic
+import pytest
+from bson import ObjectId
+from fastapi import HTTPException
+from mongomock_motor import AsyncMongoMockClient
+
+from app.db.client import mongo_db
+from app.services.llm_providers import SIMULATED_BATCHES_COLLECTION, BatchesNotSupportedError, LanguageModelProvider, SimulatedProvider
+
+PARAMS = {"model": "claude-test", "max_tokens": 64, "messages": [{"role": "user", "content": "Translate this."}]}
+
+
+@pytest.fixture
+def db(monkeypatch):
+    database = AsyncMongoMockClient()["promptcraft_test"]
+    monkeypatch.setattr(mongo_db, "db", database)
+    return database
+
+
+def simulated_provider() -> SimulatedProvider:
+    return SimulatedProvider(
+        seed=0, latency_median_seconds=0.01, latency_sigma=0.0, first_token_fraction=0.5, error_rate=0.0,
+        rate_limit_rate=0.0, requests_per_minute=0, retry_after_seconds=1.0, batch_seconds=60.0,
+    )
+
+
+async def end_batch(db, batch_id: str):
+    await db[SIMULATED_BATCHES_COLLECTION].update_one({"_id": batch_id}, {"$set": {"ends_at": datetime.utcnow() - timedelta(seconds=1)}})
+
+
+@pytest.mark.anyio
+async def test_simulated_batch_is_visible_to_every_process(db):
+    submitter, poller = simulated_provider(), simulated_provider() # Separate instances, as in two worker processes
+    batch_id = await submitter.submit_batch([{"custom_id": "a", "params": PARAMS}, {"custom_id": "b", "params": PARAMS}])
+    status, counts = await poller.get_batch_status(batch_id)
+    assert (status, counts["processing"]) == ("in_progress", 2)
+
+    await end_batch(db, batch_id)
+    status, counts = await poller.get_batch_status(batch_id)
+    assert (status, counts["succeeded"]) == ("ended", 2)
+    results = [result async for result in poller.iter_batch_results(batch_id)]
+    assert sorted(result.custom_id for result in results) == ["a", "b"]
+    assert all(result.result.type == "succeeded" for result in results)
+
+
+@pytest.mark.anyio
+async def test_cancel_only_affects_a_running_simulated_batch(db):
+    provider = simulated_provider()
+    running = await provider.submit_batch([{"custom_id": "a", "params": PARAMS}])
+    ended = await provider.submit_batch([{"custom_id": "b", "params": PARAMS}])
+    await end_batch(db, ended)
+    await simulated_provider().cancel_batch(running)
+    await simulated_provider().cancel_batch(ended)
+
+    assert (await provider.get_batch_status(running))[1]["canceled"] == 1
+    assert [result.result.type async for result in provider.iter_batch_results(running)] == ["canceled"]
+    assert [result.result.type async for result in provider.iter_batch_results(ended)] == ["succeeded"]
+
+
+@pytest.mark.anyio
+async def test_unknown_simulated_batch_is_not_found(db):
+    with pytest.raises(anthropic.NotFoundError):
+        await simulated_provider().get_batch_status("msgbatch_sim_missing")
+
+
+@pytest.mark.anyio
+async def test_providers_without_batches_raise_a_domain_error():
+    class InteractiveOnlyProvider(LanguageModelProvider):
+        name = "interactive-only"
+
+        async def create_message(self, params):
+            raise NotImplementedError
+
+        async def stream_message(self, params, started):
+            raise NotImplementedError
+
+    provider = InteractiveOnlyProvider()
+    assert not provider.supports_batches
+    with pytest.raises(BatchesNotSupportedError):
+        await provider.submit_batch([])
+    with pytest.raises(BatchesNotSupportedError):
+        async for _ in provider.iter_batch_results("msgbatch"):
+            pass
+
+
+@pytest.mark.anyio
+async def test_batch_mode_is_rejected_when_an_endpoint_lacks_batches(monkeypatch):
+    from app.models.evaluation import EvaluationCreateRequest
+    from app.routes import evaluations
+    from app.services.claude_service import message_batches_supported
+    from app.services.llm_endpoints import endpoint_pool
+
+    assert message_batches_supported()
+    monkeypatch.setattr(endpoint_pool.endpoints()[0].provider, "supports_batches", False)
+    assert not message_batches_supported()
+    request = EvaluationCreateRequest(prompt_ids=[ObjectId()], test_set_data=[{"source_text": "Hello"}], execution_mode="batch")
+    with pytest.raises(HTTPException) as error:
+        await evaluations._resolve_evaluation_request(None, request, None)
+    assert error.value.status_code == 400
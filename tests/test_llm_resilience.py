@@ -0,0 +1,124 @@
+import asyncio
+import time
+
+import pytest
+
+from app.services.llm_resilience import CircuitBreaker, CircuitOpenError
+
+
+def make_breaker(reset_timeout_seconds: float = 30.0) -> CircuitBreaker:
+    return CircuitBreaker("model", failure_threshold=3, reset_timeout_seconds=reset_timeout_seconds)
+
+
+def open_breaker(breaker: CircuitBreaker):
+    for _ in range(breaker.failure_threshold):
+        breaker.before_call()
+        breaker.record_failure()
+
+
+def expire_open_period(breaker: CircuitBreaker):
+    breaker.opened_at = time.monotonic() - breaker.reset_timeout_seconds - 1
+
+
+def test_opens_after_consecutive_failures():
+    breaker = make_breaker()
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    assert breaker.total_rejected == 1
+    assert not breaker.is_available()
+
+
+def test_success_resets_the_failure_count():
+    breaker = make_breaker()
+    for _ in range(2):
+        breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    assert breaker.consecutive_failures == 1
+
+
+def test_half_open_lets_one_probe_through():
+    breaker = make_breaker()
+    open_breaker(breaker)
+    expire_open_period(breaker)
+    assert breaker.is_available()
+    breaker.before_call()
+    assert breaker.state == "half_open"
+    assert not breaker.is_available()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_probe_success_closes_and_failure_reopens():
+    breaker = make_breaker()
+    open_breaker(breaker)
+    expire_open_period(breaker)
+    breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.consecutive_failures == 0
+
+    open_breaker(breaker)
+    expire_open_period(breaker)
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_released_probe_can_be_retried():
+    breaker = make_breaker()
+    open_breaker(breaker)
+    expire_open_period(breaker)
+    breaker.before_call()
+    breaker.release_probe() # The probe call was cancelled before upstream answered
+    assert breaker.state == "half_open"
+    assert breaker.is_available()
+    breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+
+def test_trip_opens_immediately():
+    breaker = make_breaker()
+    breaker.trip("credentials rejected")
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+@pytest.mark.anyio
+async def test_cancelled_probe_call_releases_the_probe(monkeypatch):
+    from app.services import claude_service
+    from app.services.llm_endpoints import endpoint_pool
+    from app.services.llm_resilience import get_circuit_breaker
+
+    endpoint = endpoint_pool.endpoints()[0]
+    started = asyncio.Event()
+
+    async def hang(params):
+        started.set()
+        await asyncio.sleep(3600)
+
+    monkeypatch.setattr(endpoint.provider, "create_message", hang)
+    breaker = get_circuit_breaker("probe-model")
+    open_breaker(breaker)
+    expire_open_period(breaker)
+
+    call = asyncio.ensure_future(claude_service._call_upstream("probe-model", {}, 10, stream=False))
+    await started.wait()
+    assert breaker.state == "half_open" and not breaker.is_available()
+    call.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await call
+    assert breaker.is_available()
+    assert endpoint.breaker.is_available()
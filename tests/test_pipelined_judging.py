@@ -0,0 +1,76 @@
+from typing import Any, Dict, List
+
+import pytest
+from bson import ObjectId
+from mongomock_motor import AsyncMongoMockClient
+
+from app.routes import evaluations
+
+TEST_SET_DATA = [{"source_text": f"source {n}", "reference_text": f"reference {n}"} for n in range(4)]
+
+
+@pytest.fixture
+def db():
+    return AsyncMongoMockClient()["promptcraft_test"]
+
+
+@pytest.fixture
+def saved(monkeypatch) -> List[Any]:
+    rows = []
+
+    async def save_result(result):
+        rows.append(result)
+
+    monkeypatch.setattr(evaluations, "_save_result", save_result)
+    return rows
+
+
+@pytest.fixture
+def judged(monkeypatch) -> List[Dict[str, Any]]:
+    rows = []
+
+    async def judge_row(row):
+        rows.append(row)
+        return False
+
+    monkeypatch.setattr(evaluations, "_judge_pipelined_row", judge_row)
+    return rows
+
+
+async def insert_unjudged_row(db, evaluation_id, prompt_id, row_index: int):
+    await db[evaluations.RESULTS_COLLECTION].insert_one({
+        "evaluation_id": evaluation_id, "prompt_id": prompt_id, "row_index": row_index,
+        "source_text": f"source {row_index}", "reference_text": f"reference {row_index}",
+        "model_output": f"output {row_index}", "llm_judge_score": None, "llm_judge_error": None,
+    })
+
+
+@pytest.mark.anyio
+async def test_missing_prompt_still_judges_queued_and_error_rows(db, saved, judged):
+    evaluation_id, prompt_id = ObjectId(), ObjectId() # The prompt was deleted
+    await insert_unjudged_row(db, evaluation_id, prompt_id, 0) # Generated by an earlier run, never judged
+    await evaluations.run_single_prompt_evaluation_task(
+        evaluation_id, prompt_id, db, TEST_SET_DATA, judge_pipelined=True
+    )
+    assert [result.row_index for result in saved] == [1, 2, 3]
+    assert all(result.model_output.startswith("ERROR:") for result in saved)
+    assert sorted(row["row_index"] for row in judged) == [0, 1, 2, 3]
+
+
+@pytest.mark.anyio
+async def test_invalid_prompt_still_judges_its_error_rows(db, saved, judged):
+    evaluation_id, prompt_id = ObjectId(), ObjectId()
+    await db[evaluations.PROMPT_COLLECTION].insert_one({"_id": prompt_id, "name": "broken", "sections": "not a list"}) # Fails Prompt validation
+    await evaluations.run_single_prompt_evaluation_task(
+        evaluation_id, prompt_id, db, TEST_SET_DATA, rows=range(0, 2), judge_pipelined=True
+    )
+    assert [result.row_index for result in saved] == [0, 1]
+    assert sorted(row["row_index"] for row in judged) == [0, 1]
+
+
+@pytest.mark.anyio
+async def test_missing_prompt_without_pipelining_only_writes_error_rows(db, saved, judged):
+    evaluation_id, prompt_id = ObjectId(), ObjectId()
+    await evaluations.run_single_prompt_evaluation_task(evaluation_id, prompt_id, db, TEST_SET_DATA)
+    assert len(saved) == len(TEST_SET_DATA)
+    assert judged == []
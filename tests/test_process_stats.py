@@ -0,0 +1,48 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+from app.core.config import settings
+from app.services.process_stats import PROCESS_STATS_COLLECTION, ProcessStats
+
+
+@pytest.fixture
+def db():
+    return AsyncMongoMockClient()["promptcraft_test"]
+
+
+@pytest.mark.anyio
+async def test_admin_view_lists_every_live_process(db):
+    api, worker = ProcessStats(), ProcessStats()
+    worker.process_id = "worker-host:1"
+    worker.role = "worker"
+    worker.sources = {**worker.sources, "writes": lambda: {"evaluation_results.judge": {"pending": 3}}}
+    await worker.publish(db)
+    await db[PROCESS_STATS_COLLECTION].insert_one({
+        "_id": "gone-host:2", "role": "worker",
+        "updated_at": datetime.utcnow() - timedelta(seconds=4 * settings.process_stats_interval_seconds),
+        "stats": {"writes": "{}"},
+    })
+
+    processes = (await api.per_process(db, "writes"))["processes"]
+    assert set(processes) == {api.process_id, "worker-host:1"} # Stale entries are left out
+    assert processes[api.process_id]["role"] == "api"
+    assert processes["worker-host:1"]["role"] == "worker"
+    assert processes["worker-host:1"]["stats"] == {"evaluation_results.judge": {"pending": 3}}
+
+
+@pytest.mark.anyio
+async def test_publisher_removes_its_entry_when_stopped(db, monkeypatch):
+    monkeypatch.setattr(settings, "process_stats_interval_seconds", 0.01)
+    stats = ProcessStats()
+    publisher = asyncio.ensure_future(stats.run_publisher(db, "worker"))
+    for _ in range(100):
+        if await db[PROCESS_STATS_COLLECTION].find_one({"_id": stats.process_id}):
+            break
+        await asyncio.sleep(0.01)
+    assert (await db[PROCESS_STATS_COLLECTION].find_one({"_id": stats.process_id}))["role"] == "worker"
+    publisher.cancel()
+    await asyncio.gather(publisher, return_exceptions=True)
+    assert await db[PROCESS_STATS_COLLECTION].count_documents({}) == 0
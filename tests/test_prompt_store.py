@@ -0,0 +1,72 @@
+from typing import Any, List
+
+import pytest
+
+from app.services import prompt_store
+from app.services.prompt_store import PromptTextStore, prompt_text_hash
+
+
+class RecordingBuffer:
+    def __init__(self):
+        self.operations: List[Any] = []
+
+    async def add(self, operation: Any):
+        self.operations.append(operation)
+
+
+@pytest.fixture
+def writes(monkeypatch) -> RecordingBuffer:
+    buffer = RecordingBuffer()
+    monkeypatch.setattr(prompt_store, "prompt_text_writes", buffer)
+    return buffer
+
+
+@pytest.mark.anyio
+async def test_text_is_queued_once_until_written(writes: RecordingBuffer):
+    store = PromptTextStore()
+    assert await store.put("system prompt") == prompt_text_hash("system prompt")
+    await store.put("system prompt") # Still pending: written with the same flush
+    assert len(writes.operations) == 1
+
+    store.mark_written(writes.operations)
+    await store.put("system prompt")
+    assert len(writes.operations) == 1
+    assert await store.put(None) is None
+
+
+@pytest.mark.anyio
+async def test_dropped_write_is_queued_again(writes: RecordingBuffer):
+    store = PromptTextStore()
+    text_hash = await store.put("system prompt")
+    store.mark_dropped(writes.operations)
+    assert await store.put("system prompt") == text_hash
+    assert len(writes.operations) == 2
+    assert store.snapshot()["dropped_texts"] == 1
+
+
+@pytest.mark.anyio
+async def test_callbacks_ignore_operations_of_other_writers(writes: RecordingBuffer):
+    store = PromptTextStore()
+    await store.put("system prompt")
+    store.mark_written([object()])
+    await store.put("system prompt")
+    assert len(writes.operations) == 1 # Still queued, not known
+    assert store.snapshot()["dropped_texts"] == 0
+
+
+@pytest.mark.anyio
+async def test_known_hashes_are_capped(writes: RecordingBuffer, monkeypatch):
+    monkeypatch.setattr(prompt_store, "KNOWN_HASHES_MAX", 2)
+    store = PromptTextStore()
+    for text in ("a", "b", "c"):
+        await store.put(text)
+    store.mark_written(writes.operations)
+    await store.put("a") # Evicted as the least recently used
+    await store.put("c")
+    assert len(writes.operations) == 4
+
+
+def test_store_follows_the_prompt_text_buffer():
+    from app.services.write_buffer import prompt_text_writes
+    assert prompt_text_writes.on_written == prompt_store.prompt_texts.mark_written
+    assert prompt_text_writes.on_dropped == prompt_store.prompt_texts.mark_dropped
@@ -0,0 +1,129 @@
+import asyncio
+import time
+
+import pytest
+
+from app.services.rate_controller import AdaptiveConcurrencyController
+
+
+def make_controller(**overrides) -> AdaptiveConcurrencyController:
+    options = dict(
+        requests_per_minute=0,
+        input_tokens_per_minute=0,
+        output_tokens_per_minute=0,
+        initial_concurrency=4,
+        min_concurrency=1,
+        max_concurrency=8,
+        latency_target_seconds=10.0,
+        increase_step=1.0,
+        decrease_factor=0.5,
+        latency_decrease_factor=0.9,
+        cooldown_seconds=60.0,
+    )
+    options.update(overrides)
+    return AdaptiveConcurrencyController(**options)
+
+
+async def succeed(controller: AdaptiveConcurrencyController, output_tokens: int = 10):
+    async with controller.slot(100) as ticket:
+        ticket.record_success(output_tokens)
+
+
+async def throttle(controller: AdaptiveConcurrencyController, retry_after=None):
+    async with controller.slot(100) as ticket:
+        ticket.record_throttle(retry_after)
+
+
+@pytest.mark.anyio
+async def test_success_increases_the_limit_additively():
+    controller = make_controller()
+    await succeed(controller)
+    assert controller.snapshot()["concurrency_limit"] == 4.25 # +increase_step / limit
+    for _ in range(200):
+        await succeed(controller)
+    assert controller.snapshot()["concurrency_limit"] == 8 # Capped at max_concurrency
+
+
+@pytest.mark.anyio
+async def test_throttle_decreases_multiplicatively_once_per_cooldown():
+    controller = make_controller()
+    await throttle(controller)
+    assert controller.snapshot()["concurrency_limit"] == 2
+    await throttle(controller) # Same burst: within the cooldown
+    assert controller.snapshot()["concurrency_limit"] == 2
+    for _ in range(2):
+        controller._last_decrease -= controller.cooldown_seconds # Cooldown over
+        await throttle(controller)
+    assert controller.snapshot()["concurrency_limit"] == 1 # Floored at min_concurrency
+    assert controller.total_throttled == 4
+
+
+@pytest.mark.anyio
+async def test_slow_calls_decrease_the_limit():
+    controller = make_controller(latency_target_seconds=0.0)
+    await succeed(controller)
+    assert controller.snapshot()["concurrency_limit"] == 3.6
+
+
+@pytest.mark.anyio
+async def test_errors_leave_the_limit_unchanged():
+    controller = make_controller()
+    async with controller.slot(100):
+        pass # Neither success nor throttle recorded
+    assert controller.snapshot()["concurrency_limit"] == 4
+    assert controller.total_errors == 1
+
+
+@pytest.mark.anyio
+async def test_retry_after_blocks_new_calls():
+    controller = make_controller()
+    await throttle(controller, retry_after=30)
+    assert controller.headroom() < 0
+    assert controller._capacity_delay(time.monotonic(), 0) > 29
+
+
+@pytest.mark.anyio
+async def test_in_flight_calls_are_capped_at_the_limit():
+    controller = make_controller(initial_concurrency=2, max_concurrency=2)
+    release = asyncio.Event()
+    peak = 0
+
+    async def call():
+        nonlocal peak
+        async with controller.slot(100) as ticket:
+            peak = max(peak, controller._in_flight)
+            await release.wait()
+            ticket.record_success(1)
+
+    calls = asyncio.gather(*(call() for _ in range(5)))
+    await asyncio.sleep(0.05)
+    assert controller._in_flight == 2
+    assert controller._waiting == 3
+    release.set()
+    await calls
+    assert peak == 2
+
+
+@pytest.mark.anyio
+async def test_per_minute_quotas_delay_calls():
+    controller = make_controller(requests_per_minute=2, input_tokens_per_minute=1000)
+    await succeed(controller)
+    await succeed(controller)
+    assert controller._capacity_delay(time.monotonic(), 0) > 59 # Request quota used up
+
+    controller = make_controller(input_tokens_per_minute=150)
+    await succeed(controller)
+    assert controller._capacity_delay(time.monotonic(), 100) > 59 # 100 + 100 tokens > 150
+    assert controller._capacity_delay(time.monotonic(), 50) == 0
+
+
+def test_quotas_are_split_across_processes(monkeypatch):
+    from app.core.config import settings
+    from app.services.rate_controller import process_share
+
+    monkeypatch.setattr(settings, "llm_quota_processes", 4)
+    assert process_share(50) == 12
+    assert process_share(2) == 1 # Never rounded down to unlimited
+    assert process_share(0) == 0 # Unlimited stays unlimited
+    controller = AdaptiveConcurrencyController.from_settings(requests_per_minute=400, input_tokens_per_minute=0, output_tokens_per_minute=8000)
+    assert (controller.requests_per_minute, controller.input_tokens_per_minute, controller.output_tokens_per_minute) == (100, 0, 2000)
@@ -0,0 +1,78 @@
+from typing import List
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+from app.core.config import settings
+from app.services.job_queue import EVALUATION_ITEMS_JOB, job_queue
+from app.services.scheduler import PRIORITY_BULK, PRIORITY_INTERACTIVE, FairShareScheduler
+
+
+@pytest.fixture
+def db():
+    return AsyncMongoMockClient()["promptcraft_test"]
+
+
+async def enqueue(db, scheduler: FairShareScheduler, workspace: str, count: int, priority_class: str = PRIORITY_BULK, est_tokens: int = 100):
+    payloads = [{"name": f"{workspace}-{n}", "est_tokens": est_tokens} for n in range(count)]
+    await job_queue.enqueue(db, EVALUATION_ITEMS_JOB, await scheduler.tag(db, workspace, priority_class, payloads))
+
+
+async def claim_all(db, scheduler: FairShareScheduler) -> List[str]:
+    claimed = []
+    while (job := await job_queue.claim(db, "worker", [EVALUATION_ITEMS_JOB])) is not None:
+        await scheduler.advance(db, job)
+        await job_queue.complete(db, job)
+        claimed.append(job["name"])
+    return claimed
+
+
+@pytest.mark.anyio
+async def test_workspaces_take_turns_however_much_each_queued(db):
+    scheduler = FairShareScheduler()
+    await enqueue(db, scheduler, "alice:fr", 6)
+    await enqueue(db, scheduler, "bob:de", 2)
+    claimed = await claim_all(db, scheduler)
+    assert claimed[:4] == ["alice:fr-0", "bob:de-0", "alice:fr-1", "bob:de-1"]
+    assert claimed[4:] == [f"alice:fr-{n}" for n in range(2, 6)]
+
+
+@pytest.mark.anyio
+async def test_weights_set_the_share_of_claims(db, monkeypatch):
+    monkeypatch.setattr(settings, "scheduler_workspace_weights", {"fr": 2.0})
+    scheduler = FairShareScheduler()
+    await enqueue(db, scheduler, "alice:fr", 4)
+    await enqueue(db, scheduler, "bob:de", 4)
+    claimed = await claim_all(db, scheduler)
+    assert [name.split("-")[0] for name in claimed[:6]] == ["alice:fr", "bob:de", "alice:fr", "alice:fr", "bob:de", "alice:fr"]
+
+
+@pytest.mark.anyio
+async def test_interactive_jobs_are_claimed_before_bulk(db):
+    scheduler = FairShareScheduler()
+    await enqueue(db, scheduler, "alice:fr", 3, PRIORITY_BULK)
+    await enqueue(db, scheduler, "bob:de", 1, PRIORITY_INTERACTIVE)
+    assert (await claim_all(db, scheduler))[0] == "bob:de-0"
+
+
+@pytest.mark.anyio
+async def test_late_workspace_starts_at_the_virtual_time(db):
+    scheduler = FairShareScheduler()
+    await enqueue(db, scheduler, "alice:fr", 4)
+    first = await job_queue.claim(db, "worker", [EVALUATION_ITEMS_JOB])
+    second = await job_queue.claim(db, "worker", [EVALUATION_ITEMS_JOB])
+    await scheduler.advance(db, first)
+    await scheduler.advance(db, second)
+    # An idle workspace gets no credit for the time it was idle: bob starts level with the job claimed last (start tag 100),
+    # so its jobs interleave with alice's remaining ones instead of all going first (ties go to the older job)
+    await enqueue(db, scheduler, "bob:de", 2)
+    assert await claim_all(db, scheduler) == ["bob:de-0", "alice:fr-2", "bob:de-1", "alice:fr-3"]
+
+
+def test_only_small_runs_are_interactive(monkeypatch):
+    monkeypatch.setattr(settings, "scheduler_interactive_max_rows", 100)
+    scheduler = FairShareScheduler()
+    assert scheduler.classify(100) == PRIORITY_INTERACTIVE
+    assert scheduler.classify(101, requested=PRIORITY_INTERACTIVE) == PRIORITY_BULK
+    assert scheduler.classify(10, batch=True) == PRIORITY_BULK
+    assert scheduler.classify(10, requested=PRIORITY_BULK) == PRIORITY_BULK
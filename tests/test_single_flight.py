@@ -0,0 +1,98 @@
+import asyncio
+
+import pytest
+
+from app.services.single_flight import SingleFlight
+
+
+@pytest.mark.anyio
+async def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    calls = 0
+    release = asyncio.Event()
+
+    async def work():
+        nonlocal calls
+        calls += 1
+        await release.wait()
+        return "result"
+
+    waiters = [asyncio.ensure_future(flight.do("key", work)) for _ in range(3)]
+    await asyncio.sleep(0)
+    release.set()
+    results = await asyncio.gather(*waiters)
+    assert calls == 1
+    assert results == [("result", False), ("result", True), ("result", True)]
+    assert flight.snapshot() == {"in_flight_keys": 0, "leader_calls": 1, "coalesced_calls": 2}
+
+
+@pytest.mark.anyio
+async def test_different_keys_and_later_calls_run_separately():
+    flight = SingleFlight()
+    calls = []
+
+    async def work(key):
+        calls.append(key)
+        return key
+
+    assert await asyncio.gather(flight.do("a", lambda: work("a")), flight.do("b", lambda: work("b"))) == [("a", False), ("b", False)]
+    assert await flight.do("a", lambda: work("a")) == ("a", False) # The first call for "a" has finished
+    assert calls == ["a", "b", "a"]
+
+
+@pytest.mark.anyio
+async def test_followers_receive_the_leaders_exception():
+    flight = SingleFlight()
+    release = asyncio.Event()
+
+    async def work():
+        await release.wait()
+        raise ValueError("upstream failed")
+
+    waiters = [asyncio.ensure_future(flight.do("key", work)) for _ in range(2)]
+    await asyncio.sleep(0)
+    release.set()
+    results = await asyncio.gather(*waiters, return_exceptions=True)
+    assert all(isinstance(result, ValueError) for result in results)
+    assert flight.snapshot()["in_flight_keys"] == 0
+
+
+@pytest.mark.anyio
+async def test_cancelling_one_waiter_keeps_the_shared_work():
+    flight = SingleFlight()
+    release = asyncio.Event()
+
+    async def work():
+        await release.wait()
+        return "result"
+
+    leader = asyncio.ensure_future(flight.do("key", work))
+    follower = asyncio.ensure_future(flight.do("key", work))
+    await asyncio.sleep(0)
+    leader.cancel()
+    await asyncio.sleep(0)
+    release.set()
+    assert await follower == ("result", True)
+    assert leader.cancelled()
+
+
+@pytest.mark.anyio
+async def test_cancelling_the_last_waiter_cancels_the_work():
+    flight = SingleFlight()
+    started = asyncio.Event()
+    cancelled = asyncio.Event()
+
+    async def work():
+        started.set()
+        try:
+            await asyncio.sleep(3600)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    waiter = asyncio.ensure_future(flight.do("key", work))
+    await started.wait()
+    waiter.cancel()
+    await asyncio.wait_for(cancelled.wait(), timeout=1)
+    await asyncio.sleep(0)
+    assert flight.snapshot()["in_flight_keys"] == 0
@@ -0,0 +1,59 @@
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+from app.services.test_set_service import TEST_SET_ENTRIES_COLLECTION, EvaluationItems
+
+TEST_SET_ID = "test-set"
+ROWS_IN_FILE = [1, 2, 4, 7, 9, 12, 15] # Rows without source text were skipped on upload
+
+
+@pytest.fixture
+async def db():
+    database = AsyncMongoMockClient()["promptcraft_test"]
+    await database[TEST_SET_ENTRIES_COLLECTION].insert_many([
+        {"test_set_id": TEST_SET_ID, "row_number_in_file": row, "item_index": index, "source_text": f"row {row}"}
+        for index, row in enumerate(ROWS_IN_FILE)
+    ])
+    return database
+
+
+def sources(window, rows: range):
+    return [window[index]["source_text"] for index in rows]
+
+
+@pytest.mark.anyio
+async def test_window_reads_the_rows_and_their_neighbours(db):
+    items = EvaluationItems(db, test_set_id=TEST_SET_ID, count=len(ROWS_IN_FILE))
+    window = await items.window(range(2, 4))
+    assert len(window) == len(ROWS_IN_FILE)
+    assert sources(window, range(1, 5)) == ["row 2", "row 4", "row 7", "row 9"]
+    with pytest.raises(KeyError):
+        window[5] # Not read
+
+
+@pytest.mark.anyio
+async def test_chunks_cover_every_row_with_neighbours(db):
+    items = EvaluationItems(db, test_set_id=TEST_SET_ID, count=len(ROWS_IN_FILE))
+    chunks = [(rows, window) async for rows, window in items.chunks(3)]
+    assert [rows for rows, _ in chunks] == [range(0, 3), range(3, 6), range(6, 7)]
+    for rows, window in chunks:
+        with_neighbours = range(max(0, rows.start - 1), min(len(ROWS_IN_FILE), rows.stop + 1))
+        assert sources(window, with_neighbours) == [f"row {ROWS_IN_FILE[index]}" for index in with_neighbours]
+
+
+@pytest.mark.anyio
+async def test_chunks_stop_at_the_evaluation_item_count(db):
+    items = EvaluationItems(db, test_set_id=TEST_SET_ID, count=4) # Entries added after the evaluation was created
+    chunks = [(rows, window) async for rows, window in items.chunks(3)]
+    assert [rows for rows, _ in chunks] == [range(0, 3), range(3, 4)]
+    assert len(chunks[-1][1]) == 4
+
+
+@pytest.mark.anyio
+async def test_inline_items_are_returned_as_is():
+    data = [{"source_text": f"item {n}"} for n in range(5)]
+    items = EvaluationItems(None, test_set_data=data)
+    assert await items.window(range(1, 2)) is data
+    assert [(rows, window is data) async for rows, window in items.chunks(2)] == [
+        (range(0, 2), True), (range(2, 4), True), (range(4, 5), True),
+    ]
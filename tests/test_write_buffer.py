@@ -0,0 +1,188 @@
+from typing import Any, List, Optional
+
+import pytest
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from app.core.config import settings
+from app.db.client import mongo_db
+from app.services.write_buffer import DUPLICATE_KEY_ERROR, WriteBehindBuffer
+
+WRITE_CONFLICT = 112
+BAD_VALUE = 2
+
+
+class FakeCollection:
+    """Records bulk writes; each call pops the next scripted outcome (None, an exception, or write errors by index)."""
+
+    def __init__(self, name: str, log: List[str]):
+        self.name = name
+        self.log = log
+        self.batches: List[List[Any]] = []
+        self.outcomes: List[Any] = []
+
+    async def bulk_write(self, batch: List[Any], ordered: bool = True):
+        self.log.append(self.name)
+        self.batches.append(list(batch))
+        outcome = self.outcomes.pop(0) if self.outcomes else None
+        if isinstance(outcome, Exception):
+            raise outcome
+        if outcome:
+            raise BulkWriteError({"writeErrors": [
+                {"index": index, "code": code, "errmsg": f"error {code}"} for index, code in outcome.items()
+            ]})
+
+
+class FakeDatabase(dict):
+    def __init__(self):
+        super().__init__()
+        self.log: List[str] = []
+
+    def __missing__(self, name: str) -> FakeCollection:
+        self[name] = FakeCollection(name, self.log)
+        return self[name]
+
+
+@pytest.fixture
+def db(monkeypatch) -> FakeDatabase:
+    database = FakeDatabase()
+    monkeypatch.setattr(mongo_db, "db", database)
+    return database
+
+
+def make_buffer(max_ops: int = 100, flush_first: Optional[List[WriteBehindBuffer]] = None, name: str = "items") -> WriteBehindBuffer:
+    buffer = WriteBehindBuffer(name, max_ops=max_ops, max_delay_seconds=3600, flush_first=flush_first)
+    buffer.written = []
+    buffer.dropped = []
+    buffer.on_written = buffer.written.extend
+    buffer.on_dropped = buffer.dropped.extend
+    return buffer
+
+
+def update(n: int) -> UpdateOne:
+    return UpdateOne({"_id": n}, {"$set": {"n": n}}, upsert=True)
+
+
+@pytest.mark.anyio
+async def test_flush_writes_pending_operations_in_one_bulk_write(db: FakeDatabase):
+    buffer = make_buffer()
+    operations = [update(n) for n in range(3)]
+    for operation in operations:
+        await buffer.add(operation)
+    assert db["items"].batches == []
+    await buffer.flush()
+    assert db["items"].batches == [operations]
+    assert buffer.written == operations
+    assert buffer.snapshot()["pending"] == 0
+
+
+@pytest.mark.anyio
+async def test_full_buffer_flushes_inline(db: FakeDatabase):
+    buffer = make_buffer(max_ops=2)
+    await buffer.add(update(1))
+    await buffer.add(update(2))
+    assert len(db["items"].batches) == 1
+
+
+@pytest.mark.anyio
+async def test_failed_bulk_write_keeps_everything_queued(db: FakeDatabase):
+    buffer = make_buffer()
+    operations = [update(n) for n in range(2)]
+    for operation in operations:
+        await buffer.add(operation)
+    db["items"].outcomes = [ConnectionError("network down")]
+    with pytest.raises(ConnectionError):
+        await buffer.flush()
+    assert buffer.written == [] and buffer.snapshot()["pending"] == 2
+    await buffer.flush()
+    assert db["items"].batches[-1] == operations
+    assert buffer.written == operations
+
+
+@pytest.mark.anyio
+async def test_partial_failure_retries_only_transient_rejections(db: FakeDatabase):
+    buffer = make_buffer()
+    applied, conflicted, invalid = update(0), update(1), update(2)
+    for operation in (applied, conflicted, invalid):
+        await buffer.add(operation)
+    db["items"].outcomes = [{1: WRITE_CONFLICT, 2: BAD_VALUE}]
+    with pytest.raises(BulkWriteError): # A write is still pending
+        await buffer.flush()
+    assert buffer.written == [applied]
+    assert buffer.dropped == [invalid]
+    assert buffer.snapshot()["pending"] == 1
+
+    await buffer.flush()
+    assert db["items"].batches[-1] == [conflicted]
+    assert buffer.written == [applied, conflicted]
+    snapshot = buffer.snapshot()
+    assert (snapshot["ops_written"], snapshot["dropped_ops"], snapshot["pending"]) == (2, 1, 0)
+
+
+@pytest.mark.anyio
+async def test_partial_failure_without_retries_does_not_raise(db: FakeDatabase):
+    buffer = make_buffer()
+    await buffer.add(update(0))
+    await buffer.add(update(1))
+    db["items"].outcomes = [{0: BAD_VALUE}]
+    await buffer.flush() # Nothing left to retry: the caller's writes are settled
+    assert buffer.snapshot()["pending"] == 0
+    assert len(buffer.dropped) == 1 and len(buffer.written) == 1
+
+
+@pytest.mark.anyio
+async def test_transient_rejection_is_dropped_after_max_attempts(db: FakeDatabase):
+    buffer = make_buffer()
+    operation = update(0)
+    await buffer.add(operation)
+    db["items"].outcomes = [{0: WRITE_CONFLICT}] * settings.write_buffer_max_attempts
+    for _ in range(settings.write_buffer_max_attempts - 1):
+        with pytest.raises(BulkWriteError):
+            await buffer.flush()
+    await buffer.flush()
+    assert len(db["items"].batches) == settings.write_buffer_max_attempts
+    assert buffer.dropped == [operation]
+    assert buffer.snapshot()["pending"] == 0
+
+
+@pytest.mark.anyio
+async def test_duplicate_insert_counts_as_written(db: FakeDatabase):
+    buffer = make_buffer()
+    insert = InsertOne({"_id": 1})
+    await buffer.add(insert)
+    db["items"].outcomes = [{0: DUPLICATE_KEY_ERROR}] # Inserted by an attempt whose reply was lost
+    await buffer.flush()
+    assert buffer.written == [insert]
+    assert buffer.dropped == []
+
+
+@pytest.mark.anyio
+async def test_dependencies_flush_first(db: FakeDatabase):
+    texts = make_buffer(name="texts")
+    rows = make_buffer(name="rows", flush_first=[texts])
+    await rows.add(update(1))
+    await texts.add(update(2))
+    await rows.flush()
+    assert db.log == ["texts", "rows"]
+
+
+@pytest.mark.anyio
+async def test_close_reports_lost_operations_as_dropped(db: FakeDatabase):
+    buffer = make_buffer()
+    operation = update(0)
+    await buffer.add(operation)
+    db["items"].outcomes = [ConnectionError("network down")]
+    await buffer.close()
+    assert buffer.dropped == [operation]
+    assert buffer.snapshot()["dropped_ops"] == 1
+
+
+@pytest.mark.anyio
+async def test_add_raises_once_the_backlog_is_too_large(db: FakeDatabase):
+    buffer = make_buffer(max_ops=1)
+    db["items"].outcomes = [ConnectionError("network down")] * 10
+    for n in range(9):
+        await buffer.add(update(n)) # Flush fails, the write stays queued
+    with pytest.raises(ConnectionError):
+        await buffer.add(update(9))
+    assert buffer.snapshot()["pending"] == 10
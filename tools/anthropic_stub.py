@@ -0,0 +1,248 @@
+"""
+Local stand-in for the Anthropic Messages API, for development and testing.
+
+Run it and point the backend at it:
+
+    uvicorn tools.anthropic_stub:app --port 8010
+    ANTHROPIC_BASE_URL=http://localhost:8010
+
+Behaviour:
+  * POST /v1/messages answers deterministically. Translation requests (a user prompt
+    containing <source_text>) get `<translated_text>[stub] ...</translated_text>`
+    followed by a short trailing note (as real models sometimes add), anything
+    else gets a judge-style JSON score.
+  * "stream": true is answered with server-sent events, one text delta per
+    STREAM_CHUNK_CHARS characters, STUB_CHUNK_SECONDS apart.
+  * Prompt caching is emulated: the system prefix up to the last block marked with
+    `cache_control` is remembered for 5 minutes. The first request reports it as
+    `cache_creation_input_tokens`, later identical prefixes as `cache_read_input_tokens`.
+  * max_tokens and stop_sequences are honoured (stop_reason="max_tokens" /
+    "stop_sequence" when the reply is cut).
+  * Message Batches: POST /v1/messages/batches accepts a batch, which reports
+    "in_progress" for STUB_BATCH_SECONDS and then "ended"; its JSONL results are
+    served from /v1/messages/batches/{id}/results. Requests whose user prompt
+    contains STUB_BATCH_ERROR come back as errored results.
+
+Environment knobs: STUB_LATENCY_SECONDS (default 0), STUB_CHUNK_SECONDS (default 0),
+STUB_BATCH_SECONDS (default 2).
+"""
+import asyncio
+import hashlib
+import json
+import os
+import re
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+from datetime import datetime, timedelta, timezone
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
+
+app = FastAPI(title="Anthropic API Stub")
+
+PROMPT_CACHE_TTL_SECONDS = 300
+STREAM_CHUNK_CHARS = 8
+_prompt_cache: Dict[str, float] = {} # prefix hash -> expiry (monotonic)
+
+
+def _tokens(text: str) -> int:
+    """Same rough estimate the backend falls back to without tiktoken."""
+    return max(1, len(text) // 4) if text else 0
+
+
+def _system_blocks(system: Any) -> List[Dict[str, Any]]:
+    if not system:
+        return []
+    if isinstance(system, str):
+        return [{"type": "text", "text": system}]
+    return list(system)
+
+
+def _user_text(messages: List[Dict[str, Any]]) -> str:
+    parts = []
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            parts.append(content)
+        else:
+            parts.extend(block.get("text", "") for block in content or [])
+    return "\n".join(parts)
+
+
+def _prompt_cache_usage(blocks: List[Dict[str, Any]], user_text: str) -> Tuple[int, int, int]:
+    """Returns (input_tokens, cache_creation_input_tokens, cache_read_input_tokens)."""
+    cached_until = max((i for i, block in enumerate(blocks) if block.get("cache_control")), default=-1)
+    prefix = "".join(block.get("text", "") for block in blocks[:cached_until + 1])
+    rest = "".join(block.get("text", "") for block in blocks[cached_until + 1:]) + user_text
+    if not prefix:
+        return _tokens(rest), 0, 0
+    key = hashlib.sha256(prefix.encode("utf-8")).hexdigest()
+    now = time.monotonic()
+    hit = _prompt_cache.get(key, 0) > now
+    _prompt_cache[key] = now + PROMPT_CACHE_TTL_SECONDS # Reads refresh the TTL, as upstream
+    if hit:
+        return _tokens(rest), 0, _tokens(prefix)
+    return _tokens(rest), _tokens(prefix), 0
+
+
+def _reply_text(user_text: str) -> str:
+    match = re.search(r"<source_text>(.*?)</source_text>", user_text, re.DOTALL)
+    if match:
+        return (
+            f"<translated_text>[stub] {match.group(1).strip()}</translated_text>\n\n"
+            "Note: the translation keeps the tone and register of the source text."
+        )
+    return '{"score": 4.0, "rationale": "Stub evaluation."}'
+
+
+def _truncate(text: str, max_tokens: int, stop_sequences: Optional[List[str]]) -> Tuple[str, str, Optional[str]]:
+    """Applies stop sequences and max_tokens; returns (text, stop_reason, stop_sequence)."""
+    stop_reason, stop_sequence = "end_turn", None
+    for sequence in stop_sequences or []:
+        index = text.find(sequence)
+        if index != -1:
+            text, stop_reason, stop_sequence = text[:index], "stop_sequence", sequence
+            break
+    if _tokens(text) > max_tokens: # The budget runs out before the stop sequence is reached
+        return text[: max_tokens * 4], "max_tokens", None
+    return text, stop_reason, stop_sequence
+
+
+def build_message(params: Dict[str, Any]) -> Dict[str, Any]:
+    """Builds a Messages API response body for the given request parameters."""
+    blocks = _system_blocks(params.get("system"))
+    user_text = _user_text(params.get("messages", []))
+    input_tokens, cache_creation, cache_read = _prompt_cache_usage(blocks, user_text)
+    text, stop_reason, stop_sequence = _truncate(
+        _reply_text(user_text), params.get("max_tokens", 1024), params.get("stop_sequences")
+    )
+    return {
+        "id": f"msg_stub_{uuid.uuid4().hex[:24]}",
+        "type": "message",
+        "role": "assistant",
+        "model": params.get("model", "stub"),
+        "content": [{"type": "text", "text": text}],
+        "stop_reason": stop_reason,
+        "stop_sequence": stop_sequence,
+        "usage": {
+            "input_tokens": input_tokens,
+            "output_tokens": _tokens(text),
+            "cache_creation_input_tokens": cache_creation,
+            "cache_read_input_tokens": cache_read,
+        },
+    }
+
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def _stream_events(message: Dict[str, Any]):
+    """Replays a finished message as Messages API streaming events."""
+    chunk_delay = float(os.environ.get("STUB_CHUNK_SECONDS", "0"))
+    text = message["content"][0]["text"]
+    usage = message["usage"]
+    start = dict(message, content=[], stop_reason=None, stop_sequence=None, usage=dict(usage, output_tokens=1))
+    yield _sse("message_start", {"type": "message_start", "message": start})
+    yield _sse("content_block_start", {"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}})
+    for offset in range(0, len(text), STREAM_CHUNK_CHARS):
+        if chunk_delay:
+            await asyncio.sleep(chunk_delay)
+        delta = {"type": "text_delta", "text": text[offset:offset + STREAM_CHUNK_CHARS]}
+        yield _sse("content_block_delta", {"type": "content_block_delta", "index": 0, "delta": delta})
+    yield _sse("content_block_stop", {"type": "content_block_stop", "index": 0})
+    yield _sse("message_delta", {
+        "type": "message_delta",
+        "delta": {"stop_reason": message["stop_reason"], "stop_sequence": message["stop_sequence"]},
+        "usage": {"output_tokens": usage["output_tokens"]},
+    })
+    yield _sse("message_stop", {"type": "message_stop"})
+
+
+@app.post("/v1/messages")
+async def create_message(request: Request):
+    params = await request.json()
+    latency = float(os.environ.get("STUB_LATENCY_SECONDS", "0"))
+    if latency:
+        await asyncio.sleep(latency)
+    message = build_message(params)
+    if params.get("stream"):
+        return StreamingResponse(_stream_events(message), media_type="text/event-stream")
+    return message
+
+
+# --- Message Batches --- M
+_batches: Dict[str, Dict[str, Any]] = {} # batch id -> {"requests", "created", "ends_at", "results"}
+
+
+def _iso(moment: datetime) -> str:
+    return moment.isoformat().replace("+00:00", "Z")
+
+
+def _batch_result(request: Dict[str, Any]) -> Dict[str, Any]:
+    params = request.get("params", {})
+    if "STUB_BATCH_ERROR" in _user_text(params.get("messages", [])):
+        result = {
+            "type": "errored",
+            "error": {"type": "error", "error": {"type": "invalid_request_error", "message": "Stub batch error."}},
+        }
+    else:
+        result = {"type": "succeeded", "message": build_message(params)}
+    return {"custom_id": request["custom_id"], "result": result}
+
+
+def _batch_body(batch_id: str, request: Request) -> Dict[str, Any]:
+    batch = _batches.get(batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail=f"Batch {batch_id} not found.")
+    ended = time.monotonic() >= batch["ends_at"]
+    if ended and batch["results"] is None:
+        batch["results"] = [_batch_result(r) for r in batch["requests"]]
+        batch["ended_at"] = datetime.now(timezone.utc)
+    counts = {"processing": 0, "succeeded": 0, "errored": 0, "canceled": 0, "expired": 0}
+    if ended:
+        for entry in batch["results"]:
+            counts[entry["result"]["type"]] += 1
+    else:
+        counts["processing"] = len(batch["requests"])
+    return {
+        "id": batch_id,
+        "type": "message_batch",
+        "processing_status": "ended" if ended else "in_progress",
+        "request_counts": counts,
+        "created_at": _iso(batch["created"]),
+        "expires_at": _iso(batch["created"] + timedelta(hours=24)),
+        "ended_at": _iso(batch["ended_at"]) if ended else None,
+        "archived_at": None,
+        "cancel_initiated_at": None,
+        "results_url": f"{str(request.base_url).rstrip('/')}/v1/messages/batches/{batch_id}/results" if ended else None,
+    }
+
+
+@app.post("/v1/messages/batches")
+async def create_message_batch(request: Request):
+    body = await request.json()
+    batch_id = f"msgbatch_stub_{uuid.uuid4().hex[:24]}"
+    _batches[batch_id] = {
+        "requests": body.get("requests", []),
+        "created": datetime.now(timezone.utc),
+        "ends_at": time.monotonic() + float(os.environ.get("STUB_BATCH_SECONDS", "2")),
+        "results": None,
+    }
+    return _batch_body(batch_id, request)
+
+
+@app.get("/v1/messages/batches/{batch_id}")
+async def retrieve_message_batch(batch_id: str, request: Request):
+    return _batch_body(batch_id, request)
+
+
+@app.get("/v1/messages/batches/{batch_id}/results")
+async def message_batch_results(batch_id: str, request: Request):
+    body = _batch_body(batch_id, request)
+    if body["processing_status"] != "ended":
+        raise HTTPException(status_code=400, detail=f"Batch {batch_id} has not ended yet.")
+    lines = "\n".join(json.dumps(entry) for entry in _batches[batch_id]["results"])
+    return PlainTextResponse(lines + "\n", media_type="application/x-jsonl")
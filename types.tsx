@@ -157,8 +157,9 @@ export type Evaluation = {
   completed_prompt_tasks?: number | null;
   // Does NOT include test_set_data or results by default
   // --- Add LLM Judge Status Fields --- M
-  judge_status?: string | null; // e.g., not_started, pending, completed, failed
+  judge_status?: string | null; // e.g., not_started, pending, running, completed, failed
   judged_at?: string | null;
+  judge_pipelined?: boolean | null; // Rows are judged as they are generated
   // --- End Add --- M
 }
 // --- End NEW Type ---
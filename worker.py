@@ -0,0 +1,56 @@
+import asyncio
+import logging
+import signal
+
+from app.core.config import settings
+from app.db.client import connect_to_mongo, close_mongo_connection, get_database
+from app.routes.evaluations import JOB_HANDLERS, ensure_result_indexes, run_evaluation_sweeper
+from app.services.job_queue import job_queue
+from app.services.job_worker import JobWorker
+from app.services.llm_cache import response_cache
+from app.services.llm_endpoints import endpoint_pool
+from app.services.output_budget import output_budget
+from app.services.process_stats import process_stats
+from app.services.progress_events import ensure_events_collection
+from app.services.write_buffer import close_write_buffers
+
+logging.basicConfig(level=settings.logging_level,
+                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logging.getLogger("pymongo").setLevel(logging.WARNING)
+logger = logging.getLogger(__name__)
+
+
+async def main():
+    """Runs one job worker process until SIGINT/SIGTERM.
+
+    Start as many as needed (per core, per host): `python worker.py`. Jobs held by
+    a process that dies are picked up by the others once their lease expires. Set
+    LLM_QUOTA_PROCESSES to the number of workers so together they stay within the quotas.
+    """
+    await connect_to_mongo()
+    db = await get_database()
+    await job_queue.ensure_indexes(db)
+    await ensure_result_indexes(db)
+    await response_cache.ensure_indexes(db)
+    await ensure_events_collection(db)
+    await output_budget.load_from_results(db)
+
+    worker = JobWorker(db, JOB_HANDLERS)
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, worker.stop)
+    sweeper = asyncio.ensure_future(run_evaluation_sweeper(db))
+    stats_publisher = asyncio.ensure_future(process_stats.run_publisher(db, "worker"))
+    try:
+        await worker.run()
+    finally:
+        sweeper.cancel()
+        stats_publisher.cancel()
+        await asyncio.gather(sweeper, stats_publisher, return_exceptions=True)
+        await close_write_buffers()
+        await endpoint_pool.close()
+        await close_mongo_connection()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())